@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Bridge Load / Latency Benchmark
+
+Runs the WebXR bridge in-process (stub publishers when rclpy is absent)
+and drives it with synthetic_quest.py clients in subprocesses, one
+scenario per (encoding, rate) pair. Reports throughput, end-to-end
+capture->publish latency, bridge CPU usage and dropped frames. With
+--haptics it also feeds pulse commands into every session, as a sim in
+contact would, and reports the return channel (messages sent after
+coalescing, command->pulse latency, pulses past the budget).
+
+Usage:
+    python bench_bridge.py                                # 72/90/120 Hz + saturation
+    python bench_bridge.py --rates 90 --encodings binary --duration 10
+    python bench_bridge.py --json results.json --max-p99-ms 5   # CI gate
+    python bench_bridge.py --webtransport --loss 0.05     # QUIC datagrams, 5% loss
+    python bench_bridge.py --clients 4 --rates 90         # four headsets, one bridge
+    python bench_bridge.py --encodings binary delta --idle left  # delta mode, one hand resting
+    python bench_bridge.py --rates 90 --haptics 1000      # 1 kHz contact events per session
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import sys
+import threading
+import time
+
+import xr_webtransport
+from webxr_ros_bridge import (ROS_AVAILABLE, JoyFeedback, JoyFeedbackArray, WebSocketServer, WebXRROSBridge,
+                              rclpy, start_ros_threads)
+
+
+CLIENT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'synthetic_quest.py')
+
+
+def _free_port(kind=socket.SOCK_STREAM):
+    with socket.socket(socket.AF_INET, kind) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def haptic_feeder(server, rate, stop):
+    """Publish-side stand-in: pulse commands into every session at `rate` Hz
+
+    Runs on its own thread, like the ROS executor delivering subscriptions.
+    """
+    msg = JoyFeedbackArray()
+    msg.array = [JoyFeedback(type=JoyFeedback.TYPE_RUMBLE, id=1, intensity=0.5)]
+    next_time = time.perf_counter()
+    while not stop.is_set():
+        for session in list(server.sessions.values()):
+            server.on_haptics(session, msg)
+        next_time += 1.0 / rate
+        stop.wait(max(next_time - time.perf_counter(), 0.0))
+
+
+async def run_scenario(server, url, encoding, rate, duration, warmup, webtransport=False, loss=0.0,
+                       clients=1, idle='none', haptics=0.0):
+    """Run concurrent clients against the bridge and return the scenario metrics
+
+    Each client is its own bridge session (own namespace); rates are per client.
+    """
+    telemetry = server.telemetry
+    telemetry.reset()
+    before = server.frame_stats()
+
+    procs = []
+    for i in range(clients):
+        client_args = ['--url', url, '--rate', str(rate), '--encoding', encoding,
+                       '--duration', str(duration), '--warmup', str(warmup), '--seed', str(i),
+                       '--idle', idle, '--json']
+        if webtransport:
+            client_args += ['--webtransport', '--loss', str(loss)]
+        procs.append(await asyncio.create_subprocess_exec(
+            sys.executable, CLIENT_SCRIPT, *client_args,
+            stdout=asyncio.subprocess.PIPE,
+        ))
+
+    # Measure the bridge only while frames are flowing
+    await asyncio.sleep(warmup)
+    telemetry.reset()
+    haptic_before = server.haptic_stats()
+    stop_feeder = threading.Event()
+    if haptics:
+        threading.Thread(target=haptic_feeder, args=(server, haptics, stop_feeder), daemon=True).start()
+    cpu0, wall0 = _cpu_seconds(), time.perf_counter()
+    outputs = await asyncio.gather(*(proc.communicate() for proc in procs))
+    cpu, wall = _cpu_seconds() - cpu0, time.perf_counter() - wall0
+    stop_feeder.set()
+    await asyncio.sleep(0.2)  # let the publishers drain
+
+    results = [json.loads(stdout.decode().strip().splitlines()[-1]) for stdout, _ in outputs]
+    after = server.frame_stats()
+    delta = {k: after[k] - before[k] for k in after}
+    haptic = {k: v - haptic_before[k] for k, v in server.haptic_stats().items()}
+    latency = telemetry.stages['capture->publish'].summary()
+    haptic_latency = telemetry.stages['haptic command->pulse'].summary()
+    sent = sum(r['sent'] for r in results)
+    elapsed = max(r['elapsed_s'] for r in results)
+
+    # Counters are per hand update; the client always sends both hands.
+    # In delta mode hands with nothing new are skipped on purpose (unchanged).
+    return {
+        'transport': results[0]['transport'],
+        'encoding': encoding,
+        'rate': rate,
+        'clients': clients,
+        'namespaces': [r['namespace'] for r in results],
+        'sent': sent,
+        'client_rate': round(sum(r['achieved_rate'] for r in results) / clients, 1),
+        'kbytes_per_s': round(sum(r['bytes_sent'] for r in results) / elapsed / clients / 1e3, 2),
+        'published_rate': round(delta['delivered'] / 2 / elapsed / clients, 1),
+        'p50_ms': latency.get('p50_ms'),
+        'p99_ms': latency.get('p99_ms'),
+        'cpu_pct': round(100.0 * cpu / wall, 1),
+        'coalesced': delta['coalesced'] // 2,
+        'dropped': delta['dropped'] // 2 + max(sent - (delta['received'] + delta['unchanged']) // 2, 0),
+        'unchanged': delta['unchanged'] // 2,
+        'keyframes': delta['keyframes'],
+        'gaps': delta['gaps'],
+        'haptic_rate': haptics,
+        'haptic_commands': haptic['haptic_commands'],
+        'haptic_sent_per_s': round(haptic['haptic_sent'] / elapsed / clients, 1),
+        'haptic_p50_ms': haptic_latency.get('p50_ms'),
+        'haptic_p99_ms': haptic_latency.get('p99_ms'),
+        'haptic_late': haptic['haptic_late'] + haptic['haptic_stale'],
+    }
+
+
+async def run_benchmark(args):
+    port = _free_port()
+    rclpy.init()
+    node = WebXRROSBridge()
+    server = WebSocketServer(node, '127.0.0.1', port)
+    stop_ros_threads = start_ros_threads(node, server)
+    serve_tasks = [asyncio.create_task(server.start())]
+    if args.webtransport:
+        wt_server = xr_webtransport.WebTransportServer(server, '127.0.0.1', _free_port(socket.SOCK_DGRAM))
+        serve_tasks.append(asyncio.create_task(wt_server.start()))
+    await asyncio.sleep(0.5)
+
+    results = []
+    try:
+        for encoding in args.encodings:
+            for rate in args.rates:
+                result = await run_scenario(server, f'ws://127.0.0.1:{port}', encoding, rate,
+                                            args.duration, args.warmup, args.webtransport, args.loss,
+                                            args.clients, args.idle, args.haptics)
+                results.append(result)
+                print(_format_row(result), flush=True)
+    finally:
+        for task in serve_tasks:
+            task.cancel()
+        stop_ros_threads()
+        node.destroy_node()
+        rclpy.shutdown()
+    return results
+
+
+_HEADER = (f"{'encoding':<8} {'rate':>6} {'sent':>7} {'client/s':>9} {'kB/s':>7} {'publ/s':>8} "
+           f"{'p50 ms':>7} {'p99 ms':>7} {'cpu %':>6} {'coalesced':>9} {'dropped':>8}")
+
+
+def _format_row(r):
+    rate = 'max' if not r['rate'] else f"{r['rate']:g}"
+    fmt = lambda v: '-' if v is None else f"{v:.2f}"
+    return (f"{r['encoding']:<8} {rate:>6} {r['sent']:>7} {r['client_rate']:>9.1f} {r['kbytes_per_s']:>7.1f} "
+            f"{r['published_rate']:>8.1f} {fmt(r['p50_ms']):>7} {fmt(r['p99_ms']):>7} "
+            f"{r['cpu_pct']:>6.1f} {r['coalesced']:>9} {r['dropped']:>8}") + (
+            f" {r['haptic_sent_per_s']:>8.1f} {fmt(r['haptic_p50_ms']):>9} {fmt(r['haptic_p99_ms']):>9} "
+            f"{r['haptic_late']:>6}" if r['haptic_rate'] else '')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='WebXR bridge load/latency benchmark')
+    parser.add_argument('--rates', type=float, nargs='+', default=[72, 90, 120, 0],
+                        help='Client frame rates in Hz (0 = saturate)')
+    parser.add_argument('--encodings', nargs='+', choices=['binary', 'delta', 'json'],
+                        default=['binary', 'json'])
+    parser.add_argument('--duration', type=float, default=5.0, help='Seconds per scenario')
+    parser.add_argument('--warmup', type=float, default=1.5, help='Clock-sync warmup per scenario')
+    parser.add_argument('--webtransport', action='store_true',
+                        help='Send frames as WebTransport datagrams instead of over the WebSocket')
+    parser.add_argument('--loss', type=float, default=0.0,
+                        help='UDP packet loss injected by the client (WebTransport only)')
+    parser.add_argument('--clients', type=int, default=1,
+                        help='Concurrent clients per scenario, each its own bridge session')
+    parser.add_argument('--idle', choices=['none', 'left', 'right', 'both'], default='none',
+                        help='Hands the clients hold still (delta mode sends nothing for them)')
+    parser.add_argument('--haptics', type=float, default=0.0, metavar='HZ',
+                        help='Haptic pulse commands per second fed into each session (0 = off)')
+    parser.add_argument('--json', metavar='PATH', help='Write results as JSON')
+    parser.add_argument('--max-p99-ms', type=float,
+                        help='Exit non-zero if any fixed-rate scenario exceeds this p99')
+    args = parser.parse_args()
+
+    print(f"ROS: {'rclpy' if ROS_AVAILABLE else 'stub publishers'}")
+    if args.webtransport:
+        print(f"Transport: WebTransport datagrams, {args.loss:.0%} injected packet loss")
+    if args.clients > 1:
+        print(f"{args.clients} concurrent clients per scenario (client/s, kB/s and publ/s are per client)")
+    if args.idle != 'none':
+        print(f"Idle hands: {args.idle}")
+    if args.haptics:
+        print(f"Haptic commands: {args.haptics:g} Hz per session (haptic/s is messages sent after coalescing)")
+    print(_HEADER + (f" {'haptic/s':>8} {'hapt p50':>9} {'hapt p99':>9} {'late':>6}" if args.haptics else ''))
+    results = asyncio.run(run_benchmark(args))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'ros': ROS_AVAILABLE, 'loss': args.loss, 'results': results}, f, indent=2)
+
+    if args.max_p99_ms is not None:
+        failed = [r for r in results
+                  if r['rate'] and (r['p99_ms'] is None or r['p99_ms'] > args.max_p99_ms)]
+        if failed:
+            print(f"FAIL: {len(failed)} scenario(s) above p99 {args.max_p99_ms} ms")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
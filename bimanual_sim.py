@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+"""
+Bimanual MuJoCo Teleop
+
+Two copies of the mujoco_sim.py arm side by side (the left arm on +Y),
+each with a two-finger gripper, driven by both controllers. Callbacks only
+store the latest pose and grip of their hand in a preallocated (2, 7)
+array; once per control tick the hands with a new pose go through the
+pipeline as one batch: filter (pose_filter.py is vectorized over hands,
+with one timestamp per hand), map (XRToRobot.map_poses), clamp to each
+arm's workspace, then both mocap targets and all four finger commands are
+written with one indexed store each.
+
+The batch keeps the two hands in one code path; it is not cheaper than two
+single-hand passes. With two rows numpy's per-call overhead dominates, so a
+batch costs about as much as the single-arm pipeline run once per hand, or
+somewhat more (the benchmark below prints both).
+
+Both hands share one mapping (the operator's midline onto the robot's),
+so the distance between the hands carries over to the targets. Trigger or
+squeeze, whichever is pressed further, closes that hand's gripper.
+
+Usage:
+    python mujoco_sim.py --bimanual [--shm | --combined] [--ik dls] [--filter one_euro]
+    python bimanual_sim.py --synthetic 20      # callback / per-tick cost and tracking, synthetic hands
+"""
+
+import argparse
+import functools
+import threading
+import time
+
+import mujoco
+import numpy as np
+
+from mujoco_ik import NEUTRAL_XR, DampedLeastSquaresIK, weld_site_target
+from mujoco_sim import (HAPTIC_FULL_SCALE, HAPTIC_MIN_INTENSITY, Joy, JoyFeedback, JoyFeedbackArray,
+                        PoseStamped, RealtimeSimNode, SharedStateReader, load_model)
+from haptics import HAPTIC_TOPIC
+from pose_filter import make_filter
+from pose_predictor import stamp_to_sec
+from ros_qos import make_qos
+from tracing import TRACER, traced
+from xr_mapping import XRToRobot, to_wxyz
+from xr_protocol import COMBINED_TOPIC, HANDS, ProtocolError, combined_hand
+
+
+ARM_SPACING = 0.5     # m between the two arm bases
+ARM_REACH = 0.9       # m from the shoulder (joint2) to the end effector, stretched out
+SHOULDER_HEIGHT = 0.4
+MIDLINE_OVERLAP = 0.1  # m an arm may reach past the midline (hand-overs) before clamping
+GRIPPER_OPEN = 0.04   # m of travel per finger
+
+# One arm of mujoco_sim.py with a prefix, a base offset and two slide fingers
+ARM = """
+    <body name="{p}base" pos="0 {y} 0">
+        <geom type="cylinder" size="0.1 0.05" rgba="0.2 0.2 0.2 1"/>
+        <body name="{p}link1" pos="0 0 0.1">
+            <joint name="{p}joint1" type="hinge" axis="0 0 1" range="-2.9 2.9"/>
+            <geom type="capsule" fromto="0 0 0 0 0 0.3" size="0.05"/>
+            <body name="{p}link2" pos="0 0 0.3">
+                <joint name="{p}joint2" type="hinge" axis="0 1 0" range="-1.8 1.8"/>
+                <geom type="capsule" fromto="0 0 0 0 0 0.3" size="0.05"/>
+                <body name="{p}link3" pos="0 0 0.3">
+                    <joint name="{p}joint3" type="hinge" axis="0 1 0" range="-2.9 2.9"/>
+                    <geom type="capsule" fromto="0 0 0 0.3 0 0" size="0.04"/>
+                    <body name="{p}link4" pos="0.3 0 0">
+                        <joint name="{p}joint4" type="hinge" axis="1 0 0" range="-2.9 2.9"/>
+                        <geom type="capsule" fromto="0 0 0 0.2 0 0" size="0.03"/>
+                        <body name="{p}link5" pos="0.2 0 0">
+                            <joint name="{p}joint5" type="hinge" axis="0 1 0" range="-2.9 2.9"/>
+                            <geom type="capsule" fromto="0 0 0 0.1 0 0" size="0.03"/>
+                            <body name="{p}end_effector" pos="0.1 0 0">
+                                <joint name="{p}joint6" type="hinge" axis="1 0 0" range="-3.0 3.0"/>
+                                <geom type="box" size="0.03 0.05 0.02" rgba="{rgba}"/>
+                                <site name="{p}ee_site" pos="0 0 0"/>
+                                <!-- Fingers open along +-Y; 0 = closed (3 mm apart) -->
+                                <body name="{p}finger_a" pos="0.055 0.008 0">
+                                    <joint name="{p}finger_a" type="slide" axis="0 1 0" range="0 {open}"/>
+                                    <geom type="box" size="0.02 0.005 0.015" rgba="0.3 0.3 0.3 1"/>
+                                </body>
+                                <body name="{p}finger_b" pos="0.055 -0.008 0">
+                                    <joint name="{p}finger_b" type="slide" axis="0 -1 0" range="0 {open}"/>
+                                    <geom type="box" size="0.02 0.005 0.015" rgba="0.3 0.3 0.3 1"/>
+                                </body>
+                            </body>
+                        </body>
+                    </body>
+                </body>
+            </body>
+        </body>
+    </body>
+    <body name="{p}target" pos="0.4 {y} 0.4" mocap="true">
+        <geom type="box" size="0.02 0.05 0.01" rgba="{rgba_target}" contype="0" conaffinity="0"/>
+        <site name="{p}target_site" pos="0 0 0"/>
+    </body>
+"""
+
+
+def bimanual_xml(spacing=ARM_SPACING):
+    """MJCF with a left (+Y) and a right arm, each welded to its own mocap target"""
+    arms, welds, actuators = [], [], []
+    for hand, y, rgba in zip(HANDS, (spacing / 2, -spacing / 2), ('0 0 1 1', '1 0 0 1')):
+        p = f"{hand}_"
+        arms.append(ARM.format(p=p, y=y, rgba=rgba, rgba_target=rgba[:-1] + '0.5', open=GRIPPER_OPEN))
+        welds.append(f'<weld name="{p}weld" body1="{p}end_effector" body2="{p}target" '
+                     f'relpose="0 0 0 1 0 0 0" solref="0.02 1" solimp=".9 .95 0.001"/>')
+        for finger in ('a', 'b'):
+            actuators.append(f'<position name="{p}finger_{finger}" joint="{p}finger_{finger}" kp="200" '
+                             f'ctrlrange="0 {GRIPPER_OPEN}"/>')
+    return f"""
+<mujoco model="bimanual">
+  <compiler angle="radian"/>
+  <option gravity="0 0 -9.81" integrator="implicitfast"/>
+  <default>
+    <joint damping="1" stiffness="0"/>
+    <geom rgba="0.8 0.8 0.8 1"/>
+  </default>
+  <worldbody>
+    <light diffuse=".5 .5 .5" pos="0 0 3" dir="0 0 -1"/>
+    <geom type="plane" size="2 2 0.1" rgba=".9 .9 .9 1"/>
+    {''.join(arms)}
+  </worldbody>
+  <equality>
+    {''.join(welds)}
+  </equality>
+  <actuator>
+    {''.join(actuators)}
+  </actuator>
+</mujoco>
+"""
+
+
+def arm_workspaces(spacing=ARM_SPACING):
+    """(2 arms, min/max, 3) target boxes: reach of each arm, its own side of the midline"""
+    top = SHOULDER_HEIGHT + ARM_REACH
+    side = spacing / 2 + ARM_REACH
+    return np.array([
+        [[0.0, -MIDLINE_OVERLAP, 0.02], [ARM_REACH, side, top]],   # left
+        [[0.0, -side, 0.02], [ARM_REACH, MIDLINE_OVERLAP, top]],   # right
+    ])
+
+
+class BimanualArmSim:
+    """Two arms and the batched two-hand pipeline, without ROS or a viewer
+
+    receive_pose() / receive_grip() / receive_hands() only store the
+    latest values (any thread); control_tick() runs the batch and advances
+    the model by one tick.
+    """
+
+    def __init__(self, pose_filter=None, ik='weld', ik_params=None, substeps=5, pos_offset=(0.3, 0.0, 0.7),
+                 pos_scale=1.0, spacing=ARM_SPACING, workspace=None):
+        self.pose_filter = pose_filter
+        self.model = load_model(bimanual_xml(spacing))
+        self.data = mujoco.MjData(self.model)
+        self.substeps = substeps
+        self.tick_dt = substeps * self.model.opt.timestep
+        self.mapping = XRToRobot(scale=pos_scale, offset=pos_offset)
+        self.workspace = arm_workspaces(spacing) if workspace is None else np.asarray(workspace, dtype=float)
+
+        # Latest raw XR pose / grip per hand, written by the callbacks
+        self._lock = threading.Lock()
+        self._poses = np.zeros((len(HANDS), 7))
+        self._poses[:, 6] = 1.0
+        self._stamps = np.zeros(len(HANDS))
+        self._grip = np.zeros(len(HANDS))
+        self._new = np.zeros(len(HANDS), dtype=bool)
+        self.seen = np.zeros(len(HANDS), dtype=bool)  # hands that have sent a pose; others hold their target
+        self._batched_stamps = np.full(len(HANDS), -np.inf)  # stamp of each hand's last batched pose
+        self.grip = np.zeros(len(HANDS))
+
+        model = self.model
+        self.target_ids = np.array([model.body(f"{h}_target").mocapid[0] for h in HANDS])
+        self.target_pos = self.data.mocap_pos[self.target_ids].copy()
+        self.target_quat = self.data.mocap_quat[self.target_ids].copy()
+        self.finger_act = np.array([[model.actuator(f"{h}_finger_{f}").id for f in 'ab'] for h in HANDS])
+        self.finger_qpos = np.array([[model.jnt_qposadr[model.joint(f"{h}_finger_{f}").id] for f in 'ab']
+                                     for h in HANDS])
+        self.welds = [model.equality(f"{h}_weld").id for h in HANDS]
+
+        # Arm of every body (-1: world / targets), for per-arm contact forces
+        self.arm_of_body = np.full(model.nbody, -1)
+        for i, hand in enumerate(HANDS):
+            self.arm_of_body[model.body_rootid == model.body(f"{hand}_base").id] = i
+
+        # IK: soft welds (physics) or one explicit DLS solver per arm
+        self.ik = None
+        self.ik_stats = []
+        if ik == 'dls':
+            self.ik = [DampedLeastSquaresIK(model, site=f"{h}_ee_site",
+                                            joints=[f"{h}_joint{j}" for j in range(1, 7)], **(ik_params or {}))
+                       for h in HANDS]
+            self.data.eq_active[self.welds] = 0
+
+        self.batches = 0
+        self.target_updates = np.zeros(len(HANDS), dtype=int)
+        self.clamped_updates = np.zeros(len(HANDS), dtype=int)
+
+    def receive_pose(self, index, stamp, pose):
+        """New pose (px, py, pz, qx, qy, qz, qw) of one hand, captured at stamp"""
+        with self._lock:
+            self._poses[index] = pose
+            self._stamps[index] = stamp
+            self._new[index] = True
+
+    def receive_grip(self, index, grip):
+        self._grip[index] = grip
+
+    def receive_hands(self, stamps, poses, valid, grips):
+        """Both hands at once (combined message, shared memory); valid masks the poses"""
+        with self._lock:
+            self._poses[valid] = poses[valid]
+            self._stamps[valid] = stamps[valid]
+            self._new |= valid
+            self._grip[:] = grips
+
+    def update_targets(self):
+        """One batch for both hands: filter, map, clamp -> target_pos / target_quat
+
+        Only hands with a pose newer than their last batched one move; the
+        per-topic callbacks often deliver the two hands on different ticks.
+        """
+        with self._lock:
+            new = self._new.copy()
+            self.grip = self._grip.copy()
+            if not new.any():
+                return
+            poses = self._poses.copy()
+            stamps = self._stamps.copy()
+            self._new[:] = False
+        fresh = new & (stamps > self._batched_stamps)
+        if not fresh.any():
+            return
+        self.batches += 1
+        self._batched_stamps[fresh] = stamps[fresh]
+        if (fresh & ~self.seen).any():
+            # A hand joined: restart the filter rather than pull it in from the placeholder pose
+            self.seen |= fresh
+            if self.pose_filter is not None:
+                self.pose_filter.reset()
+
+        if self.pose_filter is not None:
+            # One time per hand: a hand without a new sample keeps its estimate
+            poses[:, :3], poses[:, 3:] = self.pose_filter.filter(stamps, poses[:, :3], poses[:, 3:])
+        mapped = self.mapping.map_poses(poses)
+        pos = np.minimum(np.maximum(mapped[:, :3], self.workspace[:, 0]), self.workspace[:, 1])
+        self.clamped_updates += fresh & (pos != mapped[:, :3]).any(axis=1)
+        self.target_updates += fresh
+
+        quat = to_wxyz(mapped[:, 3:])
+        if fresh.all():
+            self.target_pos, self.target_quat = pos, quat
+        else:
+            moved = fresh[:, None]
+            self.target_pos = np.where(moved, pos, self.target_pos)
+            self.target_quat = np.where(moved, quat, self.target_quat)
+
+    def control_tick(self):
+        """One control tick: batch the hands, write both targets and grippers, advance by tick_dt"""
+        self.update_targets()
+        self.data.mocap_pos[self.target_ids] = self.target_pos
+        self.data.mocap_quat[self.target_ids] = self.target_quat
+        width = GRIPPER_OPEN * (1.0 - np.clip(self.grip, 0.0, 1.0))
+        self.data.ctrl[self.finger_act] = width[:, None]
+
+        if self.ik is not None:
+            self.step_ik(width)
+        else:
+            with TRACER.span('sim.mj_step'):
+                mujoco.mj_step(self.model, self.data, nstep=self.substeps)
+
+    @traced('sim.ik')
+    def step_ik(self, width):
+        """Solve both arms onto their targets and set the joints (fingers included) directly"""
+        for i, ik in enumerate(self.ik):
+            site_pos, site_quat = weld_site_target(self.model, self.target_pos[i], self.target_quat[i],
+                                                   weld=self.welds[i], site=f"{HANDS[i]}_ee_site")
+            self.data.qpos[ik.qpos_adr] = ik.solve(site_pos, site_quat)
+            s = ik.stats
+            self.ik_stats.append((s['time'], s['iters'], s['pos_err'], s['rot_err']))
+        self.data.qpos[self.finger_qpos] = width[:, None]
+        self.data.qvel[:] = 0.0
+        mujoco.mj_forward(self.model, self.data)
+        self.data.time += self.tick_dt
+
+    def contact_forces(self):
+        """Total normal force (N) of each arm's contacts (floor, itself, the other arm)"""
+        forces = np.zeros(len(HANDS))
+        force = np.zeros(6)
+        for i in range(self.data.ncon):
+            contact = self.data.contact[i]
+            arms = {self.arm_of_body[self.model.geom_bodyid[g]] for g in (contact.geom1, contact.geom2)}
+            arms.discard(-1)
+            if arms:
+                mujoco.mj_contactForce(self.model, self.data, i, force)
+                for arm in arms:
+                    forces[arm] += abs(force[0])
+        return forces
+
+    def tracking_error(self):
+        """(2,) distance (m) of each end effector from its target"""
+        site_ids = [self.model.site(f"{h}_ee_site").id for h in HANDS]
+        return np.linalg.norm(self.data.site_xpos[site_ids] - self.target_pos, axis=1)
+
+    def format(self):
+        hands = ', '.join(f"{h} {u} updates ({c} clamped) grip {g:.2f}" for h, u, c, g
+                          in zip(HANDS, self.target_updates, self.clamped_updates, self.grip))
+        return f"bimanual: {self.batches} batches, {hands}"
+
+
+class BimanualMujocoSim(RealtimeSimNode, BimanualArmSim):
+    """ROS node running BimanualArmSim in real time with a viewer"""
+
+    def __init__(self, shm_name=None, combined=False, qos=None, haptic_full_scale=HAPTIC_FULL_SCALE,
+                 **sim_params):
+        RealtimeSimNode.__init__(self, 'mujoco_bimanual_sim')
+        BimanualArmSim.__init__(self, **sim_params)
+
+        # Both hands: shared memory, the combined frame, or the per-hand topics
+        self.shm_reader = None
+        qos = qos if qos is not None else make_qos()
+        self.subscriptions_ = []
+        if shm_name:
+            self.shm_reader = SharedStateReader(shm_name)
+            self.get_logger().info(f"Reading both hands from shared memory: {shm_name}")
+        elif combined:
+            self.subscriptions_.append(self.create_subscription(
+                Joy, f'/quest/{COMBINED_TOPIC}', self.frame_callback, qos))
+        else:
+            for i, hand in enumerate(HANDS):
+                self.subscriptions_.append(self.create_subscription(
+                    PoseStamped, f'/quest/{hand}_hand/pose', functools.partial(self.pose_callback, i), qos))
+                self.subscriptions_.append(self.create_subscription(
+                    Joy, f'/quest/{hand}_hand/inputs', functools.partial(self.input_callback, i), qos))
+
+        # Each arm's contacts pulse its own controller (0 disables)
+        self.haptic_full_scale = haptic_full_scale
+        self.haptic_pub = None
+        self.haptic_pulses = 0
+        if haptic_full_scale > 0:
+            self.haptic_pub = self.create_publisher(JoyFeedbackArray, f'/quest/{HAPTIC_TOPIC}', qos)
+
+    @traced('sim.pose_callback')
+    def pose_callback(self, index, msg):
+        p = msg.pose.position
+        o = msg.pose.orientation
+        self.receive_pose(index, stamp_to_sec(msg.header.stamp), (p.x, p.y, p.z, o.x, o.y, o.z, o.w))
+
+    @traced('sim.input_callback')
+    def input_callback(self, index, msg):
+        self.receive_grip(index, max(msg.axes[:2], default=0.0))
+
+    @traced('sim.frame_callback')
+    def frame_callback(self, msg):
+        poses = np.zeros((len(HANDS), 7))
+        valid = np.zeros(len(HANDS), dtype=bool)
+        grips = np.zeros(len(HANDS))
+        try:
+            for i in range(len(HANDS)):
+                present, pose, axes, _ = combined_hand(msg.axes, msg.buttons, i)
+                if pose is not None:
+                    poses[i], valid[i] = pose, True
+                grips[i] = max(axes[:2]) if present else 0.0
+        except ProtocolError as e:
+            self.get_logger().warn(str(e))
+            return
+        stamp = stamp_to_sec(msg.header.stamp)
+        self.receive_hands(np.full(len(HANDS), stamp), poses, valid, grips)
+
+    @traced('sim.poll_shared_state')
+    def poll_shared_state(self):
+        """The hands the bridge wrote since the last tick, from shared memory"""
+        if self.shm_reader.read():
+            state = self.shm_reader.state
+            self.receive_hands(state['stamp'], state['pose'], self.shm_reader.updated(),
+                               state['axes'][:, :2].max(axis=1))
+
+    @traced('sim.tick')
+    def control_tick(self):
+        if self.shm_reader is not None:
+            self.poll_shared_state()
+        BimanualArmSim.control_tick(self)
+        if self.haptic_pub is not None:
+            self.publish_contact()
+
+    def publish_contact(self):
+        """One command per tick with a pulse for each arm in contact"""
+        forces = self.contact_forces()
+        touching = np.flatnonzero(forces > 0.0)
+        if not len(touching):
+            return
+        intensity = np.clip(forces / self.haptic_full_scale, HAPTIC_MIN_INTENSITY, 1.0)
+        msg = JoyFeedbackArray()
+        msg.array = [JoyFeedback(type=JoyFeedback.TYPE_RUMBLE, id=int(i), intensity=float(intensity[i]))
+                     for i in touching]
+        self.haptic_pub.publish(msg)
+        self.haptic_pulses += 1
+
+    def pipeline_reports(self):
+        return [self.format()]
+
+
+# ============================================================================
+# OFFLINE EVALUATION
+# ============================================================================
+def per_hand_pipeline(filters, mapping, workspace, index, stamp, pose):
+    """The single-arm path (mujoco_sim.ArmSim) run once per hand message, for comparison"""
+    pos, quat = pose[:3], pose[3:]
+    if filters is not None:
+        pos, quat = filters[index].filter(stamp, pos, quat)
+    pos, quat = mapping.map_pose(pos, quat)
+    return np.clip(pos, workspace[index, 0], workspace[index, 1]), to_wxyz(quat)
+
+
+def evaluate(t, poses, grips, ik='weld', filter_kind='one_euro'):
+    """Callback and per-tick pipeline cost (batched vs per-hand) and per-arm tracking over a track"""
+    sim = BimanualArmSim(pose_filter=make_filter(filter_kind), ik=ik)
+    filters = None if filter_kind in (None, 'none') else [make_filter(filter_kind) for _ in HANDS]
+    store_time, batch_time, single_time, errors = [], [], [], []
+    for k in range(len(t)):
+        start = time.perf_counter()
+        for i in range(len(HANDS)):
+            sim.receive_pose(i, t[k], poses[k, i])
+            sim.receive_grip(i, grips[k, i])
+        mid = time.perf_counter()
+        sim.update_targets()
+        end = time.perf_counter()
+        store_time.append((mid - start) / len(HANDS))
+        batch_time.append(end - mid)
+
+        start = time.perf_counter()
+        for i in range(len(HANDS)):
+            per_hand_pipeline(filters, sim.mapping, sim.workspace, i, t[k], poses[k, i])
+        single_time.append((time.perf_counter() - start) / len(HANDS))
+
+        sim.control_tick()
+        errors.append(sim.tracking_error())
+    errors = np.array(errors[len(errors) // 10:])  # skip the initial pull-in
+    return {
+        'store_us': float(np.median(store_time) * 1e6),
+        'single_us': float(np.median(single_time) * 1e6),
+        'batch_us': float(np.median(batch_time) * 1e6),
+        'track_mm': errors.mean(axis=0) * 1e3,
+        'clamped': sim.clamped_updates.tolist(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Bimanual pipeline cost and tracking on a synthetic track')
+    parser.add_argument('--synthetic', type=float, default=20.0, metavar='SECONDS',
+                        help='Length of the synthetic two-hand track (one pose per 10 ms tick)')
+    parser.add_argument('--filter', choices=['none', 'one_euro'], default='one_euro')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    from synthetic_quest import generate_trajectory
+
+    t, poses, axes, _ = generate_trajectory(args.synthetic, 100.0, seed=args.seed)
+    # Hands relative to the headset, as mujoco_sim's offset expects (body midline at NEUTRAL_XR)
+    poses[..., :3] += NEUTRAL_XR - poses[0, :, :3].mean(axis=0)
+    grips = axes[..., :2].max(axis=-1)
+    for ik in ('weld', 'dls'):
+        r = evaluate(t, poses, grips, ik, args.filter)
+        print(f"{ik:<5} per hand message: {r['store_us']:.1f} us (single-arm path {r['single_us']:.1f} us) | "
+              f"batch per tick {r['batch_us']:.1f} us | "
+              f"tracking left {r['track_mm'][0]:.1f} mm, right {r['track_mm'][1]:.1f} mm | "
+              f"clamped {r['clamped'][0]}/{r['clamped'][1]} of {len(t)}")
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Streaming Hand Calibration
+
+Finds the reference (rest) position of the hand as soon as it is known
+well enough, instead of always averaging a fixed number of samples.
+
+Each sample updates a running mean and variance (Welford). A sample
+further than `max_deviation` from the running mean means the hand moved:
+the estimate restarts, so motion never gets averaged in. The estimate is
+accepted once at least `min_samples` are in and the standard error of the
+mean is below `tolerance`; a hand that is steady but noisy is accepted
+after `max_samples`.
+
+Results are saved per operator (save_calibration) so a restarted consumer
+can reuse them instead of asking for another steady hold. A saved
+reference is only reused if it is recent, was well converged, and the
+first live hand position lies within REUSE_RADIUS of it: the robot then
+starts at most REUSE_RADIUS * pos_scale from its home instead of jumping
+(an operator who changed stance or restarted the XR session at another
+spot simply calibrates afresh).
+
+Usage:
+    python calibration.py session.qlog        # time-to-calibrate vs fixed 30 samples
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+
+import numpy as np
+
+
+# Saved calibrations, next to the other caches (reachability maps, models)
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'quest3-streamer')
+FORMAT = 1
+REUSE_RADIUS = 0.05       # m, first live hand position vs the saved reference
+REUSE_MAX_AGE = 8 * 3600  # s, older calibrations are not reused
+
+
+class StreamingCalibrator:
+    """Running reference-position estimate with motion rejection"""
+
+    def __init__(self, min_samples=5, max_samples=60, tolerance=0.001, max_deviation=0.01):
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self.tolerance = tolerance          # m, standard error of the mean
+        self.max_deviation = max_deviation  # m, motion threshold
+        self.reset()
+
+    def reset(self):
+        """Start over (also clears the result and the statistics)"""
+        self.done = False
+        self.restarts = 0
+        self.total_samples = 0
+        self.t_start = None
+        self.t_done = None
+        self._restart()
+
+    def _restart(self):
+        self.n = 0
+        self.mean = np.zeros(3)
+        self._m2 = np.zeros(3)
+
+    @property
+    def std(self):
+        """Per-axis standard deviation of the current window (m)"""
+        return np.sqrt(self._m2 / (self.n - 1)) if self.n > 1 else np.full(3, np.inf)
+
+    @property
+    def stderr(self):
+        """Standard error of the mean position (m, norm over axes)"""
+        return float(np.linalg.norm(self.std) / np.sqrt(self.n)) if self.n > 1 else float('inf')
+
+    def add(self, pos, t=None):
+        """Add one sample; returns True once the reference has converged"""
+        if self.done:
+            return True
+        if t is None:
+            t = time.monotonic()
+        if self.t_start is None:
+            self.t_start = t
+        self.total_samples += 1
+
+        pos = np.asarray(pos, dtype=float)
+        if self.n and np.linalg.norm(pos - self.mean) > self.max_deviation:
+            # Hand moved: throw the window away and start from this sample
+            self.restarts += 1
+            self._restart()
+
+        self.n += 1
+        delta = pos - self.mean
+        self.mean = self.mean + delta / self.n
+        self._m2 = self._m2 + delta * (pos - self.mean)
+
+        if self.n >= self.min_samples and (self.stderr < self.tolerance or self.n >= self.max_samples):
+            self.done = True
+            self.t_done = t
+        return self.done
+
+    def report(self):
+        """Calibration quality summary"""
+        return {
+            'done': self.done,
+            'samples': self.n,
+            'total_samples': self.total_samples,
+            'restarts': self.restarts,
+            'std_mm': (np.linalg.norm(self.std) * 1e3) if self.n > 1 else None,
+            'stderr_mm': (self.stderr * 1e3) if self.n > 1 else None,
+            'elapsed_s': (self.t_done - self.t_start) if self.done else None,
+        }
+
+    def format(self):
+        r = self.report()
+        fmt = lambda v, spec: '-' if v is None else format(v, spec)
+        status = '' if r['done'] else 'not converged: '
+        return (f"{status}{r['samples']} samples ({r['total_samples']} seen, {r['restarts']} motion restarts) "
+                f"in {fmt(r['elapsed_s'], '.2f')} s, std {fmt(r['std_mm'], '.2f')} mm, "
+                f"reference stderr {fmt(r['stderr_mm'], '.2f')} mm")
+
+
+# ============================================================================
+# PERSISTED CALIBRATION
+# ============================================================================
+def calibration_path(operator='default', cache_dir=None):
+    name = re.sub(r'[^A-Za-z0-9_.-]', '_', operator)
+    return os.path.join(cache_dir or CACHE_DIR, f"calibration-{name}.json")
+
+
+def save_calibration(path, reference, calibrator, **meta):
+    """Write the reference and the quality report of a converged calibrator"""
+    record = {
+        'format': FORMAT,
+        'saved_at': time.time(),
+        'reference': [float(v) for v in reference],
+        'quality': calibrator.report(),
+        **meta,
+    }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(record, f, indent=1)
+    os.replace(tmp, path)
+    return record
+
+
+def load_calibration(path, tolerance=None, max_age=REUSE_MAX_AGE, now=None):
+    """Saved calibration fit for reuse -> (record, None) or (None, reason)
+
+    Checks everything that can be checked before the hand is seen; the
+    position check is reuse_distance() on the first live sample.
+    """
+    if not os.path.exists(path):
+        return None, "none saved"
+    try:
+        with open(path) as f:
+            record = json.load(f)
+        reference = np.asarray(record['reference'], dtype=float)
+        quality = record['quality']
+        age = (time.time() if now is None else now) - float(record['saved_at'])
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        return None, f"unreadable ({e})"
+    if record.get('format') != FORMAT or reference.shape != (3,) or not np.all(np.isfinite(reference)):
+        return None, "unknown format"
+    if not quality.get('done'):
+        return None, "not converged"
+    if age > max_age:
+        return None, f"{age / 3600:.1f} h old"
+    stderr_mm = quality.get('stderr_mm')
+    if tolerance is not None and (stderr_mm is None or stderr_mm > tolerance * 1e3):
+        return None, f"reference stderr {stderr_mm or float('inf'):.2f} mm above the tolerance"
+    record['reference'] = reference
+    record['age_s'] = age
+    return record, None
+
+
+def reuse_distance(record, pos):
+    """Distance (m) of a live hand position from a saved reference"""
+    return float(np.linalg.norm(np.asarray(pos, dtype=float) - record['reference']))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare streaming calibration with a fixed sample count')
+    parser.add_argument('path', help='Session log recorded with webxr_ros_bridge.py --record')
+    parser.add_argument('--hand', choices=['left', 'right'], default='right')
+    parser.add_argument('--fixed-samples', type=int, default=30, help='Old fixed sample count')
+    parser.add_argument('--start', type=float, default=0.0, help='Start offset into the session (s)')
+    args = parser.parse_args()
+
+    from pose_predictor import load_track
+
+    t, pos, _ = load_track(args.path, args.hand)
+    keep = t >= t[0] + args.start
+    t, pos = t[keep], pos[keep]
+
+    calibrator = StreamingCalibrator()
+    for ti, p in zip(t, pos):
+        if calibrator.add(p, ti):
+            break
+    print(f"streaming: {calibrator.format()}")
+
+    n = min(args.fixed_samples, len(t))
+    fixed = pos[:n]
+    spread = np.linalg.norm(fixed.std(axis=0)) * 1e3
+    print(f"fixed:     {n} samples in {t[n - 1] - t[0]:.2f} s, std {spread:.2f} mm "
+          f"(max deviation {np.linalg.norm(fixed - fixed.mean(axis=0), axis=1).max() * 1e3:.1f} mm)")
@@ -0,0 +1,126 @@
+"""
+Latest-wins frame mailbox
+
+Sits between WebSocket receive and ROS publish in webxr_ros_bridge.py.
+Each hand has a single slot per frame kind (controller state, hand
+joints): a newer frame replaces any pending one
+(coalesced), and frames whose sequence number is not newer than the last
+accepted one are dropped. The publisher always sees the freshest pose, so
+a stall never turns into a backlog of stale poses replayed late.
+
+The mailbox is thread-safe, so it doubles as the hand-off queue between
+the asyncio receive loop and the ROS publisher thread.
+"""
+
+import threading
+import time
+
+import xr_protocol
+
+
+SEQ_MOD = 1 << 32
+
+# A backwards jump larger than this is treated as a stream restart
+# (page reload, reconnect) rather than a late packet.
+REORDER_WINDOW = 256
+
+
+def seq_delta(new, old):
+    """Signed distance from old to new in uint32 serial-number arithmetic"""
+    d = (new - old) % SEQ_MOD
+    return d - SEQ_MOD if d >= SEQ_MOD // 2 else d
+
+
+class LatestFrameMailbox:
+    """Per-hand latest-value slot with sequence checks and drop accounting
+
+    Counters are in per-hand updates: a frame carrying both hands counts
+    as two received updates. Pending entries are (frame, recv_time) where
+    recv_time is a time.perf_counter() stamp taken at receive.
+    """
+
+    def __init__(self):
+        # Slots: controller frames per hand, then hand-joint frames per hand
+        self._pending = [None] * (2 * len(xr_protocol.HANDS))
+        self._last_seq = [None] * len(self._pending)
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self.received = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.delivered = 0
+
+    def put(self, frame, recv_time=None, hands=None):
+        """Offer a decoded frame; returns True if any hand was accepted
+
+        `hands` limits the offer to those hand indices (delta frames offer
+        only the hands that changed); by default every present hand.
+        """
+        if recv_time is None:
+            recv_time = time.perf_counter()
+        seq = int(frame['seq'])
+        flags = int(frame['flags'])
+        n_hands = len(xr_protocol.HANDS)
+        base = n_hands if frame['kind'] == xr_protocol.KIND_HAND_JOINTS else 0
+        accepted = False
+
+        with self._cond:
+            for hand in range(n_hands) if hands is None else hands:
+                if not flags & xr_protocol.FLAG_PRESENT[hand]:
+                    continue
+                self.received += 1
+                i = base + hand
+
+                # seq 0 means the sender does not number its frames (old pages)
+                last = self._last_seq[i]
+                if seq and last is not None:
+                    delta = seq_delta(seq, last)
+                    if -REORDER_WINDOW <= delta <= 0:
+                        self.dropped += 1
+                        continue
+
+                if self._pending[i] is not None:
+                    self.coalesced += 1
+                self._pending[i] = (frame, recv_time)
+                self._last_seq[i] = seq
+                accepted = True
+
+            if accepted:
+                self._cond.notify()
+        return accepted
+
+    def take(self, timeout=None):
+        """Return and clear pending frames as a list of (hand_index, frame, recv_time)
+
+        With a timeout, block up to that many seconds for a frame to arrive.
+        Controller and hand-joint frames of a hand come out separately (see
+        frame['kind']).
+        """
+        with self._cond:
+            if timeout is not None and not self._closed:
+                self._cond.wait_for(self._has_pending, timeout)
+            out = []
+            for i, entry in enumerate(self._pending):
+                if entry is not None:
+                    out.append((i % len(xr_protocol.HANDS), entry[0], entry[1]))
+                    self._pending[i] = None
+            self.delivered += len(out)
+        return out
+
+    def close(self):
+        """Wake any blocked take() so a consumer thread can exit"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _has_pending(self):
+        return self._closed or any(entry is not None for entry in self._pending)
+
+    def stats(self):
+        return {
+            'received': self.received,
+            'coalesced': self.coalesced,
+            'dropped': self.dropped,
+            'delivered': self.delivered,
+        }
@@ -0,0 +1,149 @@
+"""
+Haptic feedback return channel
+
+Consumers (sim contacts, IK failures) publish pulse commands as a
+sensor_msgs/JoyFeedbackArray on <namespace>/haptics: one JoyFeedback per
+pulse with type TYPE_RUMBLE, id = hand index (xr_protocol.HANDS) and
+intensity 0..1. A consumer repeats the command for as long as the
+condition lasts; each one becomes a PULSE_MS pulse, and a new pulse
+replaces the running one on the headset.
+
+The bridge merges the commands of each session in a HapticChannel and
+sends them to the page as one JSON control message:
+
+    {"type": "haptic", "seq": n, "t0": <host ms>, "pulses": [[hand, intensity, ms], ...]}
+
+The page fires gamepad.hapticActuators[0].pulse() for each hand and
+answers with its receive (t1) and fire (t2) times on the performance.now()
+timeline:
+
+    {"type": "haptic_ack", "seq": n, "t0": ..., "t1": ..., "t2": ...}
+
+Latency budget: a command has HAPTIC_BUDGET from its arrival at the bridge
+to the pulse on the controller. The first command after a quiet period is
+sent at once; later ones within COALESCE_INTERVAL are merged (strongest
+intensity per hand wins), so a burst of contact events costs one message
+per interval. Commands that could only be sent past the budget are dropped
+(a late pulse is worse than none), and acks report whether the pulse made
+it in time: command->pulse is measured through the clock sync, the round
+trip directly from the ack.
+"""
+
+import threading
+import time
+
+
+HAPTIC_TOPIC = 'haptics'
+
+PULSE_MS = 40.0            # length of one pulse; outlasts the coalescing interval
+COALESCE_INTERVAL = 0.008  # s, minimum spacing of haptic messages to one page
+HAPTIC_BUDGET = 0.05       # s, command arrival at the bridge -> pulse on the controller
+
+# Sent messages remembered for their ack (older ones count as lost)
+MAX_IN_FLIGHT = 64
+
+
+class HapticChannel:
+    """Pulse commands of one session, merged between sends, plus ack tracking
+
+    add() is called from the ROS executor thread, take() and handle_ack()
+    from the event loop. Times are host wall-clock seconds.
+    """
+
+    def __init__(self, budget=HAPTIC_BUDGET, pulse_ms=PULSE_MS):
+        self.budget = budget
+        self.pulse_ms = pulse_ms
+        self._lock = threading.Lock()
+        self._pending = {}    # hand -> [intensity, first command time]
+        self._in_flight = {}  # seq -> (send time, oldest command time)
+        self._seq = 0
+        self.last_send = 0.0
+
+        self.commands = 0   # pulse commands received
+        self.coalesced = 0  # merged into a pending command
+        self.stale = 0      # dropped: could not be sent within the budget
+        self.sent = 0       # messages sent to the page
+        self.acked = 0
+        self.late = 0       # acked, but fired past the budget
+        self.lost = 0       # never acked
+
+    def add(self, hand, intensity, now=None):
+        """Queue a pulse command; True if nothing was pending (schedule a send)"""
+        now = time.time() if now is None else now
+        intensity = min(max(float(intensity), 0.0), 1.0)
+        with self._lock:
+            self.commands += 1
+            was_idle = not self._pending
+            pending = self._pending.get(hand)
+            if pending is None:
+                self._pending[hand] = [intensity, now]
+            else:
+                self.coalesced += 1
+                pending[0] = max(pending[0], intensity)
+            return was_idle
+
+    def next_send_time(self):
+        """Earliest time the next message may go out"""
+        return self.last_send + COALESCE_INTERVAL
+
+    def take(self, now=None):
+        """Control message for the pending pulses, or None if nothing is left"""
+        now = time.time() if now is None else now
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        pulses, oldest = [], None
+        for hand, (intensity, first) in sorted(pending.items()):
+            if now - first > self.budget:
+                self.stale += 1
+                continue
+            pulses.append([hand, round(intensity, 3), self.pulse_ms])
+            oldest = first if oldest is None else min(oldest, first)
+        if not pulses:
+            return None
+
+        self._seq += 1
+        self.sent += 1
+        self.last_send = now
+        self._in_flight[self._seq] = (now, oldest)
+        if len(self._in_flight) > MAX_IN_FLIGHT:
+            del self._in_flight[min(self._in_flight)]
+            self.lost += 1
+        return {'type': 'haptic', 'seq': self._seq, 't0': now * 1e3, 'pulses': pulses}
+
+    def handle_ack(self, msg, t3, clock=None):
+        """Match an ack (t3 = host ms at receive)
+
+        Returns (round trip s, command->pulse s or None without clock sync),
+        or None for a malformed or unknown ack.
+        """
+        try:
+            seq = int(msg['seq'])
+            t0, t1, t2 = float(msg['t0']), float(msg['t1']), float(msg['t2'])
+        except (KeyError, TypeError, ValueError):
+            return None
+        entry = self._in_flight.pop(seq, None)
+        if entry is None:
+            return None
+        self.acked += 1
+        rtt = ((t3 - t0) - (t2 - t1)) / 1e3
+        fired = clock.to_host_time(t2) if clock is not None else None
+        if fired is None:
+            # No clock sync yet: assume a symmetric link
+            fired = entry[0] + rtt / 2 + (t2 - t1) / 1e3
+            latency = None
+        else:
+            latency = fired - entry[1]
+        if fired - entry[1] > self.budget:
+            self.late += 1
+        return rtt, latency
+
+    def stats(self):
+        return {
+            'haptic_commands': self.commands,
+            'haptic_coalesced': self.coalesced,
+            'haptic_stale': self.stale,
+            'haptic_sent': self.sent,
+            'haptic_acked': self.acked,
+            'haptic_late': self.late,
+            'haptic_lost': self.lost,
+        }
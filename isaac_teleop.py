@@ -18,13 +18,24 @@ except ImportError:
 
 from rclpy.node import Node
 from geometry_msgs.msg import PoseStamped
-from sensor_msgs.msg import Joy
+from sensor_msgs.msg import Joy, JoyFeedback, JoyFeedbackArray
+import time
 import numpy as np
-from scipy.spatial.transform import Rotation as R
 from omni.isaac.core import World
 from omni.isaac.franka import Franka
 from omni.isaac.core.utils.types import ArticulationAction
 
+import xr_protocol
+from calibration import (REUSE_RADIUS, StreamingCalibrator, calibration_path, load_calibration,
+                         reuse_distance, save_calibration)
+from haptics import HAPTIC_TOPIC
+from jitter_buffer import PoseJitterBuffer
+from ros_qos import make_qos
+from pose_filter import make_filter
+from pose_predictor import make_predictor, stamp_to_sec
+from tracing import TRACER, install_signals, traced
+from xr_mapping import FLIP_X_180, XRToRobot, to_wxyz
+
 
 # ============================================================================
 # CONFIGURATION
@@ -43,14 +54,66 @@ CONFIG = {
         "z_min": 0.02, "z_max": 0.9,
     },
     
-    # Smoothing (0.0 = instant, higher = smoother but laggy)
-    "smoothing": 0.0,
+    # Pose filter: None or "one_euro" (speed-adaptive, see pose_filter.py)
+    "filter": None,
+    
+    # One-Euro parameters: cutoff when still (Hz) and cutoff gain with speed
+    "filter_params": {"min_cutoff": 1.0, "beta": 50.0, "rot_min_cutoff": 1.0, "rot_beta": 10.0},
     
     # Gripper threshold
     "gripper_threshold": 0.3,
     
-    # Calibration samples (average first N poses to get stable reference)
-    "calibration_samples": 30,
+    # Streaming calibration: done once the reference position is known to
+    # `tolerance` (m); moving more than `max_deviation` (m) restarts it
+    "calibration": {"min_samples": 5, "max_samples": 60, "tolerance": 0.001, "max_deviation": 0.01},
+    
+    # Calibrations are saved per operator and reused on restart when recent,
+    # well converged and the first hand pose is near the saved reference
+    # (see calibration.py); otherwise hold steady as usual. None disables both
+    "operator": "default",
+    
+    # Joy button index that re-triggers calibration (1 = B/Y, None disables)
+    "recalibrate_button": 1,
+    
+    # Shared-memory block written by webxr_ros_bridge.py --shm (None = use ROS topics)
+    "shm_name": None,
+    
+    # Subscribe to the combined /quest/frame message (bridge --topics combined/both)
+    # instead of the per-hand pose and inputs topics
+    "combined_topic": False,
+    
+    # Subscriber QoS: "reliable" or "best_effort", and history depth (see ros_qos.py)
+    "qos": "reliable",
+    "qos_depth": 10,
+    
+    # Controller pulse (intensity 0..1) on frames where IK fails, so the
+    # operator feels the edge of the reachable space (None disables)
+    "ik_failure_pulse": 0.6,
+    
+    # Latency compensation: None, "cv" or "kalman" (see pose_predictor.py)
+    "prediction": None,
+    
+    # Extra lead on top of the measured capture latency (seconds)
+    "prediction_horizon": 0.0,
+    
+    # Jitter buffer playout delay (seconds, e.g. 0.03; None writes the target
+    # on arrival). An alternative to prediction: poses are interpolated at
+    # (now - delay) every control tick, so network jitter does not reach the robot
+    "jitter_buffer": None,
+    
+    # Fixed control/physics rate of the sim loop (Hz)
+    "control_rate": 60.0,
+    
+    # Reachability map (see reachability.py): targets the arm cannot reach are
+    # projected onto the nearest reachable pose before the IK solve instead of
+    # failing it. Sampled from the Lula kinematics on first use (a few minutes)
+    # and cached, keyed by the robot description files
+    "reachability": False,
+    
+    # Time the callbacks, the IK call and the world step from startup (see
+    # tracing.py). Either way, kill -USR1 <pid> starts tracing and dumps a
+    # Chrome trace on the second signal; kill -USR2 <pid> takes a stack profile
+    "trace": False,
 }
 
 
@@ -60,12 +123,35 @@ class QuestTeleop(Node):
         self.config = config
         
         self.pose_count = 0
+        self.messages = 0  # ROS callbacks run, so drain() can tell when the queues are empty
+        
+        # Input source: shared memory from the bridge (same host), or ROS topics
+        self.shm_reader = None
+        self.qos = make_qos(config["qos"], config["qos_depth"])
+        if config["shm_name"]:
+            from shm_transport import SharedStateReader
+            self.shm_reader = SharedStateReader(config["shm_name"])
+            self.get_logger().info(f"Reading right hand from shared memory: {config['shm_name']}")
+        elif config["combined_topic"]:
+            self.frame_sub = self.create_subscription(
+                Joy, f'/quest/{xr_protocol.COMBINED_TOPIC}', self.frame_callback, self.qos)
+        else:
+            self.pose_sub = self.create_subscription(
+                PoseStamped, '/quest/right_hand/pose', self.pose_callback, self.qos)
+            self.input_sub = self.create_subscription(
+                Joy, '/quest/right_hand/inputs', self.input_callback, self.qos)
+        
+        # Haptic pulse commands, forwarded to the controller by the bridge
+        self.haptic_pub = self.create_publisher(JoyFeedbackArray, f'/quest/{HAPTIC_TOPIC}', self.qos)
         
-        # Subscribers
-        self.pose_sub = self.create_subscription(
-            PoseStamped, '/quest/right_hand/pose', self.pose_callback, 10)
-        self.input_sub = self.create_subscription(
-            Joy, '/quest/right_hand/inputs', self.input_callback, 10)
+        # Pose filter stage (applied to every received pose after calibration)
+        self.pose_filter = make_filter(config["filter"], **config["filter_params"])
+        
+        # Pose prediction or jitter buffer (fed from the callbacks, evaluated every control tick)
+        if config["prediction"] and config["jitter_buffer"]:
+            raise ValueError('CONFIG: "prediction" and "jitter_buffer" are alternatives, set one')
+        self.predictor = make_predictor(config["prediction"])
+        self.jitter_buffer = PoseJitterBuffer(config["jitter_buffer"]) if config["jitter_buffer"] else None
         
         # Target state
         self.target_pos = np.array(config["robot_home"])
@@ -74,116 +160,248 @@ class QuestTeleop(Node):
         
         # Dynamic calibration
         self.calibrated = False
-        self.calibration_poses = []
+        self.calibrator = StreamingCalibrator(**config["calibration"])
         self.reference_pos = None  # XR position that maps to robot_home
+        self.recalibrate_pressed = False
+        
+        # Saved calibration of this operator, checked against the first pose
+        self.calibration_path = None
+        self.saved_calibration = None
+        if config["operator"] is not None:
+            self.calibration_path = calibration_path(config["operator"])
+            self.saved_calibration, reason = load_calibration(
+                self.calibration_path, tolerance=config["calibration"]["tolerance"])
+            if self.saved_calibration is None:
+                self.get_logger().info(f"Saved calibration for {config['operator']!r} not used: {reason}")
         
-        # Coordinate transform matrix (XR -> Robot)
-        self.T = np.array([[0, 0, -1], [-1, 0, 0], [0, 1, 0]])
+        # Coordinate transform (XR -> Robot), precomputed once
+        self.mapping = XRToRobot(tool_rotation=FLIP_X_180, scale=config["pos_scale"])
+        self.robot_home = np.array(config["robot_home"])
+        ws = config["workspace"]
+        self.workspace_min = np.array([ws["x_min"], ws["y_min"], ws["z_min"]])
+        self.workspace_max = np.array([ws["x_max"], ws["y_max"], ws["z_max"]])
+        self.reachability = None  # set in main() once the kinematics are loaded
         
         self.get_logger().info("="*50)
         self.get_logger().info("QuestTeleop - Dynamic Calibration Mode")
-        self.get_logger().info("Hold your hand steady for calibration...")
+        if self.saved_calibration is not None:
+            self.get_logger().info("Saved calibration found: start with your hand where you calibrated")
+        else:
+            self.get_logger().info("Hold your hand steady for calibration...")
+        if config["recalibrate_button"] is not None:
+            self.get_logger().info(f"Press {xr_protocol.BUTTON_NAMES[config['recalibrate_button']]} to recalibrate")
         self.get_logger().info("="*50)
 
+    @traced('isaac.pose_callback')
     def pose_callback(self, msg):
+        self.messages += 1
+        p = msg.pose.position
+        o = msg.pose.orientation
+        self.process_pose(np.array([p.x, p.y, p.z]), np.array([o.x, o.y, o.z, o.w]),
+                          stamp_to_sec(msg.header.stamp))
+
+    @traced('isaac.frame_callback')
+    def frame_callback(self, msg):
+        """Right hand pose and inputs from one combined message (one stamp, no tearing)"""
+        self.messages += 1
+        present, pose, axes, buttons = xr_protocol.combined_hand(msg.axes, msg.buttons, 1)
+        if not present:
+            return
+        if pose is not None:
+            self.process_pose(np.array(pose[:3]), np.array(pose[3:]), stamp_to_sec(msg.header.stamp))
+        button = self.config["recalibrate_button"]
+        self.process_inputs(axes[0], axes[1], button is not None and bool(buttons[button]))
+
+    @traced('isaac.poll_shared_state')
+    def poll_shared_state(self):
+        """Pull the right hand from shared memory if the bridge wrote a new update"""
+        # A write to the left hand alone must not feed the calibrator the right pose again
+        if not self.shm_reader.read() or not self.shm_reader.updated()[1]:
+            return
+        pose, axes, buttons, stamp = self.shm_reader.hand(1)  # right
+        self.process_pose(pose[:3].copy(), pose[3:].copy(), stamp)
+        button = self.config["recalibrate_button"]
+        recalibrate = button is not None and bool(buttons & xr_protocol.BUTTON_BITS[button])
+        self.process_inputs(float(axes[0]), float(axes[1]), recalibrate)
+
+    def drain(self, limit=100):
+        """Run every pending ROS callback (spin_once runs at most one)
+
+        Pose and inputs arrive at ~90 Hz each, faster than the control
+        rate: taking one per tick would leave the queues full and every
+        pose several frames old.
+        """
+        for _ in range(limit):
+            before = self.messages
+            rclpy.spin_once(self, timeout_sec=0.0)
+            if self.messages == before:
+                break
+
+    def process_pose(self, xr_pos, xr_quat, stamp=None):
+        """Handle a raw XR position and (x, y, z, w) quaternion captured at `stamp`"""
         self.pose_count += 1
         
-        # Raw XR position
-        xr_pos = np.array([msg.pose.position.x, msg.pose.position.y, msg.pose.position.z])
-        
         # =====================================================================
         # DYNAMIC CALIBRATION
         # =====================================================================
+        if stamp is None:
+            stamp = time.time()
+        if not self.calibrated and self.saved_calibration is not None:
+            self.reuse_calibration(xr_pos)
         if not self.calibrated:
-            self.calibration_poses.append(xr_pos.copy())
-            
-            if len(self.calibration_poses) >= self.config["calibration_samples"]:
-                # Average the calibration poses for stability
-                self.reference_pos = np.mean(self.calibration_poses, axis=0)
+            if self.calibrator.add(xr_pos, stamp):
+                # Converged running mean of a still hand
+                self.reference_pos = self.calibrator.mean.copy()
                 self.calibrated = True
                 
                 self.get_logger().info("="*50)
                 self.get_logger().info("✓ CALIBRATION COMPLETE!")
                 self.get_logger().info(f"  Reference XR pos: ({self.reference_pos[0]:.2f}, {self.reference_pos[1]:.2f}, {self.reference_pos[2]:.2f})")
+                self.get_logger().info(f"  Quality: {self.calibrator.format()}")
                 self.get_logger().info(f"  Maps to robot home: {self.config['robot_home']}")
                 self.get_logger().info("  Move your hand to control the robot!")
                 self.get_logger().info("="*50)
-            else:
-                remaining = self.config["calibration_samples"] - len(self.calibration_poses)
-                if remaining % 10 == 0:
-                    self.get_logger().info(f"Calibrating... {remaining} samples remaining")
+                if self.calibration_path is not None:
+                    save_calibration(self.calibration_path, self.reference_pos, self.calibrator,
+                                     operator=self.config["operator"])
+            elif self.calibrator.total_samples % 30 == 0:
+                self.get_logger().info(f"Calibrating... hold your hand steady ({self.calibrator.restarts} motion restarts)")
             return
         
+        if self.pose_filter is not None:
+            xr_pos, xr_quat = self.pose_filter.filter(stamp, xr_pos, xr_quat)
+        
+        if self.jitter_buffer is not None:
+            # Target is played out in update_target()
+            self.jitter_buffer.update(stamp, xr_pos, xr_quat)
+        elif self.predictor is not None:
+            # Target is set from the prediction in update_target()
+            self.predictor.update(stamp, xr_pos, xr_quat)
+        else:
+            self.map_pose(xr_pos, xr_quat)
+        
+        if self.pose_count % 500 == 0:
+            self.get_logger().info(f"Pos: ({self.target_pos[0]:.2f}, {self.target_pos[1]:.2f}, {self.target_pos[2]:.2f})")
+
+    def reuse_calibration(self, xr_pos):
+        """Adopt the saved reference if the first hand pose is close to it"""
+        saved, self.saved_calibration = self.saved_calibration, None
+        distance = reuse_distance(saved, xr_pos)
+        if distance > REUSE_RADIUS:
+            self.get_logger().info(
+                f"Saved calibration not reused: hand is {distance * 100:.1f} cm from its reference "
+                f"(limit {REUSE_RADIUS * 100:.0f} cm). Hold your hand steady for calibration...")
+            return
+        self.reference_pos = saved['reference']
+        self.calibrated = True
+        quality = saved['quality']
+        self.get_logger().info("="*50)
+        self.get_logger().info(
+            f"✓ Reused calibration of {self.config['operator']!r} from {saved['age_s'] / 60:.0f} min ago "
+            f"(hand {distance * 1e3:.0f} mm from its reference, stderr {quality['stderr_mm']:.2f} mm)")
+        self.get_logger().info("  Move your hand to control the robot!")
+        self.get_logger().info("="*50)
+
+    def update_target(self):
+        """Once per control tick: the buffered pose at the playout time, or the
+        hand pose predicted for now + horizon"""
+        if self.jitter_buffer is not None:
+            if self.jitter_buffer.ready:
+                self.map_pose(*self.jitter_buffer.sample(time.time()))
+            return
+        if self.predictor is None or not self.predictor.ready:
+            return
+        xr_pos, xr_quat = self.predictor.predict(time.time() + self.config["prediction_horizon"])
+        self.map_pose(xr_pos, xr_quat)
+
+    def map_pose(self, xr_pos, xr_quat):
+        """Map a calibrated XR pose to the robot target"""
         # =====================================================================
         # RELATIVE POSITION (from calibration reference)
         # =====================================================================
         # Calculate offset from reference position
         xr_offset = xr_pos - self.reference_pos
         
-        # Transform to robot frame
-        robot_offset = self.T @ xr_offset
-        
-        # Apply scaling and add to robot home position
-        robot_pos = robot_offset * self.config["pos_scale"] + np.array(self.config["robot_home"])
+        # Transform to robot frame, scale and add to robot home position
+        robot_pos = self.mapping.position(xr_offset) + self.robot_home
         
         # Clamp to workspace
-        ws = self.config["workspace"]
-        robot_pos[0] = np.clip(robot_pos[0], ws["x_min"], ws["x_max"])
-        robot_pos[1] = np.clip(robot_pos[1], ws["y_min"], ws["y_max"])
-        robot_pos[2] = np.clip(robot_pos[2], ws["z_min"], ws["z_max"])
+        robot_pos = np.clip(robot_pos, self.workspace_min, self.workspace_max)
         
         # =====================================================================
         # ORIENTATION (full tracking)
         # =====================================================================
-        xr_quat = np.array([
-            msg.pose.orientation.x,
-            msg.pose.orientation.y,
-            msg.pose.orientation.z,
-            msg.pose.orientation.w
-        ])
-        
-        r_xr = R.from_quat(xr_quat)
-        mat_xr = r_xr.as_matrix()
-        mat_robot = self.T @ mat_xr @ self.T.T
-        
-        flip = R.from_euler('x', 180, degrees=True).as_matrix()
-        mat_robot = mat_robot @ flip
-        
-        quat_robot = R.from_matrix(mat_robot).as_quat()
-        robot_rot = np.array([quat_robot[3], quat_robot[0], quat_robot[1], quat_robot[2]])
+        # Basis change plus 180 deg flip about X, precomputed in xr_mapping.py
+        robot_rot = to_wxyz(self.mapping.orientation(xr_quat))
         
-        # Apply smoothing
-        alpha = self.config["smoothing"]
-        if alpha > 0:
-            self.target_pos = alpha * self.target_pos + (1 - alpha) * robot_pos
-            self.target_rot = alpha * self.target_rot + (1 - alpha) * robot_rot
-            self.target_rot = self.target_rot / np.linalg.norm(self.target_rot)
-        else:
-            self.target_pos = robot_pos
-            self.target_rot = robot_rot
-        
-        if self.pose_count % 500 == 0:
-            self.get_logger().info(f"Pos: ({self.target_pos[0]:.2f}, {self.target_pos[1]:.2f}, {self.target_pos[2]:.2f})")
+        # Nearest reachable pose, so the IK is never handed an impossible target
+        if self.reachability is not None:
+            robot_pos, robot_rot, _ = self.reachability.project(robot_pos, robot_rot)
+        self.target_pos = robot_pos
+        self.target_rot = robot_rot
 
+    @traced('isaac.input_callback')
     def input_callback(self, msg):
+        self.messages += 1
         trigger = msg.axes[0] if len(msg.axes) > 0 else 0.0
         squeeze = msg.axes[1] if len(msg.axes) > 1 else 0.0
+        button = self.config["recalibrate_button"]
+        recalibrate = button is not None and len(msg.buttons) > button and bool(msg.buttons[button])
+        self.process_inputs(trigger, squeeze, recalibrate)
+
+    def process_inputs(self, trigger, squeeze, recalibrate=False):
         self.gripper_closed = trigger > self.config["gripper_threshold"] or squeeze > self.config["gripper_threshold"]
         
+        # Recalibrate on the press edge, not while the button is held
+        if recalibrate and not self.recalibrate_pressed:
+            self.recalibrate()
+        self.recalibrate_pressed = recalibrate
+        
+    def pulse(self, intensity, hand=1):
+        """Ask the bridge for a controller pulse (hand index as in xr_protocol.HANDS)"""
+        msg = JoyFeedbackArray()
+        msg.array = [JoyFeedback(type=JoyFeedback.TYPE_RUMBLE, id=hand, intensity=float(intensity))]
+        self.haptic_pub.publish(msg)
+    
     def recalibrate(self):
         """Call this to recalibrate (e.g., when user changes position)"""
         self.calibrated = False
-        self.calibration_poses = []
+        self.calibrator.reset()
+        self.saved_calibration = None
         self.reference_pos = None
+        if self.pose_filter is not None:
+            self.pose_filter.reset()
+        if self.predictor is not None:
+            self.predictor.reset()
+        if self.jitter_buffer is not None:
+            self.jitter_buffer.reset()
+        
         self.get_logger().info("Recalibrating... hold hand steady")
 
 
+def lula_fk(ik_solver, frame_name, axis):
+    """fk(q) -> (frame positions, frame `axis` directions) for reachability.py"""
+    def fk(q):
+        pos = np.empty((len(q), 3))
+        dirs = np.empty((len(q), 3))
+        for i in range(len(q)):
+            p, rot = ik_solver.compute_forward_kinematics(frame_name, q[i])
+            pos[i] = p
+            dirs[i] = np.asarray(rot)[:, axis]
+        return pos, dirs
+    return fk
+
+
 def main():
+    if CONFIG["trace"]:
+        TRACER.enable()
+    install_signals()
     rclpy.init()
     teleop_node = QuestTeleop(CONFIG)
     
-    # Setup World
-    world = World(stage_units_in_meters=1.0)
+    # Setup World: one physics step and one render per control tick
+    control_dt = 1.0 / CONFIG["control_rate"]
+    world = World(stage_units_in_meters=1.0, physics_dt=control_dt, rendering_dt=control_dt)
     world.scene.add_default_ground_plane()
     
     # Add Franka
@@ -200,6 +418,16 @@ def main():
         urdf_path=mg_config["urdf_path"]
     )
     
+    if CONFIG["reachability"]:
+        from reachability import file_hash, load_or_build
+        # Arm joints only (the fingers follow); panda_hand approaches along z,
+        # the axis panda_joint7 rolls about
+        limits = franka.dof_properties
+        key = file_hash(mg_config["urdf_path"], mg_config["robot_description_path"])
+        teleop_node.reachability = load_or_build(
+            f"lula:{key}:panda_hand", lula_fk(ik_solver, "panda_hand", 2),
+            limits["lower"][:7], limits["upper"][:7], axis=2, log=print)
+    
     print("="*60)
     print("Isaac Sim VR Teleoperation")
     print("Dynamic calibration - works with any hand position!")
@@ -209,9 +437,21 @@ def main():
     ik_fail = 0
     frame_count = 0
     last_good_arm_positions = None
+    next_tick = time.perf_counter()
     
     while simulation_app.is_running():
-        rclpy.spin_once(teleop_node, timeout_sec=0.0)
+        # Fixed-rate control tick (absolute schedule, like mujoco_sim.run_sim)
+        next_tick += control_dt
+        delay = next_tick - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        elif -delay > control_dt:
+            next_tick = time.perf_counter()  # a slow render: restart the schedule instead of bursting
+        
+        if teleop_node.shm_reader is not None:
+            teleop_node.poll_shared_state()
+        else:
+            teleop_node.drain()
         frame_count += 1
         
         # Only do IK after calibration
@@ -219,12 +459,15 @@ def main():
             world.step(render=True)
             continue
         
+        teleop_node.update_target()
+        
         # Direct IK solve
-        actions, success = ik_solver.compute_inverse_kinematics(
-            target_position=teleop_node.target_pos,
-            target_orientation=teleop_node.target_rot,
-            frame_name="panda_hand"
-        )
+        with TRACER.span('isaac.ik'):
+            actions, success = ik_solver.compute_inverse_kinematics(
+                target_position=teleop_node.target_pos,
+                target_orientation=teleop_node.target_rot,
+                frame_name="panda_hand"
+            )
         
         gripper_pos = 0.0 if teleop_node.gripper_closed else 0.04
         
@@ -236,6 +479,8 @@ def main():
             franka.apply_action(ArticulationAction(joint_positions=full_positions))
         else:
             ik_fail += 1
+            if CONFIG["ik_failure_pulse"]:
+                teleop_node.pulse(CONFIG["ik_failure_pulse"])
             if last_good_arm_positions is not None:
                 full_positions = np.concatenate([last_good_arm_positions, [gripper_pos, gripper_pos]])
                 franka.apply_action(ArticulationAction(joint_positions=full_positions))
@@ -245,9 +490,18 @@ def main():
             total = ik_success + ik_fail
             rate = (ik_success / total * 100) if total > 0 else 0
             print(f"[Frame {frame_count}] IK: {rate:.1f}% | Gripper: {'CLOSED' if teleop_node.gripper_closed else 'OPEN'}")
+            if teleop_node.jitter_buffer is not None:
+                print(f"  {teleop_node.jitter_buffer.format()}")
+            if teleop_node.reachability is not None:
+                print(f"  {teleop_node.reachability.format()}")
+            if TRACER.enabled:
+                print(f"  {TRACER.format()}")
         
-        world.step(render=True)
+        with TRACER.span('isaac.world_step'):
+            world.step(render=True)
     
+    if teleop_node.shm_reader is not None:
+        teleop_node.shm_reader.close()
     teleop_node.destroy_node()
     rclpy.shutdown()
     simulation_app.close()
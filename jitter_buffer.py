@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Pose Jitter Buffer
+
+Consumers sample the hand pose at their own fixed control rate, but poses
+arrive whenever the network delivers them: bunched after a stall, late,
+occasionally two within one tick and none in the next. Writing the target
+on arrival turns that straight into uneven target motion (repeated and
+skipped poses). The jitter buffer keeps a few timestamped poses and plays
+them out `delay` seconds behind the consumer clock, interpolating between
+the two samples that bracket the playout time (lerp for position, slerp
+for orientation), so the target moves at the pace the hand did.
+
+    update(t, pos, quat)  on every received pose (t = capture time, host s)
+    sample(now)           once per control tick -> (pos, quat)
+
+The delay has to cover the pipeline latency plus one frame period plus the
+jitter; when the playout time runs past the newest sample (underrun) the
+newest pose is held. Inter-arrival jitter is tracked as in RFC 3550.
+
+Usage:
+    python jitter_buffer.py --synthetic 30                    # delay sweep vs write-on-arrival
+    python jitter_buffer.py session.qlog --jitter 8 --delays 10 20 30 50
+"""
+
+import argparse
+import collections
+import threading
+import time
+
+import numpy as np
+
+from xr_mapping import quat_slerp
+
+
+DEFAULT_DELAY = 0.03     # s: latency + one 90 Hz frame + jitter headroom
+DEFAULT_CAPACITY = 64    # poses; older ones are dropped (more than enough for any sane delay)
+
+
+class PoseJitterBuffer:
+    """Time-indexed poses played out at a fixed delay behind the consumer clock
+
+    update() may run on a subscriber thread and sample() on the control
+    loop. Counters:
+        late        poses not newer than the last one (dropped)
+        underruns   samples taken past the newest pose (newest held)
+        early       samples taken before the oldest pose (oldest held)
+        jitter_ms   smoothed inter-arrival jitter (RFC 3550)
+    """
+
+    def __init__(self, delay=DEFAULT_DELAY, capacity=DEFAULT_CAPACITY, now_fn=time.time):
+        self.delay = delay
+        self.capacity = capacity
+        self.now_fn = now_fn  # arrival clock (same clock as the sample() argument)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self._poses = collections.deque(maxlen=self.capacity)  # (t, pos, quat)
+        self._transit = None
+        self.jitter = 0.0
+        self.received = 0
+        self.late = 0
+        self.samples = 0
+        self.underruns = 0
+        self.early = 0
+
+    @property
+    def ready(self):
+        return bool(self._poses)
+
+    def update(self, t, pos, quat, arrival=None):
+        """Add a pose captured at t (arrival defaults to now_fn())"""
+        arrival = self.now_fn() if arrival is None else arrival
+        with self._lock:
+            self.received += 1
+            if self._poses and t <= self._poses[-1][0]:
+                self.late += 1
+                return
+            transit = arrival - t
+            if self._transit is not None:
+                self.jitter += (abs(transit - self._transit) - self.jitter) / 16.0
+            self._transit = transit
+            self._poses.append((t, np.asarray(pos, dtype=float), np.asarray(quat, dtype=float)))
+
+    def sample(self, now):
+        """Pose at now - delay -> (pos, quat); call only once ready"""
+        playout = now - self.delay
+        with self._lock:
+            self.samples += 1
+            poses = self._poses
+            # Keep one pose at or before the playout time
+            while len(poses) > 1 and poses[1][0] <= playout:
+                poses.popleft()
+            t0, pos0, quat0 = poses[0]
+            if playout <= t0:
+                self.early += playout < t0
+                return pos0, quat0
+            if len(poses) == 1:
+                self.underruns += 1
+                return pos0, quat0
+            t1, pos1, quat1 = poses[1]
+        alpha = (playout - t0) / (t1 - t0)
+        return pos0 + (pos1 - pos0) * alpha, quat_slerp(quat0, quat1, alpha)
+
+    def stats(self):
+        return {
+            'delay_ms': round(self.delay * 1e3, 1),
+            'received': self.received,
+            'late': self.late,
+            'samples': self.samples,
+            'underruns': self.underruns,
+            'early': self.early,
+            'jitter_ms': round(self.jitter * 1e3, 2),
+        }
+
+    def format(self):
+        s = self.stats()
+        return (f"jitter buffer {s['delay_ms']:.0f} ms: jitter {s['jitter_ms']:.1f} ms, "
+                f"underruns {s['underruns']}/{s['samples']}, late {s['late']}/{s['received']}")
+
+
+def make_jitter_buffer(delay_ms, **kwargs):
+    """Buffer with a playout delay in ms; None or 0 disables it"""
+    if not delay_ms:
+        return None
+    return PoseJitterBuffer(delay=delay_ms / 1e3, **kwargs)
+
+
+# ============================================================================
+# OFFLINE EVALUATION
+# ============================================================================
+def simulate_arrivals(t, latency, jitter, seed=0):
+    """Arrival times over an in-order link (WebSocket): base latency plus
+    exponential jitter; a late message holds back the ones behind it"""
+    rng = np.random.default_rng(seed)
+    arrival = t + latency + rng.exponential(jitter, len(t)) if jitter > 0 else t + latency
+    return np.maximum.accumulate(arrival)
+
+
+def play(t, pos, quat, arrival, rate, buffer=None):
+    """Run a fixed-rate consumer over one track
+
+    Without a buffer the target is the newest pose received (write on
+    arrival). Returns (tick times, target positions).
+    """
+    ticks = np.arange(arrival[0], arrival[-1], 1.0 / rate)
+    target = np.zeros((len(ticks), 3))
+    i = 0
+    for k, now in enumerate(ticks):
+        while i < len(t) and arrival[i] <= now:
+            if buffer is not None:
+                buffer.update(t[i], pos[i], quat[i], arrival[i])
+            i += 1
+        if buffer is None:
+            target[k] = pos[max(i - 1, 0)]
+        elif buffer.ready:
+            target[k] = buffer.sample(now)[0]
+        else:
+            target[k] = pos[0]
+    return ticks, target
+
+
+def evaluate(t, pos, quat, arrival, rate, delays):
+    """Rows of smoothness / staleness metrics for write-on-arrival and each delay"""
+    rows = []
+    for delay in [None] + list(delays):
+        buffer = None if delay is None else PoseJitterBuffer(delay=delay)
+        ticks, target = play(t, pos, quat, arrival, rate, buffer)
+        # Only the stretch where every variant has settled
+        keep = ticks > arrival[0] + max(delays) + 0.1
+        ticks, target = ticks[keep], target[keep]
+        truth = np.stack([np.interp(ticks, t, pos[:, k]) for k in range(3)], axis=-1)
+        accel = np.linalg.norm(np.diff(target, 2, axis=0), axis=-1) * rate ** 2
+        # Ticks where the target did not move while the hand did
+        moving = np.linalg.norm(np.diff(truth, axis=0), axis=-1) > 1e-5
+        stuck = moving & (np.linalg.norm(np.diff(target, axis=0), axis=-1) < 1e-9)
+        rows.append({
+            'mode': 'arrival' if delay is None else f"buffer {delay * 1e3:.0f} ms",
+            'accel_rms': float(np.sqrt(np.mean(accel ** 2))),
+            'accel_p99': float(np.percentile(accel, 99)),
+            'stuck_pct': 100.0 * stuck.sum() / max(moving.sum(), 1),
+            'error_mm': float(np.mean(np.linalg.norm(target - truth, axis=-1)) * 1e3),
+            'underrun_pct': (100.0 * buffer.underruns / max(buffer.samples, 1)) if buffer else None,
+            'jitter_ms': buffer.jitter * 1e3 if buffer else None,
+        })
+    return rows
+
+
+def format_rows(rows):
+    lines = [f"{'mode':<16} {'accel rms':>10} {'accel p99':>10} {'stuck %':>8} {'err mm':>7} "
+             f"{'underrun %':>11} {'jitter ms':>10}"]
+    fmt = lambda v, width, prec: f"{'-':>{width}}" if v is None else f"{v:>{width}.{prec}f}"
+    for r in rows:
+        lines.append(f"{r['mode']:<16} {r['accel_rms']:>10.2f} {r['accel_p99']:>10.2f} {r['stuck_pct']:>8.1f} "
+                     f"{r['error_mm']:>7.2f} {fmt(r['underrun_pct'], 11, 1)} {fmt(r['jitter_ms'], 10, 2)}")
+    return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Jitter buffer evaluation (fixed-rate consumer)')
+    parser.add_argument('paths', nargs='*', help='Session logs recorded with webxr_ros_bridge.py --record')
+    parser.add_argument('--synthetic', type=float, default=0.0, metavar='SECONDS',
+                        help='Use a synthetic 90 Hz hand track of this length')
+    parser.add_argument('--hand', choices=['left', 'right'], default='right')
+    parser.add_argument('--rate', type=float, default=100.0, help='Consumer control rate (Hz)')
+    parser.add_argument('--latency', type=float, default=5.0, help='Base network latency (ms)')
+    parser.add_argument('--jitter', type=float, default=4.0, help='Mean exponential jitter (ms)')
+    parser.add_argument('--delays', type=float, nargs='+', default=[10, 20, 30, 50],
+                        help='Playout delays to compare (ms)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    tracks = []
+    for path in args.paths:
+        from pose_predictor import load_track
+        tracks.append((path, *load_track(path, args.hand)))
+    if args.synthetic > 0:
+        from synthetic_quest import generate_trajectory
+        t, poses, _, _ = generate_trajectory(args.synthetic, 90.0, seed=args.seed)
+        index = 0 if args.hand == 'left' else 1
+        tracks.append(('synthetic', t, poses[:, index, :3], poses[:, index, 3:]))
+    if not tracks:
+        raise SystemExit("No tracks: pass session logs and/or --synthetic SECONDS")
+
+    delays = [d / 1e3 for d in args.delays]
+    for name, t, pos, quat in tracks:
+        arrival = simulate_arrivals(t, args.latency / 1e3, args.jitter / 1e3, args.seed)
+        print(f"{name}: {len(t)} poses, {args.latency:g} ms latency + {args.jitter:g} ms mean jitter, "
+              f"consumer at {args.rate:g} Hz (accel in m/s^2 of the target)")
+        print(format_rows(evaluate(t, pos, quat, arrival, args.rate, delays)))
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Damped-Least-Squares IK for MuJoCo Arms
+
+Explicit replacement for the soft weld in mujoco_sim.py: the joint
+configuration that puts a site on a target pose is found by iterating
+
+    dq = J^T (J J^T + damping^2 I)^-1 e
+
+with J from mj_jac (position and rotation rows) and e the 6D pose error.
+Joints are kept inside their ranges (joints pinned at a limit and pushing
+outwards are dropped from the step), each solve is warm-started from the
+previous solution (with one restart from home if that gets stuck), and it
+stops at the tolerance, after `max_iters`, or once `time_budget` seconds
+are used - so one solve per control tick has a known worst-case cost and
+reports how far from the target it ended.
+
+Usage:
+    python mujoco_ik.py benchmark --synthetic 30          # synthetic hand track
+    python mujoco_ik.py benchmark a.qlog b.qlog           # recorded sessions
+"""
+
+import argparse
+import time
+
+import mujoco
+import numpy as np
+
+
+class DampedLeastSquaresIK:
+    """Warm-started damped-least-squares IK for one site of a MuJoCo model
+
+    Solves on a private MjData, so it can run next to a simulation that
+    owns the model's main data. Target orientations are (w, x, y, z).
+    """
+
+    def __init__(self, model, site='ee_site', joints=None, damping=0.05, max_iters=20,
+                 time_budget=1e-3, pos_tol=1e-4, rot_tol=1e-3, rot_weight=1.0, max_step=0.2,
+                 stall_ratio=0.95):
+        self.model = model
+        self.data = mujoco.MjData(model)
+        self.site_id = model.site(site).id
+        self.body_id = model.site_bodyid[self.site_id]
+        self.damping = damping
+        self.max_iters = max_iters
+        self.time_budget = time_budget  # s per solve, None = iterations only
+        self.pos_tol = pos_tol          # m
+        self.rot_tol = rot_tol          # rad
+        self.rot_weight = rot_weight    # error weight of 1 rad relative to 1 m
+        self.max_step = max_step        # rad (or m) per joint per iteration
+        self.stall_ratio = stall_ratio  # error ratio per iteration that counts as no progress
+
+        # Controlled joints: all hinge/slide joints unless named
+        if joints is None:
+            joints = [j for j in range(model.njnt)
+                      if model.jnt_type[j] in (int(mujoco.mjtJoint.mjJNT_HINGE), int(mujoco.mjtJoint.mjJNT_SLIDE))]
+            if not joints:
+                raise ValueError("model has no hinge or slide joints")
+        else:
+            joints = [model.joint(name).id for name in joints]
+        self.joint_ids = np.array(joints, dtype=int)
+        self.qpos_adr = model.jnt_qposadr[self.joint_ids]
+        self.dof_adr = model.jnt_dofadr[self.joint_ids]
+        limited = model.jnt_limited[self.joint_ids].astype(bool)
+        self.lower = np.where(limited, model.jnt_range[self.joint_ids, 0], -np.inf)
+        self.upper = np.where(limited, model.jnt_range[self.joint_ids, 1], np.inf)
+
+        self._jacp = np.zeros((3, model.nv))
+        self._jacr = np.zeros((3, model.nv))
+        self._site_quat = np.zeros(4)
+        self._site_conj = np.zeros(4)
+        self._err_quat = np.zeros(4)
+        self._err = np.zeros(6)
+        self._damping_eye = np.eye(6) * damping ** 2
+        self._weight = np.array([1.0, 1.0, 1.0] + [rot_weight] * 3)
+        self.reset()
+
+    def reset(self, q=None):
+        """Forget the warm start (restart from q, default the model's qpos0)"""
+        self.q = np.array(self.model.qpos0[self.qpos_adr] if q is None else q, dtype=float)
+        self.stats = {'iters': 0, 'pos_err': float('nan'), 'rot_err': float('nan'),
+                      'time': 0.0, 'converged': False, 'restarted': False}
+
+    def _error(self, q, target_pos, target_quat):
+        """Forward kinematics at q -> site position; 6D error (pos, rotation vector) in self._err"""
+        self.data.qpos[self.qpos_adr] = q
+        mujoco.mj_kinematics(self.model, self.data)
+        mujoco.mj_comPos(self.model, self.data)
+        site_pos = self.data.site_xpos[self.site_id]
+        mujoco.mju_mat2Quat(self._site_quat, self.data.site_xmat[self.site_id])
+        mujoco.mju_negQuat(self._site_conj, self._site_quat)
+        mujoco.mju_mulQuat(self._err_quat, target_quat, self._site_conj)
+        self._err[:3] = target_pos - site_pos
+        mujoco.mju_quat2Vel(self._err[3:], self._err_quat, 1.0)
+        return site_pos
+
+    def solve(self, target_pos, target_quat, q_init=None):
+        """Joint positions reaching (target_pos, target_quat (w, x, y, z))
+
+        Starts from q_init or the previous solution. If that does not
+        converge and budget is left, the solve restarts once from the home
+        configuration (qpos0) and keeps the better result: a warm start can
+        wind the wrist into its limits and stay there. Per-solve statistics
+        are left in self.stats.
+        """
+        start = time.perf_counter()
+        deadline = None if self.time_budget is None else start + self.time_budget
+        target_pos = np.asarray(target_pos, dtype=float)
+        target_quat = np.asarray(target_quat, dtype=float)
+        q0 = self.q if q_init is None else q_init
+
+        q, pos_err, rot_err, iters, converged = self._iterate(q0, target_pos, target_quat,
+                                                              self.max_iters, deadline)
+        restarted = False
+        if not converged and iters < self.max_iters and (deadline is None or time.perf_counter() < deadline):
+            restarted = True
+            home = self.model.qpos0[self.qpos_adr]
+            result = self._iterate(home, target_pos, target_quat, self.max_iters - iters, deadline)
+            iters += result[3]
+            if result[1] + result[2] * self.rot_weight < pos_err + rot_err * self.rot_weight:
+                q, pos_err, rot_err, _, converged = result
+
+        self.q = q
+        self.stats = {'iters': iters, 'pos_err': float(pos_err), 'rot_err': float(rot_err),
+                      'time': time.perf_counter() - start, 'converged': converged,
+                      'restarted': restarted}
+        return q.copy()
+
+    def _iterate(self, q, target_pos, target_quat, max_iters, deadline):
+        """DLS iterations from q -> (q, pos_err, rot_err, iters, converged)"""
+        q = np.array(q, dtype=float)
+        weight = self._weight
+        iters = 0
+        last_err = np.inf
+        while True:
+            site_pos = self._error(q, target_pos, target_quat)
+            pos_err = np.linalg.norm(self._err[:3])
+            rot_err = np.linalg.norm(self._err[3:])
+            if pos_err < self.pos_tol and rot_err < self.rot_tol:
+                return q, pos_err, rot_err, iters, True
+            if iters >= max_iters or (deadline is not None and time.perf_counter() >= deadline):
+                return q, pos_err, rot_err, iters, False
+            # Stalled (limits, singularity, unreachable): leave the rest of the budget to the restart
+            total_err = pos_err + rot_err * self.rot_weight
+            if total_err > self.stall_ratio * last_err:
+                return q, pos_err, rot_err, iters, False
+            last_err = total_err
+
+            mujoco.mj_jac(self.model, self.data, self._jacp, self._jacr, site_pos, self.body_id)
+            jac = np.vstack([self._jacp[:, self.dof_adr], self._jacr[:, self.dof_adr]]) * weight[:, None]
+            err = self._err * weight
+            dq = self._dls_step(jac, err)
+
+            # Joint limits: drop joints that are pinned and pushing outwards
+            pinned = ((q <= self.lower) & (dq < 0)) | ((q >= self.upper) & (dq > 0))
+            if pinned.any():
+                jac[:, pinned] = 0.0
+                dq = self._dls_step(jac, err)
+                dq[pinned] = 0.0
+
+            # Keep each iteration in the region where the linearization holds
+            largest = np.abs(dq).max()
+            if largest > self.max_step:
+                dq *= self.max_step / largest
+            q = np.clip(q + dq, self.lower, self.upper)
+            iters += 1
+
+    def _dls_step(self, jac, err):
+        return jac.T @ np.linalg.solve(jac @ jac.T + self._damping_eye, err)
+
+
+# ============================================================================
+# WELD EQUIVALENCE
+# ============================================================================
+def weld_site_target(model, target_pos, target_quat, weld=0, site='ee_site'):
+    """World pose (pos, wxyz quat) the weld `weld` pulls `site` to
+
+    The weld keeps body2 (the mocap target, here at target_pos/target_quat)
+    at a fixed pose relative to body1 (the end effector); inverting that
+    relative pose gives the site target, so the IK reaches the same pose the
+    weld would.
+    """
+    body1 = model.eq_obj1id[weld]
+    rel_pos = model.eq_data[weld, 3:6]
+    rel_quat = model.eq_data[weld, 6:10]
+
+    # body1 = body2 * inverse(relpose)
+    inv_quat = np.zeros(4)
+    mujoco.mju_negQuat(inv_quat, rel_quat)
+    inv_pos = np.zeros(3)
+    mujoco.mju_rotVecQuat(inv_pos, -rel_pos, inv_quat)
+    body_pos = np.zeros(3)
+    body_quat = np.zeros(4)
+    mujoco.mju_mulPose(body_pos, body_quat, np.asarray(target_pos, dtype=float),
+                       np.asarray(target_quat, dtype=float), inv_pos, inv_quat)
+
+    # Site offset inside body1
+    site_id = model.site(site).id
+    if model.site_bodyid[site_id] != body1:
+        raise ValueError(f"site {site!r} is not on the welded body")
+    site_pos = np.zeros(3)
+    site_quat = np.zeros(4)
+    mujoco.mju_mulPose(site_pos, site_quat, body_pos, body_quat,
+                       model.site_pos[site_id], model.site_quat[site_id])
+    return site_pos, site_quat
+
+
+# ============================================================================
+# BENCHMARK
+# ============================================================================
+# Raw XR position of a neutral hand (relative to the headset) - the point the
+# mujoco_sim.py offset maps to the default target
+NEUTRAL_XR = np.array([0.0, -0.3, -0.4])
+
+
+def load_targets(t, pos, quat, model, offset=(0.3, 0.0, 0.7)):
+    """Mocap and site targets for one hand track, as mujoco_sim.py makes them
+
+    The track is re-centred so its first pose sits at the neutral hand
+    position, then mapped to the robot frame (mocap target) and through the
+    weld offset (site target). Quaternions are (w, x, y, z).
+    """
+    from xr_mapping import XRToRobot, to_wxyz
+
+    mapping = XRToRobot(offset=offset)
+    mapped = mapping.map_poses(np.concatenate([pos - pos[0] + NEUTRAL_XR, quat], axis=-1))
+    track = {
+        't': np.asarray(t, dtype=float),
+        'mocap_pos': mapped[:, :3],
+        'mocap_quat': to_wxyz(mapped[:, 3:]),
+        'site_pos': np.zeros((len(t), 3)),
+        'site_quat': np.zeros((len(t), 4)),
+    }
+    for i in range(len(t)):
+        track['site_pos'][i], track['site_quat'][i] = weld_site_target(
+            model, track['mocap_pos'][i], track['mocap_quat'][i])
+    return track
+
+
+def _summary(rows):
+    rows = np.array(rows)
+    return {
+        'time_us': rows[:, 0] * 1e6,
+        'iters': rows[:, 1],
+        'pos_mm': rows[:, 2] * 1e3,
+        'rot_deg': np.degrees(rows[:, 3]),
+        'converged': rows[:, 4].astype(bool),
+    }
+
+
+def benchmark(model, tracks, **ik_params):
+    """Solve every track sample in order (one solve per sample, as per tick)
+
+    'warm' starts each solve from the previous solution, 'cold' from qpos0.
+    'weld' is the physics path for comparison: the mocap target is set and
+    the model stepped until the next sample; its iterations are physics
+    steps and its residual is the site error at the end of the tick.
+    Returns {mode: dict of per-tick arrays}.
+    """
+    results = {}
+    for mode in ('warm', 'cold'):
+        ik = DampedLeastSquaresIK(model, **ik_params)
+        rows = []
+        for track in tracks:
+            ik.reset()
+            for p, q in zip(track['site_pos'], track['site_quat']):
+                if mode == 'cold':
+                    ik.reset()
+                ik.solve(p, q)
+                s = ik.stats
+                rows.append((s['time'], s['iters'], s['pos_err'], s['rot_err'], s['converged']))
+        results[mode] = _summary(rows)
+
+    ik = DampedLeastSquaresIK(model, **ik_params)
+    data = mujoco.MjData(model)
+    mocap = model.body('target').mocapid[0]
+    site_quat = np.zeros(4)
+    rows = []
+    for track in tracks:
+        mujoco.mj_resetData(model, data)
+        t = track['t'] - track['t'][0]
+        for i in range(len(t)):
+            tick_end = t[i + 1] if i + 1 < len(t) else t[i] + model.opt.timestep
+            start = time.perf_counter()
+            data.mocap_pos[mocap] = track['mocap_pos'][i]
+            data.mocap_quat[mocap] = track['mocap_quat'][i]
+            steps = 0
+            while data.time < tick_end:
+                mujoco.mj_step(model, data)
+                steps += 1
+            elapsed = time.perf_counter() - start
+            pos_err = np.linalg.norm(track['site_pos'][i] - data.site_xpos[ik.site_id])
+            mujoco.mju_mat2Quat(site_quat, data.site_xmat[ik.site_id])
+            rot_err = 2.0 * np.arccos(min(abs(np.dot(site_quat, track['site_quat'][i])), 1.0))
+            rows.append((elapsed, steps, pos_err, rot_err, pos_err < ik.pos_tol and rot_err < ik.rot_tol))
+    results['weld'] = _summary(rows)
+    return results
+
+
+def format_benchmark(results):
+    lines = [f"{'mode':<6} {'ticks':>7} {'time us':>16} {'iters':>11} {'pos mm':>15} {'rot deg':>15} {'conv':>6}",
+             f"{'':<6} {'':>7} {'mean/p99':>16} {'mean/max':>11} {'mean/p99':>15} {'mean/p99':>15} {'':>6}"]
+    for mode, r in results.items():
+        lines.append(
+            f"{mode:<6} {len(r['iters']):>7} "
+            f"{r['time_us'].mean():>7.1f}/{np.percentile(r['time_us'], 99):<8.1f} "
+            f"{r['iters'].mean():>5.2f}/{r['iters'].max():<5.0f} "
+            f"{r['pos_mm'].mean():>7.3f}/{np.percentile(r['pos_mm'], 99):<7.3f} "
+            f"{r['rot_deg'].mean():>7.3f}/{np.percentile(r['rot_deg'], 99):<7.3f} "
+            f"{r['converged'].mean():>6.1%}")
+    return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Damped-least-squares IK tools')
+    parser.add_argument('command', choices=['benchmark'])
+    parser.add_argument('paths', nargs='*', help='Session logs recorded with webxr_ros_bridge.py --record')
+    parser.add_argument('--hand', choices=['left', 'right'], default='right')
+    parser.add_argument('--synthetic', type=float, default=0.0, metavar='SECONDS',
+                        help='Add a synthetic hand track of this length (90 Hz)')
+    parser.add_argument('--damping', type=float, default=0.05)
+    parser.add_argument('--max-iters', type=int, default=20)
+    parser.add_argument('--time-budget', type=float, default=1.0, help='Per-solve budget (ms)')
+    args = parser.parse_args()
+
+    from mujoco_sim import load_model
+
+    model = load_model()
+    tracks = []
+    for path in args.paths:
+        from pose_predictor import load_track
+        t, pos, quat = load_track(path, args.hand)
+        tracks.append(load_targets(t, pos, quat, model))
+        print(f"{path}: {len(t)} {args.hand} hand poses")
+    if args.synthetic > 0:
+        from synthetic_quest import generate_trajectory
+        t, poses, _, _ = generate_trajectory(args.synthetic, 90.0)
+        hand = 0 if args.hand == 'left' else 1
+        tracks.append(load_targets(t, poses[:, hand, :3], poses[:, hand, 3:], model))
+        print(f"synthetic: {len(t)} {args.hand} hand poses")
+    if not tracks:
+        raise SystemExit("Nothing to benchmark: pass session logs and/or --synthetic SECONDS")
+
+    results = benchmark(model, tracks, damping=args.damping, max_iters=args.max_iters,
+                        time_budget=args.time_budget / 1e3)
+    print(format_benchmark(results))
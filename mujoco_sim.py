@@ -1,18 +1,48 @@
-import rclpy
-from rclpy.node import Node
-from geometry_msgs.msg import PoseStamped
+import argparse
+try:
+    import rclpy
+    from rclpy.node import Node
+    from geometry_msgs.msg import PoseStamped
+    from sensor_msgs.msg import Joy, JoyFeedback, JoyFeedbackArray
+    ROS_AVAILABLE = True
+except ImportError:
+    # No ROS 2 install: the sim still runs from shared memory (--shm)
+    from ros_stub import rclpy, Node, PoseStamped, Joy, JoyFeedback, JoyFeedbackArray
+    ROS_AVAILABLE = False
+import hashlib
+import os
 import mujoco
-import mujoco.viewer
 import numpy as np
 import time
 import threading
-from scipy.spatial.transform import Rotation as R
+
+from haptics import HAPTIC_TOPIC
+from jitter_buffer import make_jitter_buffer
+from mujoco_ik import DampedLeastSquaresIK, weld_site_target
+from pose_filter import FILTERS, make_filter
+from pose_predictor import PREDICTORS, make_predictor, stamp_to_sec
+from reachability import CACHE_DIR, mujoco_map
+from ros_qos import add_qos_arguments, make_qos
+from shm_transport import DEFAULT_NAME as DEFAULT_SHM_NAME, SharedStateReader
+from telemetry import LatencyStats
+from tracing import TRACER, install_signals, traced
+from xr_mapping import XRToRobot, to_wxyz
+from xr_protocol import COMBINED_TOPIC, ProtocolError, combined_hand
+
+RIGHT_HAND = 1  # index in the shared-memory state (left, right)
+REPORT_PERIOD = 5.0  # s between loop statistics
+MAX_LAG = 0.05  # s behind schedule before the sim stops catching up
+HAPTIC_FULL_SCALE = 300.0  # N of arm contact force for a full-strength pulse
+HAPTIC_MIN_INTENSITY = 0.2  # weakest pulse, so a light touch is still felt
 
 # Dummy Robot Arm with IK via Equality Constraint
 # We use a 'mocap' body as the target, and 'weld' the end-effector to it.
-# The physics engine solves the IK automatically.
+# The physics engine solves the IK automatically. With --ik dls the weld is
+# switched off and mujoco_ik.py solves for the joints explicitly instead.
 xml = """
 <mujoco>
+  <!-- Joint ranges below are in radians (MuJoCo defaults to degrees) -->
+  <compiler angle="radian"/>
   <option gravity="0 0 -9.81" integrator="implicitfast"/>
   
   <default>
@@ -79,136 +109,480 @@ xml = """
 
   <equality>
     <!-- Soft Weld: Pulls the end-effector towards the target -->
-    <!-- This acts as our Inverse Kinematics solver -->
-    <weld body1="end_effector" body2="target" solref="0.02 1" solimp=".9 .95 0.001"/>
+    <!-- This acts as our Inverse Kinematics solver (mujoco_ik.py is the explicit alternative) -->
+    <!-- relpose: end effector coincides with the target (default would keep the qpos0 offset) -->
+    <weld body1="end_effector" body2="target" relpose="0 0 0 1 0 0 0" solref="0.02 1" solimp=".9 .95 0.001"/>
   </equality>
 </mujoco>
 """
 
-class MujocoSim(Node):
-    def __init__(self):
-        super().__init__('mujoco_sim')
-        self.subscription = self.create_subscription(
-            PoseStamped,
-            '/quest/right_hand/pose',
-            self.listener_callback,
-            10)
+def load_model(xml_string=xml, cache_dir=None):
+    """Compiled model of an MJCF string, cached as MJB next to the reachability maps
+
+    Keyed by the XML and the MuJoCo version (MJB files are not portable
+    across versions); only valid for self-contained XML (no asset files).
+    An unwritable cache just means compiling every time.
+    """
+    digest = hashlib.sha256(f"{mujoco.__version__}:{xml_string}".encode()).hexdigest()
+    path = os.path.join(cache_dir or CACHE_DIR, f"model-{digest[:16]}.mjb")
+    if os.path.exists(path):
+        try:
+            return mujoco.MjModel.from_binary_path(path)
+        except ValueError:
+            pass  # truncated or foreign file: rebuild it
+    model = mujoco.MjModel.from_xml_string(xml_string)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Sweep workers may race on a cold cache: write aside, then rename
+        tmp = f"{path}.{os.getpid()}.tmp"
+        mujoco.mj_saveModel(model, tmp, None)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+    return model
+
+
+def arm_reachability(**kwargs):
+    """Reachability map of this arm (built once, then loaded from the cache)"""
+    return mujoco_map(load_model(), **kwargs)
+
+
+class ArmSim:
+    """Arm, target and pose pipeline without any ROS or viewer dependency
+
+    Poses go in through receive_pose(); control_tick() moves the target and
+    advances the model by one tick. MujocoSim adds the pose sources, the
+    real-time loop and the viewer; sweep_teleop.py drives it offline.
+    """
+
+    def __init__(self, predictor=None, predict_horizon=0.0, pose_filter=None,
+                 ik='weld', ik_params=None, substeps=5, pos_offset=(0.3, 0.0, 0.7),
+                 pos_scale=1.0, workspace=None, weld_solref=None, weld_solimp=None,
+                 jitter_buffer=None, reachability=None, now_fn=time.time):
+        # Optional filter stage applied to every received pose (tremor removal)
+        self.pose_filter = pose_filter
+        
+        # Optional latency compensation: poses are fed to the predictor as they
+        # arrive and the sim loop extrapolates to (now + predict_horizon)
+        self.predictor = predictor
+        self.predict_horizon = predict_horizon
+        self.predictor_lock = threading.Lock()
+        self.now_fn = now_fn  # clock of the pose stamps (sim time when offline)
+        
+        # Optional jitter buffer: poses are queued by capture time and the
+        # target is interpolated at (now - delay) every tick, however they arrive
+        self.jitter_buffer = jitter_buffer
         
         # Initial target position (reachable by the arm)
         self.target_pos = np.array([0.4, 0.0, 0.4])
         self.target_quat = np.array([1.0, 0.0, 0.0, 0.0])
         
-        # Load Model
-        self.model = mujoco.MjModel.from_xml_string(xml)
+        # Load Model (compiled once, then loaded from the MJB cache)
+        self.model = load_model()
         self.data = mujoco.MjData(self.model)
+        if weld_solref is not None:
+            self.model.eq_solref[0] = weld_solref
+        if weld_solimp is not None:
+            self.model.eq_solimp[0, :len(weld_solimp)] = weld_solimp
         
         self.target_id = self.model.body('target').mocapid[0]
         
-        # Offset to map Quest space to Robot space
-        # Quest origin might be at floor, Robot base is at floor (0,0,0)
-        # We might need to shift the input so it's in the robot's workspace
-        self.pos_offset = np.array([0.5, 0.0, 0.0]) 
-
-    def listener_callback(self, msg):
-        # Map ROS Pose (OpenXR Data) to MuJoCo Coordinate System
-        # OpenXR VIEW Space: +X (Right), +Y (Up), -Z (Forward)
-        # MuJoCo/Robot Frame: +X (Forward), +Y (Left), +Z (Up)
-        
-        # Mapping:
-        # Robot X (Forward) = -XR Z (Forward)
-        # Robot Y (Left)    = -XR X (Left)
-        # Robot Z (Up)      =  XR Y (Up)
-        
-        # Raw data from ROS topic (which is just raw OpenXR data)
-        xr_x = msg.pose.position.x
-        xr_y = msg.pose.position.y
-        xr_z = msg.pose.position.z
-        
-        # Apply Rotation/Mapping
-        mapped_x = -xr_z
-        mapped_y = -xr_x
-        mapped_z =  xr_y
-        
-        # Apply Offset
-        # We want the "neutral" hand position to be in the robot's workspace.
-        # Neutral Hand (relative to headset): ~0.3m down, ~0.4m forward
-        # XR Coords: X=0, Y=-0.3, Z=-0.4
-        # Mapped: X=0.4, Y=0, Z=-0.3
-        # Robot Base is at Z=0. We want hand at Z=0.4 (above table).
-        # So we need Z offset of +0.7
-        
-        self.pos_offset = np.array([0.3, 0.0, 0.7]) # Adjust X to push it further forward if needed
-        
-        self.target_pos = np.array([mapped_x, mapped_y, mapped_z]) + self.pos_offset
-        
-        self.target_pos = np.array([mapped_x, mapped_y, mapped_z]) + self.pos_offset
+        # Control tick: target update (+ IK) once, then `substeps` physics steps
+        self.substeps = substeps
+        self.tick_dt = substeps * self.model.opt.timestep
         
-        # Orientation Mapping
-        # We need to transform the rotation from XR frame to MJ frame.
-        # T is the basis change matrix we derived for position:
-        # [[ 0,  0, -1],
-        #  [-1,  0,  0],
-        #  [ 0,  1,  0]]
+        # IK: soft weld (physics) or explicit damped least squares. The DLS
+        # solution is applied kinematically, one solve per control tick.
+        self.ik = None
+        self.ik_stats = []
+        if ik == 'dls':
+            self.ik = DampedLeastSquaresIK(self.model, **(ik_params or {}))
+            self.data.eq_active[:] = 0
         
-        T = np.array([[0, 0, -1], [-1, 0, 0], [0, 1, 0]])
-        
-        # Create Rotation object from XR quaternion (x, y, z, w)
-        r_xr = R.from_quat([
-            msg.pose.orientation.x,
-            msg.pose.orientation.y,
-            msg.pose.orientation.z,
-            msg.pose.orientation.w
-        ])
-        
-        # Convert to matrix
-        mat_xr = r_xr.as_matrix()
-        
-        # Apply basis change: R_mj = T @ R_xr @ T.T
-        mat_mj = T @ mat_xr @ T.T
+        # Offset to map Quest space to Robot space
+        # Neutral hand (relative to headset): ~0.3m down, ~0.4m forward
+        # XR: (0, -0.3, -0.4) -> mapped: (0.4, 0, -0.3). Robot base is at Z=0 and
+        # we want the hand at Z=0.4 (above table), so Z offset is +0.7
+        self.pos_offset = np.array(pos_offset, dtype=float) # Adjust X to push it further forward if needed
+        self.mapping = XRToRobot(scale=pos_scale, offset=self.pos_offset)
         
-        # Convert back to quaternion (x, y, z, w)
-        r_mj = R.from_matrix(mat_mj)
-        quat_mj = r_mj.as_quat()
+        # Optional workspace box (min, max) the target is clamped to
+        self.workspace = None if workspace is None else np.asarray(workspace, dtype=float)
+        self.target_updates = 0
+        self.clamped_updates = 0
         
+        # Optional reachability map (reachability.py): unreachable targets are
+        # projected onto the nearest reachable pose. The weld relpose is the
+        # identity, so the mocap target is the ee_site pose the map indexes.
+        self.reachability = reachability
+        self.projected_updates = 0
+
+    def receive_pose(self, stamp, xr_pos, xr_quat):
+        """New hand pose (stamp = capture time in host seconds)"""
+        if self.pose_filter is not None:
+            xr_pos, xr_quat = self.pose_filter.filter(stamp, xr_pos, xr_quat)
+        if self.jitter_buffer is not None:
+            self.jitter_buffer.update(stamp, xr_pos, xr_quat, self.now_fn())
+            return
+        if self.predictor is None:
+            self.set_target_from_xr(xr_pos, xr_quat)
+            return
+        with self.predictor_lock:
+            self.predictor.update(stamp, xr_pos, xr_quat)
+
+    def apply_prediction(self):
+        """Move the target to the pose predicted for the current step"""
+        with self.predictor_lock:
+            if not self.predictor.ready:
+                return
+            xr_pos, xr_quat = self.predictor.predict(self.now_fn() + self.predict_horizon)
+        self.set_target_from_xr(xr_pos, xr_quat)
+
+    def apply_playout(self):
+        """Move the target to the buffered pose at the playout time"""
+        if self.jitter_buffer.ready:
+            self.set_target_from_xr(*self.jitter_buffer.sample(self.now_fn()))
+
+    def set_target_from_xr(self, xr_pos, xr_quat):
+        """Set the mocap target from a raw XR position and (x, y, z, w) quaternion"""
+        # OpenXR (+X right, +Y up, -Z forward) -> MuJoCo (+X forward, +Y left, +Z up),
+        # precomputed in xr_mapping.py
+        target_pos, target_quat = self.mapping.map_pose(xr_pos, xr_quat)
+        self.target_updates += 1
+        if self.workspace is not None:
+            clamped = np.clip(target_pos, self.workspace[0], self.workspace[1])
+            if not np.array_equal(clamped, target_pos):
+                self.clamped_updates += 1
+            target_pos = clamped
         # MuJoCo expects (w, x, y, z)
-        self.target_quat = np.array([quat_mj[3], quat_mj[0], quat_mj[1], quat_mj[2]])
+        target_quat = to_wxyz(target_quat)
+        if self.reachability is not None:
+            target_pos, target_quat, projected = self.reachability.project(target_pos, target_quat)
+            self.projected_updates += projected
+        self.target_pos = target_pos
+        self.target_quat = target_quat
+
+    @traced('sim.ik')
+    def step_ik(self):
+        """Solve the arm onto the target and set the joints directly"""
+        site_pos, site_quat = weld_site_target(self.model, self.target_pos, self.target_quat)
+        q = self.ik.solve(site_pos, site_quat)
+        self.data.qpos[self.ik.qpos_adr] = q
+        self.data.qvel[:] = 0.0
+        mujoco.mj_forward(self.model, self.data)
+        self.data.time += self.tick_dt
+        
+        s = self.ik.stats
+        self.ik_stats.append((s['time'], s['iters'], s['pos_err'], s['rot_err']))
+
+    def contact_force(self):
+        """Total normal force (N) of the arm's contacts (floor or itself)
+
+        The target has no collision geometry and the base sits on the
+        floor as a child of the world (excluded), so only arm contacts count.
+        """
+        force = np.zeros(6)
+        total = 0.0
+        for i in range(self.data.ncon):
+            mujoco.mj_contactForce(self.model, self.data, i, force)
+            total += abs(force[0])
+        return total
+
+    def control_tick(self):
+        """One control tick: refresh the target, then advance the sim by tick_dt"""
+        if self.jitter_buffer is not None:
+            self.apply_playout()
+        elif self.predictor is not None:
+            self.apply_prediction()
+
+        # Update Mocap Target
+        self.data.mocap_pos[self.target_id] = self.target_pos
+        self.data.mocap_quat[self.target_id] = self.target_quat
+
+        if self.ik is not None:
+            self.step_ik()
+        else:
+            # Step physics
+            with TRACER.span('sim.mj_step'):
+                mujoco.mj_step(self.model, self.data, nstep=self.substeps)
+
+
+class RealtimeSimNode(Node):
+    """Real-time loop, viewer and loop statistics shared by the sim nodes
+
+    Subclasses provide model, data, tick_dt, substeps, control_tick(),
+    ik_stats and haptic_pulses; pipeline_reports() adds their own lines to
+    the periodic report.
+    """
+
+    def __init__(self, name):
+        Node.__init__(self, name)
+        # Loop statistics, reported every REPORT_PERIOD seconds of wall time
+        self.tick_time = LatencyStats('tick')
+        self.render_time = LatencyStats('render')
+        self.late_ticks = 0
+
+    def pipeline_reports(self):
+        return []
+
+    def report_stats(self, wall_elapsed, sim_elapsed):
+        """Log real-time factor, tick/render cost and IK statistics"""
+        rtf = sim_elapsed / wall_elapsed if wall_elapsed > 0 else 0.0
+        tick = self.tick_time.summary()
+        msg = (f"RTF {rtf:.2f}, {tick['count']} ticks ({self.tick_dt * 1e3:.0f} ms, {self.substeps} substeps) "
+               f"p50 {tick.get('p50_ms', 0):.2f} p99 {tick.get('p99_ms', 0):.2f} ms, "
+               f"late {self.late_ticks}, haptic pulses {self.haptic_pulses}")
+        render = self.render_time.summary()
+        if render['count']:
+            msg += f", {render['count']} renders p50 {render['p50_ms']:.2f} p99 {render['p99_ms']:.2f} ms"
+        self.get_logger().info(msg)
+        for line in self.pipeline_reports():
+            self.get_logger().info(line)
+        if TRACER.enabled:
+            self.get_logger().info(TRACER.format())
+        if self.ik_stats:
+            stats = np.array(self.ik_stats)
+            self.get_logger().info(
+                f"IK: {len(stats)} solves, {stats[:, 0].mean() * 1e6:.0f} us "
+                f"(p99 {np.percentile(stats[:, 0], 99) * 1e6:.0f}), {stats[:, 1].mean():.1f} iters, "
+                f"residual {stats[:, 2].mean() * 1e3:.2f} mm (max {stats[:, 2].max() * 1e3:.1f}) / "
+                f"{np.degrees(stats[:, 3].mean()):.2f} deg")
+        self.tick_time.reset()
+        self.render_time.reset()
+        self.late_ticks = 0
+        self.haptic_pulses = 0
+        self.ik_stats = []
+
+    def run_sim(self, headless=False, render_rate=60.0, realtime=True, duration=None):
+        """Run control ticks on a fixed real-time schedule
 
-    def run_sim(self):
+        Ticks are scheduled against absolute deadlines, so a slow tick is
+        made up by the following ones instead of shifting the clock; a
+        tick more than MAX_LAG behind is dropped from the schedule. The
+        viewer (unless headless) is synced at render_rate, independent of
+        the physics rate. realtime=False runs ticks back to back.
+        """
         print("Starting MuJoCo Simulation...")
         print("Green Sphere = Your Hand Target")
         print("Robot Arm = Tries to reach the target")
+        print(f"Control tick {self.tick_dt * 1e3:.1f} ms ({self.substeps} x {self.model.opt.timestep * 1e3:.1f} ms), "
+              f"{'headless' if headless else f'viewer at {render_rate:.0f} Hz'}")
         
-        with mujoco.viewer.launch_passive(self.model, self.data) as viewer:
-            while viewer.is_running() and rclpy.ok():
-                step_start = time.time()
+        viewer = None
+        if not headless:
+            import mujoco.viewer
+            viewer = mujoco.viewer.launch_passive(self.model, self.data)
+        render_dt = 1.0 / render_rate
+        try:
+            start = time.perf_counter()
+            next_tick = next_render = report_time = start
+            report_sim_time = self.data.time
+            while rclpy.ok() and (viewer is None or viewer.is_running()):
+                now = time.perf_counter()
+                if duration is not None and now - start >= duration:
+                    break
 
-                # Update Mocap Target
-                self.data.mocap_pos[self.target_id] = self.target_pos
-                self.data.mocap_quat[self.target_id] = self.target_quat
+                self.control_tick()
+                self.tick_time.record(time.perf_counter() - now)
 
-                # Step physics
-                mujoco.mj_step(self.model, self.data)
+                now = time.perf_counter()
+                if viewer is not None and now >= next_render:
+                    with TRACER.span('sim.viewer_sync'):
+                        viewer.sync()
+                    self.render_time.record(time.perf_counter() - now)
+                    next_render = max(next_render + render_dt, now)
 
-                # Sync viewer
-                viewer.sync()
+                now = time.perf_counter()
+                if now - report_time >= REPORT_PERIOD:
+                    self.report_stats(now - report_time, self.data.time - report_sim_time)
+                    report_time, report_sim_time = now, self.data.time
 
                 # Maintain real-time
-                time_until_next_step = self.model.opt.timestep - (time.time() - step_start)
-                if time_until_next_step > 0:
-                    time.sleep(time_until_next_step)
+                if realtime:
+                    next_tick += self.tick_dt
+                    delay = next_tick - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    elif -delay > MAX_LAG:
+                        self.late_ticks += 1
+                        next_tick = time.perf_counter()
+        finally:
+            if viewer is not None:
+                viewer.close()
+
+
+class MujocoSim(RealtimeSimNode, ArmSim):
+    """ROS node running ArmSim in real time with a viewer"""
+
+    def __init__(self, shm_name=None, combined=False, qos=None, haptic_full_scale=HAPTIC_FULL_SCALE,
+                 **sim_params):
+        RealtimeSimNode.__init__(self, 'mujoco_sim')
+        ArmSim.__init__(self, **sim_params)
+        
+        # Pose source: shared memory from the bridge (same host), or ROS topic
+        # (per-hand pose, or the combined frame of bridge --topics combined/both)
+        self.shm_reader = None
+        qos = qos if qos is not None else make_qos()
+        if shm_name:
+            self.shm_reader = SharedStateReader(shm_name)
+            self.get_logger().info(f"Reading right hand pose from shared memory: {shm_name}")
+        elif combined:
+            self.subscription = self.create_subscription(
+                Joy,
+                f'/quest/{COMBINED_TOPIC}',
+                self.frame_callback,
+                qos)
+        else:
+            self.subscription = self.create_subscription(
+                PoseStamped,
+                '/quest/right_hand/pose',
+                self.listener_callback,
+                qos)
+        
+        # Arm contacts are sent back as pulses on the right controller (0 disables)
+        self.haptic_full_scale = haptic_full_scale
+        self.haptic_pub = None
+        self.haptic_pulses = 0
+        if haptic_full_scale > 0:
+            self.haptic_pub = self.create_publisher(JoyFeedbackArray, f'/quest/{HAPTIC_TOPIC}', qos)
+
+    @traced('sim.pose_callback')
+    def listener_callback(self, msg):
+        p = msg.pose.position
+        o = msg.pose.orientation
+        self.receive_pose(stamp_to_sec(msg.header.stamp), (p.x, p.y, p.z), (o.x, o.y, o.z, o.w))
+
+    @traced('sim.frame_callback')
+    def frame_callback(self, msg):
+        try:
+            _, pose, _, _ = combined_hand(msg.axes, msg.buttons, RIGHT_HAND)
+        except ProtocolError as e:
+            self.get_logger().warn(str(e))
+            return
+        if pose is not None:
+            self.receive_pose(stamp_to_sec(msg.header.stamp), pose[:3], pose[3:])
+
+    @traced('sim.poll_shared_state')
+    def poll_shared_state(self):
+        """Pull the right hand pose from shared memory if it changed"""
+        if self.shm_reader.read() and self.shm_reader.updated()[RIGHT_HAND]:
+            pose, _, _, stamp = self.shm_reader.hand(RIGHT_HAND)
+            self.receive_pose(stamp, pose[:3], pose[3:])
+
+    @traced('sim.tick')
+    def control_tick(self):
+        """Pull the latest shared-memory pose, run one tick, report contacts"""
+        if self.shm_reader is not None:
+            self.poll_shared_state()
+        ArmSim.control_tick(self)
+        if self.haptic_pub is not None:
+            self.publish_contact()
+
+    def publish_contact(self):
+        """One pulse command per tick while the arm touches something
+        (the bridge merges them into its send rate)"""
+        force = self.contact_force()
+        if force <= 0.0:
+            return
+        intensity = min(max(force / self.haptic_full_scale, HAPTIC_MIN_INTENSITY), 1.0)
+        msg = JoyFeedbackArray()
+        msg.array = [JoyFeedback(type=JoyFeedback.TYPE_RUMBLE, id=RIGHT_HAND, intensity=float(intensity))]
+        self.haptic_pub.publish(msg)
+        self.haptic_pulses += 1
+
+    def pipeline_reports(self):
+        return [stage.format() for stage in (self.jitter_buffer, self.reachability) if stage is not None]
 
 def main(args=None):
-    rclpy.init(args=args)
-    sim_node = MujocoSim()
+    parser = argparse.ArgumentParser(description='MuJoCo teleop verification')
+    parser.add_argument('--shm', nargs='?', const=DEFAULT_SHM_NAME, metavar='NAME',
+                        help='Read poses from the bridge shared memory instead of ROS')
+    parser.add_argument('--predict', choices=['none'] + list(PREDICTORS), default='none',
+                        help='Compensate pipeline latency by extrapolating the hand pose')
+    parser.add_argument('--predict-horizon', type=float, default=0.0, metavar='MS',
+                        help='Extra lead on top of the measured capture latency (ms)')
+    parser.add_argument('--jitter-buffer', type=float, default=0.0, metavar='MS',
+                        help='Play poses out this far behind real time, interpolated every tick '
+                             '(smooth target under network jitter; 0 = write on arrival)')
+    parser.add_argument('--filter', choices=['none'] + list(FILTERS), default='none',
+                        help='Filter stage for received poses (see pose_filter.py)')
+    parser.add_argument('--filter-min-cutoff', type=float, default=1.0,
+                        help='One-Euro cutoff when the hand is still (Hz)')
+    parser.add_argument('--filter-beta', type=float, default=50.0,
+                        help='One-Euro position cutoff gain (Hz per m/s)')
+    parser.add_argument('--ik', choices=['weld', 'dls'], default='weld',
+                        help='Soft weld constraint (physics) or damped-least-squares IK (mujoco_ik.py)')
+    parser.add_argument('--ik-iters', type=int, default=20, help='DLS iteration budget per step')
+    parser.add_argument('--ik-budget', type=float, default=1.0, metavar='MS',
+                        help='DLS time budget per step (ms)')
+    parser.add_argument('--ik-damping', type=float, default=0.05, help='DLS damping')
+    parser.add_argument('--substeps', type=int, default=5,
+                        help='Physics steps per control tick (tick = substeps x timestep)')
+    parser.add_argument('--render-rate', type=float, default=60.0, help='Viewer sync rate (Hz)')
+    parser.add_argument('--headless', action='store_true', help='Run without the viewer')
+    parser.add_argument('--no-realtime', action='store_true', help='Run ticks back to back (benchmarking)')
+    parser.add_argument('--duration', type=float, help='Stop after this many seconds of wall time')
+    parser.add_argument('--combined', action='store_true',
+                        help=f'Subscribe to the combined /quest/{COMBINED_TOPIC} message '
+                             '(bridge --topics combined/both) instead of the per-hand pose')
+    parser.add_argument('--haptic-full-scale', type=float, default=HAPTIC_FULL_SCALE, metavar='N',
+                        help=f'Arm contact force for a full-strength controller pulse (0 disables, '
+                             f'commands go to /quest/{HAPTIC_TOPIC})')
+    parser.add_argument('--reachability', action='store_true',
+                        help='Project unreachable targets onto the nearest reachable pose '
+                             '(map built once and cached, see reachability.py)')
+    parser.add_argument('--bimanual', action='store_true',
+                        help='Two arms driven by both hands in one batch per tick (bimanual_sim.py)')
+    parser.add_argument('--trace', action='store_true',
+                        help='Time callbacks, mj_step, IK and viewer sync from startup '
+                             '(otherwise SIGUSR1 starts it, see tracing.py)')
+    add_qos_arguments(parser)
+    cli_args, ros_args = parser.parse_known_args(args)
+    if cli_args.jitter_buffer and cli_args.predict != 'none':
+        parser.error("--jitter-buffer and --predict are alternatives: pick one")
+    if cli_args.bimanual and (cli_args.jitter_buffer or cli_args.predict != 'none' or cli_args.reachability):
+        parser.error("--bimanual does not support --jitter-buffer, --predict or --reachability")
+    
+    if cli_args.trace:
+        TRACER.enable()
+    install_signals()
+    
+    rclpy.init(args=ros_args)
+    pipeline = dict(pose_filter=make_filter(cli_args.filter, min_cutoff=cli_args.filter_min_cutoff,
+                                            beta=cli_args.filter_beta),
+                    ik=cli_args.ik,
+                    ik_params={'max_iters': cli_args.ik_iters, 'time_budget': cli_args.ik_budget / 1e3,
+                               'damping': cli_args.ik_damping},
+                    substeps=cli_args.substeps)
+    if cli_args.bimanual:
+        from bimanual_sim import BimanualMujocoSim
+        sim_node = BimanualMujocoSim(shm_name=cli_args.shm, combined=cli_args.combined,
+                                     qos=make_qos(cli_args.qos, cli_args.qos_depth),
+                                     haptic_full_scale=cli_args.haptic_full_scale, **pipeline)
+    else:
+        sim_node = MujocoSim(shm_name=cli_args.shm, combined=cli_args.combined,
+                             qos=make_qos(cli_args.qos, cli_args.qos_depth),
+                             haptic_full_scale=cli_args.haptic_full_scale,
+                             predictor=make_predictor(cli_args.predict),
+                             predict_horizon=cli_args.predict_horizon / 1e3,
+                             jitter_buffer=make_jitter_buffer(cli_args.jitter_buffer),
+                             reachability=arm_reachability(log=print) if cli_args.reachability else None,
+                             **pipeline)
     
-    spin_thread = threading.Thread(target=rclpy.spin, args=(sim_node,), daemon=True)
-    spin_thread.start()
+    if ROS_AVAILABLE:
+        spin_thread = threading.Thread(target=rclpy.spin, args=(sim_node,), daemon=True)
+        spin_thread.start()
+    elif cli_args.shm is None:
+        sim_node.get_logger().warn("rclpy not available: no pose source, use --shm")
     
     try:
-        sim_node.run_sim()
+        sim_node.run_sim(headless=cli_args.headless, render_rate=cli_args.render_rate,
+                         realtime=not cli_args.no_realtime, duration=cli_args.duration)
     except KeyboardInterrupt:
         pass
     finally:
+        if sim_node.shm_reader is not None:
+            sim_node.shm_reader.close()
         sim_node.destroy_node()
         rclpy.shutdown()
 
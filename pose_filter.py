@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Controller Pose Filtering
+
+One-Euro filter on SE(3): a low-pass whose cutoff rises with speed, so a
+still hand loses its tremor while fast motion passes with almost no lag
+(Casiez et al., "1€ Filter", CHI 2012).
+
+Position uses the speed of the (filtered) linear velocity. Orientation is
+filtered on the rotation vector of the shortest rotation from the current
+estimate to the new sample, so q and -q give the same result and the
+estimate stays a unit quaternion.
+
+Vectorized: pos (..., 3) and quat (..., 4) may carry any leading batch
+shape (e.g. both hands at once), with one time for the batch or one per
+row; filter_track() runs a whole recorded sequence in one call.
+
+Usage:
+    python pose_filter.py evaluate session.qlog
+    python pose_filter.py evaluate session.qlog --min-cutoff 0.5 --beta 10
+"""
+
+import argparse
+
+import numpy as np
+
+from xr_mapping import quat_conjugate, quat_multiply, quat_to_rotvec, rotvec_to_quat, vector_norm
+
+
+def _alpha(cutoff, dt):
+    """Smoothing factor of a first-order low-pass at `cutoff` Hz for step dt"""
+    tau = 1.0 / (2.0 * np.pi * cutoff)
+    return 1.0 / (1.0 + tau / dt)
+
+
+class OneEuroPoseFilter:
+    """Speed-adaptive low-pass for position + orientation
+
+    min_cutoff / rot_min_cutoff (Hz) set the smoothing when still; beta
+    (Hz per m/s) and rot_beta (Hz per rad/s) how fast the cutoff opens up
+    with speed; d_cutoff (Hz) smooths the speed estimate itself.
+    """
+
+    def __init__(self, min_cutoff=1.0, beta=50.0, rot_min_cutoff=1.0, rot_beta=10.0, d_cutoff=1.0):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.rot_min_cutoff = rot_min_cutoff
+        self.rot_beta = rot_beta
+        self.d_cutoff = d_cutoff
+        self.reset()
+
+    def reset(self):
+        self.t = None
+        self.pos = None
+        self.quat = None
+        self.vel = None
+        self.omega = None
+
+    def filter(self, t, pos, quat):
+        """Filter one sample taken at time t (seconds) -> (pos, quat)
+
+        For a batch, t may also hold one time per row (shape pos.shape[:-1],
+        e.g. hands reported at different times): rows whose time has not
+        advanced keep their estimate.
+        """
+        pos = np.asarray(pos, dtype=float)
+        quat = np.asarray(quat, dtype=float)
+        if self.t is None:
+            self.t = np.array(t, dtype=float) if np.ndim(t) else t
+            self.pos = pos.copy()
+            self.quat = quat / vector_norm(quat)
+            self.vel = np.zeros_like(pos)
+            self.omega = np.zeros_like(pos)
+            return self.pos.copy(), self.quat.copy()
+
+        if not np.ndim(t) and not np.ndim(self.t):
+            dt = t - self.t
+            if dt <= 0:
+                # Duplicate or out-of-order sample
+                return self.pos.copy(), self.quat.copy()
+            self.pos, self.quat, self.vel, self.omega = self._step(
+                dt, pos, quat, self.pos, self.quat, self.vel, self.omega)
+            self.t = t
+            return self.pos.copy(), self.quat.copy()
+
+        # Per-row times: step only the rows with a new sample
+        t = np.array(t, dtype=float)
+        dt = t - self.t
+        fresh = dt > 0
+        if fresh.all():
+            self.pos, self.quat, self.vel, self.omega = self._step(
+                dt[..., None], pos, quat, self.pos, self.quat, self.vel, self.omega)
+            self.t = t
+            return self.pos.copy(), self.quat.copy()
+        if fresh.any():
+            state = [np.array(x) for x in (self.pos, self.quat, self.vel, self.omega)]
+            stepped = self._step(dt[fresh][:, None], pos[fresh], quat[fresh], *(x[fresh] for x in state))
+            for x, new in zip(state, stepped):
+                x[fresh] = new
+            self.pos, self.quat, self.vel, self.omega = state
+        self.t = np.where(fresh, t, self.t)
+        return self.pos.copy(), self.quat.copy()
+
+    def _step(self, dt, pos, quat, prev_pos, prev_quat, vel, omega):
+        """One filter update from the previous estimate -> (pos, quat, vel, omega)"""
+        a_d = _alpha(self.d_cutoff, dt)
+
+        # Position
+        vel = vel + a_d * ((pos - prev_pos) / dt - vel)
+        speed = vector_norm(vel)
+        pos = prev_pos + _alpha(self.min_cutoff + self.beta * speed, dt) * (pos - prev_pos)
+
+        # Orientation: step a fraction of the shortest rotation towards the sample
+        delta = quat_to_rotvec(quat_multiply(quat, quat_conjugate(prev_quat)))
+        omega = omega + a_d * (delta / dt - omega)
+        rot_speed = vector_norm(omega)
+        a_r = _alpha(self.rot_min_cutoff + self.rot_beta * rot_speed, dt)
+        quat = quat_multiply(rotvec_to_quat(a_r * delta), prev_quat)
+        quat /= vector_norm(quat)
+        return pos, quat, vel, omega
+
+    def filter_track(self, t, pos, quat):
+        """Filter a whole sequence: t (T,), pos (T, ..., 3), quat (T, ..., 4)"""
+        out_pos = np.empty(np.shape(pos))
+        out_quat = np.empty(np.shape(quat))
+        for i in range(len(t)):
+            out_pos[i], out_quat[i] = self.filter(t[i], pos[i], quat[i])
+        return out_pos, out_quat
+
+
+FILTERS = {
+    'one_euro': OneEuroPoseFilter,
+}
+
+
+def make_filter(kind, **kwargs):
+    """Build a pose filter by name; None or 'none' disables filtering"""
+    if kind in (None, 'none'):
+        return None
+    return FILTERS[kind](**kwargs)
+
+
+# ============================================================================
+# OFFLINE EVALUATION
+# ============================================================================
+def evaluate(t, pos, quat, pose_filter, still_speed=0.05, window=9):
+    """Jitter when still and tracking error when moving, raw vs filtered
+
+    Jitter is the RMS deviation from a centered moving average (the
+    tremor/noise the filter should remove); tracking error is the mean
+    distance to the raw pose while the hand moves faster than still_speed
+    (lag shows up here). Returns {'raw': {...}, 'filtered': {...}}.
+    """
+    filt_pos, filt_quat = pose_filter.filter_track(t, pos, quat)
+    kernel = np.ones(window) / window
+    half = window // 2
+    smooth = np.stack([np.convolve(pos[:, k], kernel, mode='same') for k in range(3)], axis=-1)
+    speed = np.linalg.norm(np.gradient(smooth, t, axis=0), axis=-1)
+    inner = np.zeros(len(t), dtype=bool)
+    inner[half:len(t) - half] = True
+    still = inner & (speed < still_speed)
+    moving = inner & ~still
+
+    def stats(p, q):
+        angle = np.degrees(2 * np.arccos(np.clip(np.abs(np.sum(q * quat, axis=-1)), 0.0, 1.0)))
+        return {
+            'jitter_mm': float(np.sqrt(np.mean(np.sum((p - smooth)[still] ** 2, axis=-1))) * 1e3) if still.any() else None,
+            'track_mm': float(np.mean(np.linalg.norm(p - pos, axis=-1)[moving]) * 1e3) if moving.any() else None,
+            'track_deg': float(np.mean(angle[moving])) if moving.any() else None,
+        }
+
+    return {
+        'still_frac': float(still.sum() / max(inner.sum(), 1)),
+        'raw': stats(pos, quat),
+        'filtered': stats(filt_pos, filt_quat),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Controller pose filter tools')
+    parser.add_argument('command', choices=['evaluate'])
+    parser.add_argument('path', help='Session log recorded with webxr_ros_bridge.py --record')
+    parser.add_argument('--hand', choices=['left', 'right'], default='right')
+    parser.add_argument('--min-cutoff', type=float, default=1.0, help='Position cutoff when still (Hz)')
+    parser.add_argument('--beta', type=float, default=50.0, help='Position cutoff gain (Hz per m/s)')
+    parser.add_argument('--rot-min-cutoff', type=float, default=1.0, help='Rotation cutoff when still (Hz)')
+    parser.add_argument('--rot-beta', type=float, default=10.0, help='Rotation cutoff gain (Hz per rad/s)')
+    args = parser.parse_args()
+
+    from pose_predictor import load_track
+
+    t, pos, quat = load_track(args.path, args.hand)
+    if len(t) < 2:
+        raise SystemExit(f"No {args.hand} hand poses in {args.path}")
+    pose_filter = OneEuroPoseFilter(args.min_cutoff, args.beta, args.rot_min_cutoff, args.rot_beta)
+    result = evaluate(t, pos, quat, pose_filter)
+
+    fmt = lambda v: '-' if v is None else f"{v:.3f}"
+    print(f"{args.path}: {len(t)} {args.hand} hand poses, {result['still_frac']:.0%} still")
+    print(f"{'':<9} {'jitter mm':>10} {'track mm':>10} {'track deg':>10}")
+    for name in ('raw', 'filtered'):
+        r = result[name]
+        print(f"{name:<9} {fmt(r['jitter_mm']):>10} {fmt(r['track_mm']):>10} {fmt(r['track_deg']):>10}")
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Controller Pose Prediction
+
+Extrapolates the latest controller pose to the consumer's current time so
+the robot target does not trail the hand by the whole pipeline delay
+(capture -> bridge -> ROS/shared memory -> sim loop).
+
+Two models, same interface:
+    ConstantVelocityPredictor  finite-difference linear/angular velocity
+                               from the last two samples
+    KalmanPosePredictor        constant-velocity Kalman filter per axis
+                               (position and rotation error), which smooths
+                               tremor and jitter before extrapolating
+
+Poses are (px, py, pz) + (qx, qy, qz, qw) in any fixed frame (the consumers
+feed raw XR poses); times are host seconds, normally the capture stamp of
+the message. Extrapolation is capped at `max_horizon` so a stalled stream
+holds the last pose instead of flying off.
+
+Usage:
+    python pose_predictor.py evaluate session.qlog            # error vs horizon
+    python pose_predictor.py evaluate session.qlog --hand left --horizons 0 20 50 100
+"""
+
+import argparse
+
+import numpy as np
+
+from xr_mapping import quat_conjugate, quat_multiply, quat_to_rotvec, rotvec_to_quat
+
+
+# ============================================================================
+# PREDICTORS
+# ============================================================================
+class ConstantVelocityPredictor:
+    """Extrapolate with the velocity between the last two samples"""
+
+    def __init__(self, max_horizon=0.1, min_dt=1e-3):
+        self.max_horizon = max_horizon
+        self.min_dt = min_dt
+        self.reset()
+
+    def reset(self):
+        self.t = None
+        self.pos = None
+        self.quat = None
+        self.vel = np.zeros(3)
+        self.omega = np.zeros(3)
+
+    @property
+    def ready(self):
+        return self.t is not None
+
+    def update(self, t, pos, quat):
+        pos = np.asarray(pos, dtype=float)
+        quat = np.asarray(quat, dtype=float)
+        if self.t is not None:
+            dt = t - self.t
+            if dt < self.min_dt:
+                # Duplicate or out-of-order stamp: keep the velocity estimate
+                if dt < 0:
+                    return
+            else:
+                self.vel = (pos - self.pos) / dt
+                self.omega = quat_to_rotvec(quat_multiply(quat, quat_conjugate(self.quat))) / dt
+        self.t, self.pos, self.quat = t, pos, quat
+
+    def predict(self, t):
+        """Pose extrapolated to time t -> (pos, quat)"""
+        dt = min(max(t - self.t, 0.0), self.max_horizon)
+        return self.pos + self.vel * dt, quat_multiply(rotvec_to_quat(self.omega * dt), self.quat)
+
+
+class KalmanPosePredictor:
+    """Constant-velocity Kalman filter, extrapolated to the query time
+
+    Each of the six channels (x, y, z and the three rotation-error axes)
+    is an independent [value, rate] filter with white-noise acceleration.
+    Orientation is kept as a quaternion; the filter works on the rotation
+    vector of the innovation, which keeps it sign-consistent.
+    """
+
+    def __init__(self, max_horizon=0.1, pos_accel_noise=30.0, rot_accel_noise=300.0,
+                 pos_meas_noise=1e-3, rot_meas_noise=5e-3):
+        self.max_horizon = max_horizon
+        # Accel spectral densities and measurement std devs: [x y z | rx ry rz]
+        self.q = np.repeat([pos_accel_noise, rot_accel_noise], 3).astype(float)
+        self.r = np.repeat([pos_meas_noise, rot_meas_noise], 3).astype(float) ** 2
+        self.reset()
+
+    def reset(self):
+        self.t = None
+        self.pos = None
+        self.quat = None
+        self.rate = np.zeros(6)  # linear velocity | angular velocity
+        self.p00 = np.zeros(6)
+        self.p01 = np.zeros(6)
+        self.p11 = np.zeros(6)
+
+    @property
+    def ready(self):
+        return self.t is not None
+
+    def update(self, t, pos, quat):
+        pos = np.asarray(pos, dtype=float)
+        quat = np.asarray(quat, dtype=float)
+        if self.t is None:
+            self.t, self.pos, self.quat = t, pos, quat / np.linalg.norm(quat)
+            self.p00 = self.r.copy()
+            self.p11 = np.full(6, 1e2)
+            return
+        dt = t - self.t
+        if dt < 0:
+            return
+
+        # Predict
+        self.pos = self.pos + self.rate[:3] * dt
+        self.quat = quat_multiply(rotvec_to_quat(self.rate[3:] * dt), self.quat)
+        q = self.q
+        self.p00 = self.p00 + dt * (2.0 * self.p01 + dt * self.p11) + q * dt ** 3 / 3.0
+        self.p01 = self.p01 + dt * self.p11 + q * dt ** 2 / 2.0
+        self.p11 = self.p11 + q * dt
+
+        # Update
+        innovation = np.concatenate([
+            pos - self.pos,
+            quat_to_rotvec(quat_multiply(quat, quat_conjugate(self.quat))),
+        ])
+        s = self.p00 + self.r
+        k0 = self.p00 / s
+        k1 = self.p01 / s
+        correction = k0 * innovation
+        self.pos = self.pos + correction[:3]
+        self.quat = quat_multiply(rotvec_to_quat(correction[3:]), self.quat)
+        self.quat /= np.linalg.norm(self.quat)
+        self.rate = self.rate + k1 * innovation
+        self.p11 = self.p11 - k1 * self.p01
+        self.p01 = (1.0 - k0) * self.p01
+        self.p00 = (1.0 - k0) * self.p00
+        self.t = t
+
+    def predict(self, t):
+        """Pose extrapolated to time t -> (pos, quat)"""
+        dt = min(max(t - self.t, 0.0), self.max_horizon)
+        return (self.pos + self.rate[:3] * dt,
+                quat_multiply(rotvec_to_quat(self.rate[3:] * dt), self.quat))
+
+
+PREDICTORS = {
+    'cv': ConstantVelocityPredictor,
+    'kalman': KalmanPosePredictor,
+}
+
+
+def make_predictor(kind, **kwargs):
+    """Build a predictor by name ('cv', 'kalman'); None or 'none' disables prediction"""
+    if kind in (None, 'none'):
+        return None
+    return PREDICTORS[kind](**kwargs)
+
+
+def stamp_to_sec(stamp):
+    """builtin_interfaces/Time -> float seconds"""
+    return stamp.sec + stamp.nanosec * 1e-9
+
+
+# ============================================================================
+# OFFLINE EVALUATION
+# ============================================================================
+def evaluate(t, pos, quat, horizons, kinds=('cv', 'kalman')):
+    """Prediction error vs horizon on one recorded pose track
+
+    For every sample i, the predictor has seen samples 0..i and predicts
+    t[i] + h; the truth is the recording interpolated at that time.
+    'hold' (no prediction) is the baseline. Returns
+    {kind: {h: (pos_err_mm array, rot_err_deg array)}}.
+    """
+    from scipy.spatial.transform import Rotation as R, Slerp
+
+    horizons = np.asarray(horizons, dtype=float)
+    truth_rot = Slerp(t, R.from_quat(quat))
+    results = {}
+
+    for kind in ('hold',) + tuple(kinds):
+        predictor = make_predictor(kind, max_horizon=float(horizons.max()) + 1e-6) if kind != 'hold' else None
+        pred_pos = np.zeros((len(t), len(horizons), 3))
+        pred_quat = np.zeros((len(t), len(horizons), 4))
+        for i in range(len(t)):
+            if predictor is None:
+                pred_pos[i], pred_quat[i] = pos[i], quat[i]
+                continue
+            predictor.update(t[i], pos[i], quat[i])
+            for j, h in enumerate(horizons):
+                pred_pos[i, j], pred_quat[i, j] = predictor.predict(t[i] + h)
+
+        results[kind] = {}
+        for j, h in enumerate(horizons):
+            # Only samples whose target time is inside the recording
+            valid = t + h <= t[-1]
+            target_t = t[valid] + h
+            true_pos = np.stack([np.interp(target_t, t, pos[:, k]) for k in range(3)], axis=-1)
+            pos_err = np.linalg.norm(pred_pos[valid, j] - true_pos, axis=-1) * 1e3
+            rel = truth_rot(target_t).inv() * R.from_quat(pred_quat[valid, j])
+            rot_err = np.degrees(rel.magnitude())
+            results[kind][h] = (pos_err, rot_err)
+    return results
+
+
+def load_track(path, hand='right'):
+    """(t, pos, quat) of one hand from a session log, pose-valid frames only"""
+    import xr_protocol
+    from session_log import SessionReader
+
+    index = xr_protocol.HANDS.index(hand)
+    with SessionReader(path) as reader:
+        records = reader.read_all(columns=('timestamp', 'flags', 'pose'))
+    valid = (records['flags'] & xr_protocol.FLAG_POSE_VALID[index]) != 0
+    records = records[valid]
+    # Headset capture times (ms): one clock for the whole session
+    t = records['timestamp'] / 1e3
+    keep = np.concatenate([[True], np.diff(t) > 0])
+    pose = records['pose'][keep, index].astype(float)
+    return t[keep], pose[:, :3], pose[:, 3:]
+
+
+def format_results(results, horizons):
+    kinds = list(results)
+    header = f"{'horizon':>8} " + ' '.join(f"{k + ' mm':>15} {k + ' deg':>13}" for k in kinds)
+    lines = [header, f"{'(ms)':>8} " + ' '.join(f"{'mean/p95':>15} {'mean/p95':>13}" for _ in kinds)]
+    for h in horizons:
+        row = f"{h * 1e3:>8.0f} "
+        for kind in kinds:
+            pos_err, rot_err = results[kind][h]
+            row += (f"{pos_err.mean():>7.2f}/{np.percentile(pos_err, 95):<7.2f} "
+                    f"{rot_err.mean():>6.2f}/{np.percentile(rot_err, 95):<6.2f} ")
+        lines.append(row)
+    return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Controller pose prediction tools')
+    parser.add_argument('command', choices=['evaluate'])
+    parser.add_argument('path', help='Session log recorded with webxr_ros_bridge.py --record')
+    parser.add_argument('--hand', choices=['left', 'right'], default='right')
+    parser.add_argument('--horizons', type=float, nargs='+', default=[0, 10, 20, 30, 50, 75, 100],
+                        help='Prediction horizons in ms')
+    parser.add_argument('--models', nargs='+', choices=list(PREDICTORS), default=list(PREDICTORS))
+    args = parser.parse_args()
+
+    t, pos, quat = load_track(args.path, args.hand)
+    if len(t) < 2:
+        raise SystemExit(f"No {args.hand} hand poses in {args.path}")
+    horizons = [h / 1e3 for h in args.horizons]
+    print(f"{args.path}: {len(t)} {args.hand} hand poses over {t[-1] - t[0]:.1f} s "
+          f"({(len(t) - 1) / (t[-1] - t[0]):.1f} Hz)")
+    print(format_results(evaluate(t, pos, quat, horizons, args.models), horizons))
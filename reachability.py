@@ -0,0 +1,540 @@
+#!/usr/bin/env python3
+"""
+Precomputed Reachability Map
+
+An IK solver only finds out that a target is out of reach after spending
+its whole budget on it, and the consumer then freezes on the last good
+solution (Isaac) or drags the arm into its limits (MuJoCo). This map
+answers "can the tool get there?" with a table lookup instead, and moves
+an unreachable target onto the nearest pose that can be reached before the
+IK ever sees it.
+
+Built offline by sampling joint configurations (uniformly within their
+ranges, then around the configurations of rarely hit cells) and recording
+where forward kinematics puts the tool:
+
+    voxel      position on a grid of `voxel` metres (below `min_z` = floor
+               is dropped)
+    direction  the tool's approach axis, binned into `bins` near-uniform
+               directions (Fibonacci sphere); one bit per bin, a uint64
+               mask per voxel
+
+The roll about the approach axis is not indexed: both arms end in a wrist
+joint that rolls about it over (nearly) a full turn. A bit is also set
+where most face neighbours have it (holes between samples).
+
+A set bit means some pose in that 5 cm x 40 deg cell is reachable, not
+that all are, so targets are projected into the map's core instead: the
+bits also set in all six face neighbours and the three nearest direction
+bins, where the IK reaches (almost) the whole cell. Each voxel stores its
+nearest core voxel (Euclidean distance transform) and each bin its
+neighbours ordered by angle, so project() is a constant number of lookups:
+
+    position   voxel without core bits -> clamped into the nearest core voxel
+    direction  bin not in the core     -> rotated (minimally, about the
+                                          world axis a x d) to the nearest
+                                          core bin
+
+Maps are cached as compressed .npz files keyed by a hash of the kinematic
+model plus the build parameters, so a changed arm is rebuilt and an
+unchanged one loads in milliseconds. Self-collision is not modelled.
+
+Usage:
+    python reachability.py build                        # MuJoCo arm of mujoco_sim.py
+    python reachability.py evaluate --targets 500       # map vs IK convergence, lookup cost
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+from xr_mapping import quat_multiply, rotvec_to_quat, to_wxyz
+
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'quest3-streamer')
+
+DEFAULT_VOXEL = 0.05        # m
+DEFAULT_BINS = 32           # approach directions, ~40 deg apart
+DEFAULT_SAMPLES = 2000000   # FK evaluations (a few seconds per million)
+DEFAULT_FILL = 4            # face neighbours (of 6) with a bit that set it in a hole
+DEFAULT_MIN_Z = 0.0         # m, floor
+INSET = 0.25                # of a voxel: how far inside its faces a moved target lands
+BATCH = 100000
+DENSIFY_ROUNDS = 5          # resampling rounds around rarely hit cells
+DENSIFY_SIGMA = 0.1         # rad, joint perturbation of a resampled configuration
+RARE = 2                    # samples per (voxel, direction) cell that count as rare
+FORMAT = 1                  # part of the cache key: bump when the build or archive changes
+
+BUILD_DEFAULTS = {'voxel': DEFAULT_VOXEL, 'bins': DEFAULT_BINS, 'samples': DEFAULT_SAMPLES,
+                  'fill': DEFAULT_FILL, 'min_z': DEFAULT_MIN_Z, 'axis': 0, 'seed': 0}
+
+
+def direction_bins(n):
+    """n near-uniform unit vectors (Fibonacci sphere)"""
+    i = np.arange(n) + 0.5
+    z = 1.0 - 2.0 * i / n
+    r = np.sqrt(1.0 - z * z)
+    theta = math.pi * (3.0 - math.sqrt(5.0)) * i
+    return np.stack([r * np.cos(theta), r * np.sin(theta), z], axis=-1)
+
+
+def tool_axis(quat, axis):
+    """Column `axis` of the rotation matrix of a (w, x, y, z) quaternion"""
+    w, x, y, z = (float(v) for v in quat)
+    if axis == 0:
+        return (1 - 2 * (y * y + z * z), 2 * (x * y + w * z), 2 * (x * z - w * y))
+    if axis == 1:
+        return (2 * (x * y - w * z), 1 - 2 * (x * x + z * z), 2 * (y * z + w * x))
+    return (2 * (x * z + w * y), 2 * (y * z - w * x), 1 - 2 * (x * x + y * y))
+
+
+class ReachabilityMap:
+    """Voxel x approach-direction reachability index with O(1) projection
+
+    Poses are (position, (w, x, y, z) quaternion) in the arm's base frame,
+    the frame the map was built in. Counters:
+        checked        poses looked up by project()
+        moved          positions clamped into the nearest core voxel
+        turned         orientations rotated to a core approach direction
+    """
+
+    def __init__(self, origin, voxel, masks, core, nearest, directions, axis, key=''):
+        self.origin = np.asarray(origin, dtype=float)
+        self.voxel = float(voxel)
+        self.masks = np.asarray(masks, dtype=np.uint64)
+        self.core = np.asarray(core, dtype=np.uint64)
+        self.shape = np.array(self.masks.shape)
+        self.nearest = np.asarray(nearest, dtype=np.int32)  # flat index of the nearest core voxel
+        self.directions = np.asarray(directions, dtype=float)
+        self.axis = int(axis)
+        self.key = str(key)
+        self.path = None  # cache file, set by load_or_build
+
+        # Per bin: all bins by increasing angle (itself first)
+        self.order = np.argsort(-(self.directions @ self.directions.T), axis=1, kind='stable').tolist()
+        # Projected directions end this far inside the target bin (half its cap radius)
+        self.margin = 0.5 * math.acos(1.0 - 2.0 / len(self.directions))
+        self._flat_masks = self.masks.ravel()
+        self._flat_core = self.core.ravel()
+        self._direction_list = self.directions.tolist()
+        self._flat_nearest = self.nearest.ravel()
+        strides = (int(self.shape[1] * self.shape[2]), int(self.shape[2]), 1)
+        self._axes = list(zip(self.origin.tolist(), self.shape.tolist(), strides))
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.checked = 0
+        self.moved = 0
+        self.turned = 0
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+    def voxel_index(self, pos):
+        """Flat index of the voxel holding pos (clamped onto the grid)"""
+        # Plain floats: numpy call overhead dominates on a single 3-vector
+        index = 0
+        for value, (low, size, stride) in zip(pos, self._axes):
+            cell = math.floor((float(value) - low) / self.voxel)
+            index += min(max(cell, 0), size - 1) * stride
+        return index
+
+    def direction_bin(self, quat):
+        return int(np.argmax(self.directions @ tool_axis(quat, self.axis)))
+
+    def is_reachable(self, pos, quat):
+        """True if the position's voxel has the orientation's approach direction"""
+        mask = int(self._flat_masks[self.voxel_index(pos)])
+        return bool(mask >> self.direction_bin(quat) & 1)
+
+    def project(self, pos, quat):
+        """Pose the arm can reach -> (pos, quat (w, x, y, z), projected)
+
+        Poses the map holds come back unchanged; others move to the nearest
+        core pose.
+        """
+        self.checked += 1
+        pos = np.asarray(pos, dtype=float)
+        index = self.voxel_index(pos)
+        axis = tool_axis(quat, self.axis)
+        b = int(np.argmax(self.directions @ axis))
+        if int(self._flat_masks[index]) >> b & 1:
+            return pos, quat, False
+
+        core = int(self._flat_core[index])
+        if not core:
+            # Clamp into the nearest core voxel, INSET inside its faces;
+            # off-grid positions land in the empty margin and end up here too
+            index = int(self._flat_nearest[index])
+            core = int(self._flat_core[index])
+            low = self.origin + np.array(np.unravel_index(index, self.masks.shape)) * self.voxel
+            pos = np.clip(pos, low + INSET * self.voxel, low + (1.0 - INSET) * self.voxel)
+            self.moved += 1
+            if core >> b & 1:
+                return pos, quat, True
+        for candidate in self.order[b]:
+            if core >> candidate & 1:
+                break
+        self.turned += 1
+        return pos, self._turn(quat, axis, self._direction_list[candidate]), True
+
+    def _turn(self, quat, axis, target):
+        """Rotate quat so its tool axis ends `margin` inside the cone around target"""
+        ax, ay, az = axis
+        tx, ty, tz = target
+        cx, cy, cz = ay * tz - az * ty, az * tx - ax * tz, ax * ty - ay * tx
+        s = math.sqrt(cx * cx + cy * cy + cz * cz)
+        angle = math.atan2(s, ax * tx + ay * ty + az * tz) - self.margin
+        if angle <= 0:
+            return quat
+        if s < 1e-9:
+            # Opposite directions: any perpendicular axis
+            cx, cy, cz = np.cross(axis, [1.0, 0.0, 0.0] if abs(ax) < 0.9 else [0.0, 1.0, 0.0]).tolist()
+            s = math.sqrt(cx * cx + cy * cy + cz * cz)
+        k = angle / s
+        w, x, y, z = (float(v) for v in quat)
+        turned = quat_multiply(rotvec_to_quat([cx * k, cy * k, cz * k]), [x, y, z, w])
+        return to_wxyz(turned)
+
+    # ------------------------------------------------------------------
+    # Summary / persistence
+    # ------------------------------------------------------------------
+    def coverage(self):
+        """(reachable voxels, mean directions per reachable voxel, core voxels)"""
+        reach = self._flat_masks != 0
+        bits = np.unpackbits(self._flat_masks[reach].view(np.uint8)).sum()
+        return int(reach.sum()), float(bits / max(reach.sum(), 1)), int(np.count_nonzero(self._flat_core))
+
+    def stats(self):
+        return {'checked': self.checked, 'moved': self.moved, 'turned': self.turned}
+
+    def format(self):
+        voxels, dirs, _ = self.coverage()
+        return (f"reachability map {voxels} voxels x {dirs:.1f}/{len(self.directions)} directions: "
+                f"{self.moved} moved, {self.turned} turned of {self.checked} targets")
+
+    def save(self, path):
+        np.savez_compressed(path, origin=self.origin, voxel=self.voxel, masks=self.masks,
+                            core=self.core, nearest=self.nearest, directions=self.directions, axis=self.axis,
+                            key=self.key)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            return cls(f['origin'], f['voxel'], f['masks'], f['core'], f['nearest'], f['directions'],
+                       f['axis'], str(f['key']))
+
+
+# ============================================================================
+# BUILD
+# ============================================================================
+def build_map(fk, lower, upper, voxel=DEFAULT_VOXEL, bins=DEFAULT_BINS, samples=DEFAULT_SAMPLES,
+              fill=DEFAULT_FILL, min_z=DEFAULT_MIN_Z, axis=0, seed=0, key=''):
+    """Sample fk(q (n, joints)) -> (positions (n, 3), tool axes (n, 3)) into a map
+
+    A quarter of the samples is uniform over the joint ranges; the rest
+    goes to DENSIFY_ROUNDS rounds that perturb configurations from cells
+    hit at most RARE times. Uniform sampling starves thin regions (the arm
+    stretched out at the edge of its reach needs several joints near zero
+    at once), and those are where teleop targets end up.
+    """
+    from scipy import ndimage
+
+    rng = np.random.default_rng(seed)
+    lower = np.asarray(lower, dtype=float)
+    upper = np.asarray(upper, dtype=float)
+    directions = direction_bins(bins)
+
+    def run(q):
+        cells, bits, kept = [], [], []
+        for start in range(0, len(q), BATCH):
+            pos, dirs = fk(q[start:start + BATCH])
+            keep = pos[:, 2] >= min_z
+            cells.append(np.floor(pos[keep] / voxel).astype(np.int32))
+            bits.append(np.argmax(dirs[keep] @ directions.T, axis=1))
+            kept.append(q[start:start + BATCH][keep].astype(np.float32))
+        return np.concatenate(cells), np.concatenate(bits), np.concatenate(kept)
+
+    cells, bits, configs = run(rng.uniform(lower, upper, (samples // 4, len(lower))))
+    per_round = (samples - samples // 4) // DENSIFY_ROUNDS
+    for _ in range(DENSIFY_ROUNDS):
+        span = cells.max(axis=0) - cells.min(axis=0) + 1
+        index = np.ravel_multi_index(tuple((cells - cells.min(axis=0)).T), span) * bins + bits
+        _, inverse, counts = np.unique(index, return_inverse=True, return_counts=True)
+        seeds = configs[counts[inverse] <= RARE]
+        q = seeds[rng.integers(len(seeds), size=per_round)] + rng.normal(0.0, DENSIFY_SIGMA, (per_round, len(lower)))
+        more = run(np.clip(q, lower, upper))
+        cells, bits, configs = (np.concatenate(pair) for pair in zip((cells, bits, configs), more))
+    bits = bits.astype(np.uint64)
+
+    # Grid with one empty voxel of margin on every side
+    low = cells.min(axis=0) - 1
+    shape = tuple(cells.max(axis=0) - low + 2)
+    cells -= low
+    masks = np.zeros(shape, dtype=np.uint64)
+    np.bitwise_or.at(masks, tuple(cells.T), np.left_shift(np.uint64(1), bits))
+
+    # Holes: a bit most face neighbours have
+    if fill:
+        added = np.zeros_like(masks)
+        for b in range(bins):
+            bit = np.uint64(1) << np.uint64(b)
+            has = (masks & bit) != 0
+            count = np.zeros(shape, dtype=np.int8)
+            for d in range(3):
+                count[tuple(slice(1, None) if k == d else slice(None) for k in range(3))] += \
+                    has[tuple(slice(None, -1) if k == d else slice(None) for k in range(3))]
+                count[tuple(slice(None, -1) if k == d else slice(None) for k in range(3))] += \
+                    has[tuple(slice(1, None) if k == d else slice(None) for k in range(3))]
+            added[count >= fill] |= bit
+        masks |= added
+        # Keep the floor clear
+        below = (low[2] + np.arange(shape[2]) + 1) * voxel <= min_z
+        masks[:, :, below] = 0
+
+    core = core_masks(masks, directions)
+    if not core.any():
+        raise ValueError("reachability map has no core: sample more configurations or use larger voxels")
+    _, indices = ndimage.distance_transform_edt(core == 0, return_indices=True)
+    nearest = np.ravel_multi_index(tuple(indices), shape).astype(np.int32)
+    return ReachabilityMap(low * voxel, voxel, masks, core, nearest, directions, axis, key)
+
+
+def core_masks(masks, directions, neighbours=3):
+    """Bits also set in all six face neighbours and the `neighbours` nearest bins"""
+    core = masks.copy()
+    for d in range(3):
+        for shift in (1, -1):
+            core &= np.roll(masks, shift, axis=d)  # the grid margin is empty, no wrap-around
+    near = np.argsort(-(directions @ directions.T), axis=1, kind='stable')[:, 1:neighbours + 1]
+    has = [(core >> np.uint64(b)) & np.uint64(1) for b in range(len(directions))]
+    out = np.zeros_like(core)
+    for b in range(len(directions)):
+        keep = has[b].copy()
+        for c in near[b]:
+            keep &= has[c]
+        out |= keep << np.uint64(b)
+    return out
+
+
+def cache_path(key, params, cache_dir=None):
+    """.npz path of a model key plus (complete) build parameters"""
+    digest = hashlib.sha256((f"{FORMAT}:{key}" + json.dumps(params, sort_keys=True)).encode()).hexdigest()
+    return os.path.join(cache_dir or CACHE_DIR, f"reach-{digest[:16]}.npz")
+
+
+def load_or_build(key, fk, lower, upper, cache_dir=None, rebuild=False, log=None, **params):
+    """Cached map of a kinematic model (key = its hash), built on a miss"""
+    params = {**BUILD_DEFAULTS, **params}
+    path = cache_path(key, params, cache_dir)
+    if os.path.exists(path) and not rebuild:
+        if log:
+            log(f"Reachability map: {path}")
+        reach = ReachabilityMap.load(path)
+        reach.path = path
+        return reach
+    if log:
+        log(f"Building reachability map ({params['samples']} samples)...")
+    start = time.perf_counter()
+    reach = build_map(fk, lower, upper, key=key, **params)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    reach.save(path)
+    reach.path = path
+    if log:
+        log(f"Reachability map built in {time.perf_counter() - start:.1f} s: {path}")
+    return reach
+
+
+def file_hash(*paths):
+    """Key of a model defined by files (URDF, robot description)"""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+# ============================================================================
+# MUJOCO ARM
+# ============================================================================
+def kinematic_hash(model):
+    """Hash of the MuJoCo model fields forward kinematics depends on
+
+    Solver, contact and weld settings (which ArmSim and the sweeps tune)
+    leave it unchanged.
+    """
+    digest = hashlib.sha256()
+    for name in ('body_parentid', 'body_pos', 'body_quat', 'jnt_type', 'jnt_bodyid', 'jnt_pos',
+                 'jnt_axis', 'jnt_range', 'jnt_limited', 'site_bodyid', 'site_pos', 'site_quat'):
+        digest.update(np.ascontiguousarray(getattr(model, name)).tobytes())
+    return digest.hexdigest()
+
+
+def mujoco_fk(model, site='ee_site', axis=0):
+    """fk(q) -> (site positions, site axes) and the joint ranges of all hinge joints"""
+    import mujoco
+
+    data = mujoco.MjData(model)
+    site_id = model.site(site).id
+    joints = [j for j in range(model.njnt) if model.jnt_type[j] == int(mujoco.mjtJoint.mjJNT_HINGE)]
+    qpos_adr = model.jnt_qposadr[joints]
+    limited = model.jnt_limited[joints].astype(bool)
+    lower = np.where(limited, model.jnt_range[joints, 0], -math.pi)
+    upper = np.where(limited, model.jnt_range[joints, 1], math.pi)
+    columns = [axis, axis + 3, axis + 6]  # site_xmat is row-major
+
+    def fk(q):
+        pos = np.empty((len(q), 3))
+        dirs = np.empty((len(q), 3))
+        qpos, xpos, xmat = data.qpos, data.site_xpos[site_id], data.site_xmat[site_id]
+        for i in range(len(q)):
+            qpos[qpos_adr] = q[i]
+            mujoco.mj_kinematics(model, data)
+            pos[i] = xpos
+            dirs[i] = xmat[columns]
+        return pos, dirs
+
+    return fk, lower, upper
+
+
+def mujoco_map(model, site='ee_site', axis=0, **kwargs):
+    """Cached map of a MuJoCo arm; axis = the site axis its wrist rolls about"""
+    fk, lower, upper = mujoco_fk(model, site, axis)
+    return load_or_build(f"mujoco:{kinematic_hash(model)}:{site}", fk, lower, upper, axis=axis, **kwargs)
+
+
+# ============================================================================
+# EVALUATION
+# ============================================================================
+def random_quats(rng, n):
+    """n uniform random (w, x, y, z) quaternions"""
+    q = rng.normal(size=(n, 4))
+    return q / np.linalg.norm(q, axis=1, keepdims=True)
+
+
+def held_out_misses(reach, fk, lower, upper, n, seed):
+    """Fraction of freshly sampled (reachable) poses the map rejects"""
+    rng = np.random.default_rng(seed)
+    pos, dirs = fk(rng.uniform(lower, upper, (n, len(lower))))
+    keep = pos[:, 2] >= DEFAULT_MIN_Z
+    misses = 0
+    for p, d in zip(pos[keep], dirs[keep]):
+        mask = int(reach._flat_masks[reach.voxel_index(p)])
+        misses += not (mask >> int(np.argmax(reach.directions @ d)) & 1)
+    return misses / max(keep.sum(), 1)
+
+
+def reaches(ik, pos, quat, rng, restarts):
+    """Multi-start IK: does any start converge on the pose?"""
+    for r in range(restarts):
+        ik.solve(pos, quat, q_init=None if r == 0 else rng.uniform(ik.lower, ik.upper))
+        if ik.stats['converged']:
+            return True
+    return False
+
+
+def evaluate(model, reach, n, seed=1, restarts=16):
+    """Map verdict vs IK on random targets in the grid
+
+    Ground truth is a patient multi-start IK (no stall cut-off, `restarts`
+    random starts, 2 mm / 1 deg). For the targets the map rejects, the
+    runtime IK (mujoco_sim defaults, from home) is run on the raw and on
+    the projected target. Returns (confusion counts, rows of the rejected).
+    """
+    from mujoco_ik import DampedLeastSquaresIK
+
+    rng = np.random.default_rng(seed)
+    low = np.maximum(reach.origin, [-np.inf, -np.inf, DEFAULT_MIN_Z])
+    pos = rng.uniform(low, reach.origin + reach.shape * reach.voxel, (n, 3))
+    quat = random_quats(rng, n)
+    truth = DampedLeastSquaresIK(model, damping=0.01, max_iters=200, time_budget=None,
+                                 pos_tol=2e-3, rot_tol=0.02, stall_ratio=2.0)
+    runtime = DampedLeastSquaresIK(model)
+
+    confusion = {(m, t): 0 for m in (True, False) for t in (True, False)}
+    rows = []
+    for p, q in zip(pos, quat):
+        reachable = reaches(truth, p, q, rng, restarts)
+        verdict = reach.is_reachable(p, q)
+        confusion[verdict, reachable] += 1
+        if verdict:
+            continue
+        row = {}
+        projected = reach.project(p, q)[:2]
+        for name, (tp, tq) in (('raw', (p, q)), ('projected', projected)):
+            runtime.reset()
+            runtime.solve(tp, tq)
+            row[name] = (runtime.stats['time'], runtime.stats['iters'], runtime.stats['converged'],
+                         reachable if name == 'raw' else reaches(truth, tp, tq, rng, restarts),
+                         np.linalg.norm(tp - p))
+        rows.append(row)
+    return confusion, rows
+
+
+def lookup_cost(reach, n=20000, seed=2):
+    """Mean is_reachable / project time (us) over random poses in the grid"""
+    rng = np.random.default_rng(seed)
+    pos = rng.uniform(reach.origin, reach.origin + reach.shape * reach.voxel, (n, 3))
+    quat = random_quats(rng, n)
+    costs = []
+    for fn in (reach.is_reachable, reach.project):
+        start = time.perf_counter()
+        for p, q in zip(pos, quat):
+            fn(p, q)
+        costs.append((time.perf_counter() - start) / n * 1e6)
+    reach.reset_stats()
+    return costs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Reachability map of the MuJoCo arm')
+    parser.add_argument('command', choices=['build', 'evaluate'])
+    parser.add_argument('--voxel', type=float, default=DEFAULT_VOXEL, help='Voxel size (m)')
+    parser.add_argument('--bins', type=int, default=DEFAULT_BINS, help='Approach direction bins (<= 64)')
+    parser.add_argument('--samples', type=int, default=DEFAULT_SAMPLES, help='Joint configurations')
+    parser.add_argument('--fill', type=int, default=DEFAULT_FILL,
+                        help='Face neighbours needed to fill a hole (0 disables)')
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--rebuild', action='store_true', help='Ignore a cached map')
+    parser.add_argument('--targets', type=int, default=1000, help='Random targets to evaluate')
+    parser.add_argument('--held-out', type=int, default=200000, help='Fresh FK samples for the miss rate')
+    args = parser.parse_args()
+    if not 0 < args.bins <= 64:
+        parser.error("--bins must be 1..64 (one uint64 mask per voxel)")
+
+    from mujoco_sim import load_model
+
+    model = load_model()
+    start = time.perf_counter()
+    reach = mujoco_map(model, cache_dir=args.cache_dir, rebuild=args.rebuild or args.command == 'build',
+                       log=print, voxel=args.voxel, bins=args.bins, samples=args.samples, fill=args.fill)
+    voxels, dirs, core = reach.coverage()
+    print(f"grid {'x'.join(map(str, reach.shape))} at {reach.voxel * 100:g} cm: {voxels} reachable voxels "
+          f"({core} core), {dirs:.1f}/{len(reach.directions)} directions each, "
+          f"{os.path.getsize(reach.path) / 1024:.0f} KiB ({time.perf_counter() - start:.2f} s)")
+    if args.command == 'build':
+        raise SystemExit(0)
+
+    fk, lower, upper = mujoco_fk(model)
+    print(f"held-out FK samples rejected: {held_out_misses(reach, fk, lower, upper, args.held_out, 7):.2%}")
+
+    check_us, project_us = lookup_cost(reach)
+    print(f"lookup: is_reachable {check_us:.1f} us, project {project_us:.1f} us")
+
+    confusion, rows = evaluate(model, reach, args.targets)
+    print(f"{args.targets} random targets    IK reaches   IK fails")
+    for verdict in (True, False):
+        print(f"  map {'accepts' if verdict else 'rejects':<14} {confusion[verdict, True]:>10} "
+              f"{confusion[verdict, False]:>10}")
+    if rows:
+        print(f"the {len(rows)} rejected targets, raw and projected:")
+        print(f"  {'target':<10} {'IK us':>6} {'iters':>6} {'conv':>6} {'reachable':>10} {'moved mm':>9}")
+        for name in ('raw', 'projected'):
+            r = np.array([row[name] for row in rows], dtype=float)
+            print(f"  {name:<10} {r[:, 0].mean() * 1e6:>6.0f} {r[:, 1].mean():>6.1f} {r[:, 2].mean():>6.1%} "
+                  f"{r[:, 3].mean():>10.1%} {np.median(r[:, 4]) * 1e3:>9.0f}")
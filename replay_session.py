@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Teleop Session Replay
+
+Re-injects a recorded session (see session_log.py) either directly into
+WebXRROSBridge.process_controller_data or over the WebSocket into a
+running bridge, at the original speed, N times faster, or as fast as
+possible.
+
+Usage:
+    python replay_session.py session.qlog                       # into ROS, 1x
+    python replay_session.py session.qlog --speed 4             # 4x faster
+    python replay_session.py session.qlog --speed 0             # as fast as possible
+    python replay_session.py session.qlog --target ws://localhost:9090
+    python replay_session.py session.qlog --topics combined --qos best_effort --qos-depth 1
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import xr_protocol
+from ros_qos import add_qos_arguments, make_qos
+from session_log import SessionReader
+
+
+class ReplayClock:
+    """Maps recorded receive times onto wall time at a given speed"""
+
+    def __init__(self, speed):
+        self.speed = speed
+        self._origin = None
+
+    def delay(self, recv_time):
+        """Seconds to wait before the frame recorded at recv_time is due"""
+        if self.speed <= 0:
+            return 0.0
+        now = time.perf_counter()
+        if self._origin is None:
+            self._origin = (now, recv_time)
+            return 0.0
+        due = self._origin[0] + (recv_time - self._origin[1]) / self.speed
+        return due - now
+
+
+def replay_to_ros(reader, speed, start_time=None, topics='legacy', qos=None):
+    """Feed frames straight into an in-process bridge node"""
+    from webxr_ros_bridge import ROS_AVAILABLE, WebXRROSBridge, rclpy
+
+    if not ROS_AVAILABLE:
+        # The bridge would fall back to stub publishers and send nothing
+        raise SystemExit("rclpy not found: source ROS 2 (setup.bash) to replay into ROS, "
+                         "or replay into a running bridge with --target ws://HOST:PORT")
+    rclpy.init()
+    node = WebXRROSBridge(topics, qos)
+    clock = ReplayClock(speed)
+    count = 0
+    try:
+        for recv_time, frame in reader.iter_frames(start_time):
+            wait = clock.delay(recv_time)
+            if wait > 0:
+                time.sleep(wait)
+            node.process_controller_data(frame)
+            count += 1
+    finally:
+        node.destroy_node()
+        rclpy.shutdown()
+    return count
+
+
+async def replay_to_websocket(reader, url, speed, start_time=None):
+    """Send frames to a running bridge as binary WebSocket messages
+
+    Frames are restamped with this process's clock, and bridge clock-sync
+    pings are answered, so the bridge sees a live-looking client.
+    """
+    import websockets
+
+    def now_ms():
+        return time.perf_counter() * 1e3
+
+    clock = ReplayClock(speed)
+    count = 0
+    async with websockets.connect(url) as ws:
+        async def answer_pings():
+            async for message in ws:
+                t1 = now_ms()
+                if isinstance(message, str):
+                    msg = json.loads(message)
+                    if msg.get('type') == 'ping':
+                        await ws.send(json.dumps({
+                            'type': 'pong', 'id': msg.get('id'), 't0': msg['t0'],
+                            't1': t1, 't2': now_ms()
+                        }))
+
+        pinger = asyncio.create_task(answer_pings())
+        try:
+            for recv_time, frame in reader.iter_frames(start_time):
+                wait = clock.delay(recv_time)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                elif count % 64 == 0:
+                    await asyncio.sleep(0)  # let pongs through at full speed
+                frame['timestamp'] = now_ms()
+                await ws.send(xr_protocol.encode_frame(frame))
+                count += 1
+        finally:
+            pinger.cancel()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a recorded teleop session')
+    parser.add_argument('path', help='Session log written by webxr_ros_bridge.py --record')
+    parser.add_argument('--target', default='ros',
+                        help="'ros' to publish in-process, or a ws:// URL of a running bridge")
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='Playback speed factor (0 = as fast as possible)')
+    parser.add_argument('--start', type=float, default=0.0,
+                        help='Seconds into the session to start from')
+    parser.add_argument('--topics', choices=['legacy', 'combined', 'both'], default='legacy',
+                        help='Topics to publish in-process (see webxr_ros_bridge.py --topics)')
+    add_qos_arguments(parser)
+    args = parser.parse_args()
+
+    with SessionReader(args.path) as reader:
+        if not len(reader):
+            print("Session is empty")
+            return
+        start_time = float(reader.index['t_first'][0]) + args.start if args.start else None
+        print(f"Replaying {len(reader)} frames ({reader.duration:.1f} s) "
+              f"to {args.target} at {'max' if args.speed <= 0 else f'{args.speed:g}x'} speed")
+
+        t0 = time.perf_counter()
+        try:
+            if args.target == 'ros':
+                count = replay_to_ros(reader, args.speed, start_time, args.topics,
+                                      make_qos(args.qos, args.qos_depth))
+            else:
+                count = asyncio.run(replay_to_websocket(reader, args.target, args.speed, start_time))
+        except KeyboardInterrupt:
+            return
+        elapsed = time.perf_counter() - t0
+        print(f"Replayed {count} frames in {elapsed:.2f} s ({count / max(elapsed, 1e-9):.0f} frames/s)")
+
+
+if __name__ == "__main__":
+    main()
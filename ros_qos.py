@@ -0,0 +1,45 @@
+"""
+QoS profiles for the teleop topics
+
+The bridge publishers and the sim/robot subscribers pick their QoS from
+the same two knobs:
+
+    reliable     retransmits until delivered (ROS default); a slow
+                 subscriber makes the publisher queue up to `depth` samples
+    best_effort  fire and forget; with depth 1 only the newest pose is
+                 ever kept, which is what a teleop stream wants
+
+A best-effort subscriber can read a reliable publisher, but a reliable
+subscriber never matches a best-effort publisher: switch the consumers
+first (or together).
+"""
+
+DEFAULT_QOS = 'reliable'
+DEFAULT_DEPTH = 10
+QOS_CHOICES = ('reliable', 'best_effort')
+
+
+def make_qos(reliability=DEFAULT_QOS, depth=DEFAULT_DEPTH):
+    """QoSProfile for create_publisher/create_subscription
+
+    Without rclpy (ros_stub) only the depth is returned, which is all the
+    stubs take.
+    """
+    try:
+        from rclpy.qos import DurabilityPolicy, HistoryPolicy, QoSProfile, ReliabilityPolicy
+    except ImportError:
+        return depth
+    return QoSProfile(
+        history=HistoryPolicy.KEEP_LAST,
+        depth=depth,
+        reliability=(ReliabilityPolicy.BEST_EFFORT if reliability == 'best_effort'
+                     else ReliabilityPolicy.RELIABLE),
+        durability=DurabilityPolicy.VOLATILE,
+    )
+
+
+def add_qos_arguments(parser):
+    """--qos / --qos-depth command line options"""
+    parser.add_argument('--qos', choices=QOS_CHOICES, default=DEFAULT_QOS,
+                        help='Reliability of the teleop topics (best_effort pairs well with --qos-depth 1)')
+    parser.add_argument('--qos-depth', type=int, default=DEFAULT_DEPTH, help='History depth of the teleop topics')
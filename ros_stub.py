@@ -0,0 +1,253 @@
+"""
+Minimal rclpy stand-ins
+
+Lets webxr_ros_bridge.py run on a plain Linux box (CI, benchmarks) where
+ROS 2 is not installed. Publishers only count what they are given; no
+message ever leaves the process, and subscriptions only hear what is
+handed to their callback in-process. Only the small API surface the bridge
+uses is provided.
+"""
+
+import threading
+import time
+import types
+
+
+# ============================================================================
+# MESSAGES
+# ============================================================================
+class _Msg:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.__dict__})"
+
+
+class Time(_Msg):
+    def __init__(self, sec=0, nanosec=0):
+        super().__init__(sec=sec, nanosec=nanosec)
+
+
+class Header(_Msg):
+    def __init__(self):
+        super().__init__(stamp=Time(), frame_id='')
+
+
+class PoseStamped(_Msg):
+    def __init__(self):
+        super().__init__(
+            header=Header(),
+            pose=_Msg(position=_Msg(x=0.0, y=0.0, z=0.0),
+                      orientation=_Msg(x=0.0, y=0.0, z=0.0, w=1.0)),
+        )
+
+
+class Pose(_Msg):
+    def __init__(self):
+        super().__init__(position=_Msg(x=0.0, y=0.0, z=0.0),
+                         orientation=_Msg(x=0.0, y=0.0, z=0.0, w=1.0))
+
+
+class PoseArray(_Msg):
+    def __init__(self):
+        super().__init__(header=Header(), poses=[])
+
+
+class Joy(_Msg):
+    def __init__(self):
+        super().__init__(header=Header(), axes=[], buttons=[])
+
+
+class JoyFeedback(_Msg):
+    TYPE_LED = 0
+    TYPE_RUMBLE = 1
+    TYPE_BUZZER = 2
+
+    def __init__(self, type=0, id=0, intensity=0.0):
+        super().__init__(type=type, id=id, intensity=intensity)
+
+
+class JoyFeedbackArray(_Msg):
+    def __init__(self, array=None):
+        super().__init__(array=array or [])
+
+
+class KeyValue(_Msg):
+    def __init__(self, key='', value=''):
+        super().__init__(key=key, value=value)
+
+
+class DiagnosticStatus(_Msg):
+    OK = 0
+    WARN = 1
+    ERROR = 2
+
+    def __init__(self):
+        super().__init__(level=0, name='', message='', hardware_id='', values=[])
+
+
+class DiagnosticArray(_Msg):
+    def __init__(self):
+        super().__init__(header=Header(), status=[])
+
+
+# ============================================================================
+# NODE / PUBLISHER / EXECUTOR
+# ============================================================================
+class StubPublisher:
+    def __init__(self, msg_type, topic):
+        self.msg_type = msg_type
+        self.topic = topic
+        self.count = 0
+        self.last = None
+
+    def publish(self, msg):
+        self.count += 1
+        self.last = msg
+
+
+class StubSubscription:
+    """Never receives anything from outside; callback() can be fed by hand"""
+
+    def __init__(self, msg_type, topic, callback):
+        self.msg_type = msg_type
+        self.topic = topic
+        self.callback = callback
+
+
+class _Logger:
+    def __init__(self, name):
+        self.name = name
+
+    def _log(self, level, msg):
+        print(f"[{level}] [{time.time():.3f}] [{self.name}]: {msg}")
+
+    def debug(self, msg):
+        pass
+
+    def info(self, msg):
+        self._log('INFO', msg)
+
+    def warn(self, msg):
+        self._log('WARN', msg)
+
+    warning = warn
+
+    def error(self, msg):
+        self._log('ERROR', msg)
+
+
+class _Now:
+    def __init__(self):
+        self.t = time.time()
+
+    def to_msg(self):
+        sec = int(self.t)
+        return Time(sec=sec, nanosec=int((self.t - sec) * 1e9))
+
+
+class _Clock:
+    def now(self):
+        return _Now()
+
+
+class Node:
+    def __init__(self, name):
+        self._name = name
+        self._logger = _Logger(name)
+        self.publishers = {}
+        self.subscriptions = {}
+        self.timers = []
+
+    def get_name(self):
+        return self._name
+
+    def get_logger(self):
+        return self._logger
+
+    def get_clock(self):
+        return _Clock()
+
+    def create_publisher(self, msg_type, topic, qos):
+        pub = StubPublisher(msg_type, topic)
+        self.publishers[topic] = pub
+        return pub
+
+    def destroy_publisher(self, pub):
+        if self.publishers.get(pub.topic) is pub:
+            del self.publishers[pub.topic]
+
+    def create_subscription(self, msg_type, topic, callback, qos):
+        sub = StubSubscription(msg_type, topic, callback)
+        self.subscriptions[topic] = sub
+        return sub
+
+    def destroy_subscription(self, sub):
+        if self.subscriptions.get(sub.topic) is sub:
+            del self.subscriptions[sub.topic]
+
+    def create_timer(self, period, callback):
+        timer = [period, callback, time.monotonic() + period]
+        self.timers.append(timer)
+        return timer
+
+    def destroy_node(self):
+        self.timers = []
+
+
+class SingleThreadedExecutor:
+    """Runs node timers until shutdown (there are no subscriptions to serve)"""
+
+    def __init__(self):
+        self._nodes = []
+        self._stop = threading.Event()
+
+    def add_node(self, node):
+        self._nodes.append(node)
+
+    def spin_once(self, timeout_sec=None):
+        now = time.monotonic()
+        for node in self._nodes:
+            for timer in node.timers:
+                if now >= timer[2]:
+                    timer[2] = now + timer[0]
+                    timer[1]()
+        if timeout_sec:
+            self._stop.wait(timeout_sec)
+
+    def spin(self):
+        while not self._stop.is_set():
+            self.spin_once(0.01)
+
+    def shutdown(self, timeout_sec=None):
+        self._stop.set()
+
+
+# ============================================================================
+# rclpy MODULE FACADE
+# ============================================================================
+_state = {'ok': False}
+
+
+def _init(args=None):
+    _state['ok'] = True
+
+
+def _shutdown():
+    _state['ok'] = False
+
+
+def _spin_once(node, timeout_sec=None):
+    executor = SingleThreadedExecutor()
+    executor.add_node(node)
+    executor.spin_once(timeout_sec)
+
+
+rclpy = types.SimpleNamespace(
+    init=_init,
+    ok=lambda: _state['ok'],
+    shutdown=_shutdown,
+    spin_once=_spin_once,
+    is_stub=True,
+)
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Teleop Session Log
+
+Chunked, compressed, columnar recording of decoded controller frames,
+written without touching the live receive path.
+
+File layout:
+
+    header  b'QSESSLOG' | uint32 meta_len | JSON metadata
+    chunk   b'CHNK' | uint32 n_rows | per column: uint32 nbytes | zlib(column bytes)
+    ...
+    index   b'QIDX' | uint32 n_chunks | INDEX_DTYPE rows
+    footer  uint64 index_offset | b'QEND'
+
+Each chunk stores one column per SESSION_DTYPE field, so a reader can pull
+just the poses of a session without decoding anything else. The index
+holds the file offset and first/last receive time of every chunk for
+seeking; if a recording was cut short (no footer), the reader rebuilds it
+by scanning the chunks.
+
+Usage:
+    python session_log.py info session.qlog
+"""
+
+import argparse
+import json
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+import xr_protocol
+
+
+FILE_MAGIC = b'QSESSLOG'
+CHUNK_MAGIC = b'CHNK'
+INDEX_MAGIC = b'QIDX'
+END_MAGIC = b'QEND'
+FORMAT_VERSION = 1
+
+# One row per received frame; recv_time is host wall-clock seconds
+SESSION_DTYPE = np.dtype([
+    ('recv_time', '<f8'),
+    ('seq', '<u4'),
+    ('timestamp', '<f8'),
+    ('flags', 'u1'),
+    ('pose', '<f4', (2, 7)),
+    ('axes', '<f4', (2, 4)),
+    ('buttons', '<u2', (2,)),
+])
+
+INDEX_DTYPE = np.dtype([
+    ('offset', '<u8'),
+    ('n_rows', '<u4'),
+    ('t_first', '<f8'),
+    ('t_last', '<f8'),
+])
+
+def records_to_frames(records):
+    """Convert SESSION_DTYPE rows back into an array of wire frames"""
+    frames = np.zeros(len(records), dtype=xr_protocol.FRAME_DTYPE)
+    frames['magic'] = xr_protocol.MAGIC
+    frames['version'] = xr_protocol.VERSION
+    frames['kind'] = xr_protocol.KIND_CONTROLLERS
+    for name in ('seq', 'timestamp', 'flags', 'pose', 'axes', 'buttons'):
+        frames[name] = records[name]
+    return frames
+
+
+class SessionRecorder:
+    """Ring-buffered recorder flushed to disk by a background thread
+
+    record() only copies the frame into a preallocated ring slot; compression
+    and file I/O happen on the writer thread. If the writer ever falls a
+    full ring behind, new frames are counted in `overflowed` and skipped
+    rather than blocking the caller.
+    """
+
+    def __init__(self, path, chunk_rows=1024, capacity=65536, flush_interval=1.0,
+                 compress_level=1, metadata=None):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.flush_interval = flush_interval
+        self.compress_level = compress_level
+
+        # Raw wire bytes plus receive times; a slot copy is one memoryview store
+        self._capacity = capacity
+        self._ring = bytearray(capacity * xr_protocol.FRAME_SIZE)
+        self._ring_view = memoryview(self._ring)
+        self._times = np.zeros(capacity)
+        self._head = 0  # next slot to write (producer)
+        self._tail = 0  # next slot to flush (writer)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = False
+
+        self.recorded = 0
+        self.overflowed = 0
+        self._index = []
+
+        self._file = open(path, 'wb')
+        meta = {
+            'format_version': FORMAT_VERSION,
+            'dtype': SESSION_DTYPE.descr,
+            'created': time.time(),
+            'compression': 'zlib',
+        }
+        meta.update(metadata or {})
+        meta_bytes = json.dumps(meta).encode()
+        self._file.write(FILE_MAGIC + struct.pack('<I', len(meta_bytes)) + meta_bytes)
+
+        self._thread = threading.Thread(target=self._writer, name='session_writer', daemon=True)
+        self._thread.start()
+
+    def record(self, frame, recv_time=None):
+        """Copy one decoded frame into the ring (never blocks on I/O)"""
+        if recv_time is None:
+            recv_time = time.time()
+        data = frame.tobytes()
+        size = xr_protocol.FRAME_SIZE
+        with self._lock:
+            if self._head - self._tail >= self._capacity:
+                self.overflowed += 1
+                return False
+            slot = self._head % self._capacity
+            self._ring_view[slot * size:(slot + 1) * size] = data
+            self._times[slot] = recv_time
+            self._head += 1
+            self.recorded += 1
+            pending = self._head - self._tail
+        if pending >= self.chunk_rows:
+            self._wake.set()
+        return True
+
+    def close(self):
+        """Flush everything still buffered, write the index and close the file"""
+        if self._file is None:
+            return
+        self._stop = True
+        self._wake.set()
+        self._thread.join()
+
+        index = np.array(self._index, dtype=INDEX_DTYPE)
+        index_offset = self._file.tell()
+        self._file.write(INDEX_MAGIC + struct.pack('<I', len(index)) + index.tobytes())
+        self._file.write(struct.pack('<Q', index_offset) + END_MAGIC)
+        self._file.close()
+        self._file = None
+
+    def stats(self):
+        return {'recorded': self.recorded, 'overflowed': self.overflowed, 'chunks': len(self._index)}
+
+    def _writer(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            stopping = self._stop
+            while self._flush_chunk():
+                pass
+            if stopping:
+                return
+
+    def _flush_chunk(self):
+        """Write up to chunk_rows buffered rows; returns True if a chunk was written"""
+        with self._lock:
+            n = min(self._head - self._tail, self.chunk_rows)
+            if n == 0:
+                return False
+            idx = np.arange(self._tail, self._tail + n) % self._capacity
+            # Fancy indexing copies the rows out of the ring
+            frames = np.frombuffer(self._ring, dtype=xr_protocol.FRAME_DTYPE)[idx]
+            times = self._times[idx]
+            self._tail += n
+
+        records = np.empty(n, dtype=SESSION_DTYPE)
+        records['recv_time'] = times
+        for name in ('seq', 'timestamp', 'flags', 'pose', 'axes', 'buttons'):
+            records[name] = frames[name]
+
+        offset = self._file.tell()
+        parts = [CHUNK_MAGIC, struct.pack('<I', n)]
+        for name in SESSION_DTYPE.names:
+            blob = zlib.compress(np.ascontiguousarray(records[name]).tobytes(), self.compress_level)
+            parts += [struct.pack('<I', len(blob)), blob]
+        self._file.write(b''.join(parts))
+        self._file.flush()
+
+        self._index.append((offset, n, records['recv_time'][0], records['recv_time'][-1]))
+        return True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SessionReader:
+    """Random-access reader for session logs"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+
+        if self._file.read(len(FILE_MAGIC)) != FILE_MAGIC:
+            raise ValueError(f"{path} is not a session log")
+        (meta_len,) = struct.unpack('<I', self._file.read(4))
+        self.metadata = json.loads(self._file.read(meta_len))
+        self._data_start = self._file.tell()
+
+        self.index = self._read_index()
+        if self.index is None:
+            self.index = self._scan_index()
+
+    def __len__(self):
+        return int(self.index['n_rows'].sum())
+
+    @property
+    def duration(self):
+        if not len(self.index):
+            return 0.0
+        return float(self.index['t_last'][-1] - self.index['t_first'][0])
+
+    def read_chunk(self, i, columns=None):
+        """Read chunk i as SESSION_DTYPE rows (only the requested columns are decoded)"""
+        offset, n_rows = int(self.index['offset'][i]), int(self.index['n_rows'][i])
+        self._file.seek(offset + len(CHUNK_MAGIC) + 4)
+
+        records = np.zeros(n_rows, dtype=SESSION_DTYPE)
+        for name in SESSION_DTYPE.names:
+            (nbytes,) = struct.unpack('<I', self._file.read(4))
+            if columns is not None and name not in columns:
+                self._file.seek(nbytes, 1)
+                continue
+            field = SESSION_DTYPE.fields[name][0]
+            column = np.frombuffer(zlib.decompress(self._file.read(nbytes)), dtype=field.base)
+            records[name] = column.reshape((n_rows,) + field.shape)
+        return records
+
+    def read_all(self, columns=None):
+        if not len(self.index):
+            return np.zeros(0, dtype=SESSION_DTYPE)
+        return np.concatenate([self.read_chunk(i, columns) for i in range(len(self.index))])
+
+    def iter_chunks(self, start_time=None):
+        """Yield SESSION_DTYPE arrays chunk by chunk, optionally from a receive time"""
+        first = 0
+        if start_time is not None:
+            first = int(np.searchsorted(self.index['t_last'], start_time))
+        for i in range(first, len(self.index)):
+            records = self.read_chunk(i)
+            if start_time is not None and i == first:
+                records = records[np.searchsorted(records['recv_time'], start_time):]
+            yield records
+
+    def iter_records(self, start_time=None):
+        """Yield records in order, optionally starting at a receive time"""
+        for records in self.iter_chunks(start_time):
+            yield from records
+
+    def iter_frames(self, start_time=None):
+        """Yield (recv_time, wire frame) pairs, converting a chunk at a time"""
+        for records in self.iter_chunks(start_time):
+            yield from zip(records['recv_time'].tolist(), records_to_frames(records))
+
+    def close(self):
+        self._file.close()
+
+    def _read_index(self):
+        self._file.seek(0, 2)
+        end = self._file.tell()
+        if end - self._data_start < 12:
+            return None
+        self._file.seek(end - 12)
+        index_offset, magic = struct.unpack('<Q4s', self._file.read(12))
+        if magic != END_MAGIC:
+            return None
+        self._file.seek(index_offset)
+        if self._file.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+            return None
+        (n_chunks,) = struct.unpack('<I', self._file.read(4))
+        return np.frombuffer(self._file.read(n_chunks * INDEX_DTYPE.itemsize), dtype=INDEX_DTYPE)
+
+    def _scan_index(self):
+        """Rebuild the index of a log whose writer did not close cleanly"""
+        entries = []
+        self._file.seek(0, 2)
+        file_size = self._file.tell()
+        offset = self._data_start
+        while True:
+            self._file.seek(offset)
+            head = self._file.read(len(CHUNK_MAGIC) + 4)
+            if len(head) < 8 or head[:4] != CHUNK_MAGIC:
+                break
+            (n_rows,) = struct.unpack('<I', head[4:])
+            # recv_time is the first column
+            (nbytes,) = struct.unpack('<I', self._file.read(4))
+            blob = self._file.read(nbytes)
+            try:
+                times = np.frombuffer(zlib.decompress(blob), dtype='<f8')
+            except zlib.error:
+                break
+            pos = self._file.tell()
+            complete = True
+            for _ in SESSION_DTYPE.names[1:]:
+                size_bytes = self._file.read(4)
+                if len(size_bytes) < 4:
+                    complete = False
+                    break
+                pos += 4 + struct.unpack('<I', size_bytes)[0]
+                self._file.seek(pos)
+            if not complete or pos > file_size:
+                break
+            entries.append((offset, n_rows, times[0], times[-1]))
+            offset = pos
+        return np.array(entries, dtype=INDEX_DTYPE)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Inspect a teleop session log')
+    parser.add_argument('command', choices=['info'])
+    parser.add_argument('path')
+    args = parser.parse_args()
+
+    with SessionReader(args.path) as reader:
+        records = reader.read_all(columns=('recv_time', 'flags'))
+        print(f"File:     {args.path}")
+        print(f"Frames:   {len(reader)} in {len(reader.index)} chunks")
+        print(f"Duration: {reader.duration:.2f} s")
+        if len(records) > 1:
+            print(f"Rate:     {(len(records) - 1) / reader.duration:.1f} Hz")
+        for i, hand in enumerate(xr_protocol.HANDS):
+            present = np.count_nonzero(records['flags'] & xr_protocol.FLAG_PRESENT[i])
+            print(f"  {hand:<5} present in {present} frames")
@@ -0,0 +1,145 @@
+"""
+Shared-Memory Controller State
+
+Single-writer / multi-reader transport for the latest controller state on
+one host. The bridge writes every published hand update into a small
+multiprocessing.shared_memory block; local consumers (mujoco_sim.py,
+isaac_teleop.py) map the same block and read it directly, skipping DDS
+serialization entirely.
+
+Consistency uses a seqlock: the writer bumps `seq` to an odd value, writes
+the fields, then bumps it to the next even value. A reader copies the
+state into its own preallocated record and retries if `seq` was odd or
+changed meanwhile. The copy is a single ~200 byte memcpy; nothing is
+serialized or allocated per read.
+"""
+
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+DEFAULT_NAME = 'quest_controller_state'
+
+STATE_DTYPE = np.dtype([
+    ('seq', '<u8'),              # seqlock counter (odd while a write is in progress)
+    ('stamp', '<f8', (2,)),      # capture time per hand, host wall-clock seconds
+    ('frame_seq', '<u4', (2,)),  # wire sequence number of the last update
+    ('valid', 'u1', (2,)),       # 1 while the hand is tracked (pose is current)
+    ('reserved', 'u1', (6,)),
+    ('pose', '<f8', (2, 7)),     # px, py, pz, qx, qy, qz, qw (XR frame)
+    ('axes', '<f4', (2, 4)),     # trigger, squeeze, stick x, stick y
+    ('buttons', '<u2', (2,)),    # xr_protocol button bitfield
+    ('reserved2', 'u1', (4,)),
+])
+
+
+class SharedStateWriter:
+    """Owned by the bridge; creates (or replaces) the shared block"""
+
+    def __init__(self, name=DEFAULT_NAME):
+        try:
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+
+        self.name = name
+        self._shm = shared_memory.SharedMemory(name=name, create=True, size=STATE_DTYPE.itemsize)
+        self._state = np.ndarray((), dtype=STATE_DTYPE, buffer=self._shm.buf)
+        self._state[()] = np.zeros((), dtype=STATE_DTYPE)
+        self._seq = self._state['seq']  # 0-d view onto the counter
+
+    def write_hand(self, index, pose, axes, buttons, stamp=None, frame_seq=0):
+        """Publish one hand's latest state (pose None: not tracked, the last pose is kept but invalid)"""
+        state = self._state
+        self._seq += 1  # odd: write in progress
+        if pose is not None:
+            state['pose'][index] = pose
+        state['valid'][index] = pose is not None
+        state['axes'][index] = axes
+        state['buttons'][index] = buttons
+        state['stamp'][index] = time.time() if stamp is None else stamp
+        state['frame_seq'][index] = frame_seq
+        self._seq += 1  # even: consistent again
+
+    def close(self):
+        self._state = None
+        self._seq = None
+        self._shm.close()
+        try:
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _attach(name):
+    """Attach without letting this process's resource tracker unlink the block"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13: attaching registers with the resource tracker too
+        from multiprocessing import resource_tracker
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class SharedStateReader:
+    """Consumer side: read the latest consistent state without serialization"""
+
+    def __init__(self, name=DEFAULT_NAME):
+        self.name = name
+        self._shm = _attach(name)
+        self._shared = np.ndarray((), dtype=STATE_DTYPE, buffer=self._shm.buf)
+        self.state = np.zeros((), dtype=STATE_DTYPE)  # reader-owned snapshot
+        self._last_seq = None
+        self._hand_stamp = np.full(2, np.nan)  # per hand, as of the last updated() call
+        self._hand_seq = np.zeros(2, dtype=np.uint32)
+        self.retries = 0
+
+    def read(self, max_spins=1000):
+        """Refresh self.state; returns True if anything changed since last read
+
+        Gives up (keeping the previous snapshot) after max_spins attempts, so
+        a writer that died mid-update can never hang a consumer.
+        """
+        shared_seq = self._shared['seq']
+        for _ in range(max_spins):
+            s1 = int(shared_seq)
+            if s1 & 1:
+                self.retries += 1
+                continue
+            if s1 == self._last_seq:
+                return False
+            np.copyto(self.state, self._shared)
+            if int(shared_seq) == s1:
+                self._last_seq = s1
+                return True
+            self.retries += 1
+        return False
+
+    def updated(self):
+        """(2,) bool: hands with a tracked pose written since the last call
+
+        read() reports a write to either hand; this tells a consumer which
+        hand actually changed, so the other one is not fed again.
+        """
+        state = self.state
+        changed = (state['stamp'] != self._hand_stamp) | (state['frame_seq'] != self._hand_seq)
+        self._hand_stamp[:] = state['stamp']
+        self._hand_seq[:] = state['frame_seq']
+        return changed & (state['valid'] != 0)
+
+    def hand(self, index):
+        """(pose, axes, buttons, stamp) views of one hand in the snapshot, or None"""
+        if not self.state['valid'][index]:
+            return None
+        return (self.state['pose'][index], self.state['axes'][index],
+                int(self.state['buttons'][index]), float(self.state['stamp'][index]))
+
+    def close(self):
+        self._shared = None
+        self._shm.close()
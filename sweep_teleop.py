@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Offline Teleop Configuration Sweep
+
+Runs the headless MuJoCo arm (mujoco_sim.ArmSim) over recorded or
+synthetic hand tracks for every configuration in a parameter grid, spread
+over a process pool, and ranks the configurations by tracking quality.
+
+Per configuration (all tracks pooled):
+    track mm / deg   end-effector distance to the target the hand asked
+                     for (mapped, unclamped, at the same instant)
+    lag ms           time shift that best aligns the end effector with
+                     that target
+    limit %          ticks with a joint at (or past) its range limit
+    clamp %          target updates clamped by the workspace box or
+                     projected by the reachability map
+
+Grid values are comma-separated; vectors use ':' between components.
+
+Usage:
+    python sweep_teleop.py --synthetic 30 --param ik=weld,dls --param substeps=2,5,10
+    python sweep_teleop.py a.qlog b.qlog --param pos_scale=0.8,1.0,1.2 \\
+        --param weld_solref=0.005:1,0.02:1 --param filter=none,one_euro --json sweep.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from jitter_buffer import make_jitter_buffer
+from mujoco_ik import NEUTRAL_XR, weld_site_target
+from mujoco_sim import ArmSim, arm_reachability
+from pose_filter import make_filter
+from pose_predictor import make_predictor
+from xr_mapping import to_wxyz
+
+
+# Sweepable keys -> how a grid value is turned into ArmSim arguments
+PARAMS = (
+    'ik', 'substeps', 'pos_scale', 'pos_offset', 'workspace', 'weld_solref', 'weld_solimp',
+    'filter', 'filter_min_cutoff', 'filter_beta', 'predict', 'predict_horizon', 'jitter_buffer',
+    'reachability',
+)
+LIMIT_MARGIN = 0.01  # rad from the range end that counts as a joint-limit hit
+MAX_LAG = 0.3        # s, largest lag searched
+
+
+def parse_value(text):
+    """'1.5' -> 1.5, '0.02:1' -> (0.02, 1.0), anything else stays a string"""
+    try:
+        if ':' in text:
+            return tuple(float(v) for v in text.split(':'))
+        return float(text)
+    except ValueError:
+        return text
+
+
+def make_grid(param_args):
+    """['key=v1,v2', ...] -> list of config dicts (cartesian product)"""
+    keys, values = [], []
+    for arg in param_args:
+        key, _, spec = arg.partition('=')
+        if key not in PARAMS:
+            raise SystemExit(f"Unknown parameter {key!r} (one of: {', '.join(PARAMS)})")
+        keys.append(key)
+        values.append([parse_value(v) for v in spec.split(',')])
+    return [dict(zip(keys, combo)) for combo in itertools.product(*values)]
+
+
+def build_sim(config, now_fn):
+    """Headless ArmSim for one configuration"""
+    workspace = config.get('workspace')
+    return ArmSim(
+        predictor=make_predictor(config.get('predict', 'none')),
+        predict_horizon=config.get('predict_horizon', 0.0) / 1e3,
+        pose_filter=make_filter(config.get('filter', 'none'),
+                                min_cutoff=config.get('filter_min_cutoff', 1.0),
+                                beta=config.get('filter_beta', 50.0)),
+        ik=config.get('ik', 'weld'),
+        substeps=int(config.get('substeps', 5)),
+        pos_offset=config.get('pos_offset', (0.3, 0.0, 0.7)),
+        pos_scale=config.get('pos_scale', 1.0),
+        workspace=None if workspace is None else np.reshape(workspace, (2, 3)),
+        weld_solref=config.get('weld_solref'),
+        weld_solimp=config.get('weld_solimp'),
+        jitter_buffer=make_jitter_buffer(config.get('jitter_buffer', 0.0), now_fn=now_fn),
+        reachability=arm_reachability() if config.get('reachability', 'off') == 'on' else None,
+        now_fn=now_fn,
+    )
+
+
+# ============================================================================
+# EVALUATION (runs in the worker processes)
+# ============================================================================
+_tracks = None
+
+
+def _init_worker(tracks):
+    global _tracks
+    _tracks = tracks
+
+
+def run_track(config, t, pos, quat):
+    """Drive one ArmSim through a track -> per-tick arrays and counters"""
+    clock = [0.0]
+    sim = build_sim(config, now_fn=lambda: clock[0])
+    site_id = sim.model.site('ee_site').id
+    qpos_adr = sim.model.jnt_qposadr
+    lower = sim.model.jnt_range[:, 0] + LIMIT_MARGIN
+    upper = sim.model.jnt_range[:, 1] - LIMIT_MARGIN
+
+    # What each sample asks for: mapped (unclamped) pose through the weld offset
+    mapped = sim.mapping.map_poses(np.concatenate([pos, quat], axis=-1))
+    wanted = np.array([weld_site_target(sim.model, p[:3], to_wxyz(p[3:]))[0] for p in mapped])
+
+    n_ticks = int(t[-1] / sim.tick_dt)
+    ee = np.zeros((n_ticks, 3))
+    target = np.zeros((n_ticks, 3))
+    limit_hits = 0
+    i = 0
+    for k in range(n_ticks):
+        clock[0] = k * sim.tick_dt
+        while i < len(t) and t[i] <= clock[0]:
+            sim.receive_pose(t[i], pos[i], quat[i])
+            i += 1
+        sim.control_tick()
+        ee[k] = sim.data.site_xpos[site_id]
+        target[k] = wanted[max(i - 1, 0)]
+        q = sim.data.qpos[qpos_adr]
+        limit_hits += bool(np.any((q <= lower) | (q >= upper)))
+    return {
+        'tick_dt': sim.tick_dt,
+        'ee': ee,
+        'target': target,
+        'limit_hits': limit_hits,
+        'target_updates': sim.target_updates,
+        'clamped_updates': sim.clamped_updates + sim.projected_updates,
+    }
+
+
+def best_lag(ee, target, tick_dt):
+    """Shift (s) of the target that best matches the end effector"""
+    shifts = range(0, min(int(MAX_LAG / tick_dt), len(ee) - 1) + 1)
+    errors = [np.mean(np.linalg.norm(ee[s:] - target[:len(target) - s], axis=-1)) for s in shifts]
+    return int(np.argmin(errors)) * tick_dt
+
+
+def evaluate_config(index, config):
+    """All tracks for one configuration -> summary row"""
+    start = time.perf_counter()
+    errors, lags, weights = [], [], []
+    ticks = limit_hits = updates = clamped = 0
+    for t, pos, quat in _tracks:
+        r = run_track(config, t, pos, quat)
+        errors.append(np.linalg.norm(r['ee'] - r['target'], axis=-1))
+        lags.append(best_lag(r['ee'], r['target'], r['tick_dt']))
+        weights.append(len(r['ee']))
+        ticks += len(r['ee'])
+        limit_hits += r['limit_hits']
+        updates += r['target_updates']
+        clamped += r['clamped_updates']
+    errors = np.concatenate(errors) * 1e3
+    return {
+        'index': index,
+        'config': config,
+        'track_mm': float(errors.mean()),
+        'track_p95_mm': float(np.percentile(errors, 95)),
+        'lag_ms': float(np.average(lags, weights=weights) * 1e3),
+        'limit_frac': limit_hits / max(ticks, 1),
+        'clamp_frac': clamped / max(updates, 1),
+        'ticks': ticks,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+# ============================================================================
+# TRACKS
+# ============================================================================
+def recenter(pos):
+    """Move a track so it starts at the neutral hand position"""
+    return pos - pos[0] + NEUTRAL_XR
+
+
+def load_tracks(paths, hand, synthetic, seeds, raw=False):
+    """[(t from 0, pos, quat)] from session logs and synthetic trajectories"""
+    tracks = []
+    for path in paths:
+        from pose_predictor import load_track
+        t, pos, quat = load_track(path, hand)
+        tracks.append((t - t[0], pos if raw else recenter(pos), quat))
+    if synthetic > 0:
+        from synthetic_quest import generate_trajectory
+        index = 0 if hand == 'left' else 1
+        for seed in range(seeds):
+            t, poses, _, _ = generate_trajectory(synthetic, 90.0, seed=seed)
+            pos = poses[:, index, :3]
+            tracks.append((t, pos if raw else recenter(pos), poses[:, index, 3:]))
+    return tracks
+
+
+def format_config(config):
+    fmt = lambda v: ':'.join(f"{x:g}" for x in v) if isinstance(v, tuple) else (
+        f"{v:g}" if isinstance(v, float) else str(v))
+    return ' '.join(f"{k}={fmt(v)}" for k, v in config.items()) or '(defaults)'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sweep teleop configurations over hand tracks')
+    parser.add_argument('paths', nargs='*', help='Session logs recorded with webxr_ros_bridge.py --record')
+    parser.add_argument('--hand', choices=['left', 'right'], default='right')
+    parser.add_argument('--synthetic', type=float, default=0.0, metavar='SECONDS',
+                        help='Add synthetic hand tracks of this length')
+    parser.add_argument('--seeds', type=int, default=1, help='Number of synthetic tracks')
+    parser.add_argument('--raw', action='store_true',
+                        help='Use XR positions as recorded instead of re-centring each track')
+    parser.add_argument('--param', action='append', default=[], metavar='KEY=V1,V2',
+                        help=f"Grid axis, repeatable ({', '.join(PARAMS)})")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Process pool size')
+    parser.add_argument('--top', type=int, default=20, help='Rows to print')
+    parser.add_argument('--sort', default='track_mm',
+                        choices=['track_mm', 'track_p95_mm', 'lag_ms', 'limit_frac', 'clamp_frac'])
+    parser.add_argument('--json', metavar='PATH', help='Write all results as JSON')
+    args = parser.parse_args()
+
+    tracks = load_tracks(args.paths, args.hand, args.synthetic, args.seeds, args.raw)
+    if not tracks:
+        raise SystemExit("No tracks: pass session logs and/or --synthetic SECONDS")
+    grid = make_grid(args.param)
+    if any(config.get('reachability', 'off') == 'on' for config in grid):
+        arm_reachability(log=print)  # build it here once, the workers load it from the cache
+    seconds = sum(t[-1] for t, _, _ in tracks)
+    print(f"{len(grid)} configurations x {len(tracks)} tracks ({seconds:.0f} s of motion) "
+          f"on {args.workers} workers")
+
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(tracks,)) as pool:
+        futures = [pool.submit(evaluate_config, i, config) for i, config in enumerate(grid)]
+        for future in as_completed(futures):
+            results.append(future.result())
+            if len(results) % max(len(grid) // 10, 1) == 0:
+                print(f"  {len(results)}/{len(grid)} done ({time.perf_counter() - start:.0f} s)")
+    elapsed = time.perf_counter() - start
+    print(f"{len(grid)} configurations in {elapsed:.1f} s "
+          f"({sum(r['seconds'] for r in results) / elapsed:.1f}x parallel speedup)")
+
+    results.sort(key=lambda r: r[args.sort])
+    print(f"{'track mm':>9} {'p95 mm':>8} {'lag ms':>7} {'limit %':>8} {'clamp %':>8}  config")
+    for r in results[:args.top]:
+        print(f"{r['track_mm']:>9.2f} {r['track_p95_mm']:>8.2f} {r['lag_ms']:>7.0f} "
+              f"{r['limit_frac'] * 100:>8.1f} {r['clamp_frac'] * 100:>8.1f}  {format_config(r['config'])}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'tracks': len(tracks), 'results': results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Synthetic Quest Client
+
+Headless stand-in for webxr_streamer.html. Generates smooth two-hand
+controller trajectories (reach motions, wrist rotation, hand tremor,
+periodic grasps) and streams them to the bridge over WebSocket as binary,
+delta (keyframes + changed fields) or JSON frames, answering clock-sync
+pings, keyframe requests and haptic pulses like the page does. With
+--webtransport it accepts the bridge's WebTransport offer and sends the
+frames as QUIC datagrams instead, optionally dropping a fraction of the
+UDP packets to emulate a lossy link.
+
+Usage:
+    python synthetic_quest.py --rate 90                    # one Quest at 90 Hz
+    python synthetic_quest.py --rate 0 --duration 5        # saturate for 5 s
+    python synthetic_quest.py --encoding json --url ws://localhost:9090
+    python synthetic_quest.py --webtransport --loss 0.05   # datagrams, 5% packet loss
+    python synthetic_quest.py --encoding delta --idle left # delta stream, left hand at rest
+    python synthetic_quest.py --hand-joints                # also stream 2 x 25 hand joints
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import urlparse
+
+import numpy as np
+
+import xr_protocol
+import xr_webtransport
+
+
+# Rest pose of each hand in the XR local-floor frame (x right, y up, -z forward)
+_REST_POS = np.array([[-0.20, 1.00, -0.35], [0.20, 1.00, -0.35]])
+
+
+def _euler_to_quat(roll, pitch, yaw):
+    """Vectorized ZYX Euler angles to (x, y, z, w) quaternions"""
+    cr, sr = np.cos(roll / 2), np.sin(roll / 2)
+    cp, sp = np.cos(pitch / 2), np.sin(pitch / 2)
+    cy, sy = np.cos(yaw / 2), np.sin(yaw / 2)
+    return np.stack([
+        sr * cp * cy - cr * sp * sy,
+        cr * sp * cy + sr * cp * sy,
+        cr * cp * sy - sr * sp * cy,
+        cr * cp * cy + sr * sp * sy,
+    ], axis=-1)
+
+
+def generate_trajectory(duration, rate, seed=0, tremor=0.001):
+    """Generate two-hand poses, axes and buttons sampled at `rate` Hz
+
+    Returns (t, poses, axes, buttons) with shapes (N,), (N, 2, 7), (N, 2, 4)
+    and (N, 2). Poses are (px, py, pz, qx, qy, qz, qw) in the XR frame.
+    """
+    rng = np.random.default_rng(seed)
+    n = max(int(duration * rate), 1)
+    t = np.arange(n) / rate
+
+    poses = np.zeros((n, 2, 7))
+    axes = np.zeros((n, 2, 4))
+    buttons = np.zeros((n, 2), dtype=np.uint16)
+
+    for h in range(2):
+        # Reach motion: a few slow sinusoids per axis with random phase
+        freqs = rng.uniform(0.15, 0.8, size=(3, 3))
+        amps = rng.uniform(0.03, 0.12, size=(3, 3))
+        phases = rng.uniform(0, 2 * np.pi, size=(3, 3))
+        motion = (amps[None] * np.sin(2 * np.pi * freqs[None] * t[:, None, None] + phases[None])).sum(axis=2)
+
+        # Physiological tremor (8-12 Hz, ~1 mm)
+        tremor_f = rng.uniform(8, 12)
+        motion += tremor * np.sin(2 * np.pi * tremor_f * t)[:, None] * rng.normal(size=3)
+        poses[:, h, :3] = _REST_POS[h] + motion
+
+        # Wrist rotation
+        rot_f = rng.uniform(0.1, 0.5, size=3)
+        rot_a = rng.uniform(0.1, 0.6, size=3)
+        angles = rot_a * np.sin(2 * np.pi * rot_f * t[:, None] + rng.uniform(0, 2 * np.pi, size=3))
+        poses[:, h, 3:] = _euler_to_quat(angles[:, 0], angles[:, 1], angles[:, 2])
+
+        # Grasp every few seconds, thumbstick drifting around
+        grasp = 0.5 + 0.5 * np.sin(2 * np.pi * rng.uniform(0.1, 0.3) * t)
+        axes[:, h, 0] = np.clip(grasp * 1.4 - 0.2, 0.0, 1.0)
+        axes[:, h, 1] = np.clip(grasp * 1.4 - 0.4, 0.0, 1.0)
+        axes[:, h, 2:] = 0.3 * np.sin(2 * np.pi * 0.2 * t[:, None] + np.array([0.0, 1.5]))
+        buttons[:, h] = np.where(axes[:, h, 0] > 0.9, xr_protocol.BUTTON_A_X, 0)
+
+    return t, poses, axes, buttons
+
+
+def make_frames(duration, rate, seed=0, idle=()):
+    """Generate a FRAME_DTYPE array (both hands present, seq from 1)
+
+    Hands listed in `idle` (indices) rest motionless with no input.
+    """
+    t, poses, axes, buttons = generate_trajectory(duration, rate, seed)
+    for h in idle:
+        poses[:, h] = poses[0, h]
+        axes[:, h] = 0.0
+        buttons[:, h] = 0
+    frames = np.zeros(len(t), dtype=xr_protocol.FRAME_DTYPE)
+    frames['magic'] = xr_protocol.MAGIC
+    frames['version'] = xr_protocol.VERSION
+    frames['kind'] = xr_protocol.KIND_CONTROLLERS
+    frames['flags'] = sum(xr_protocol.FLAG_PRESENT) | sum(xr_protocol.FLAG_POSE_VALID)
+    frames['seq'] = np.arange(1, len(t) + 1)
+    frames['timestamp'] = t * 1e3
+    frames['pose'] = poses
+    frames['axes'] = axes
+    frames['buttons'] = buttons
+    return frames
+
+
+def _quat_to_matrix(q):
+    """(..., 4) (x, y, z, w) -> (..., 3, 3)"""
+    x, y, z, w = np.moveaxis(q, -1, 0)
+    return np.stack([
+        np.stack([1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)], axis=-1),
+        np.stack([2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)], axis=-1),
+        np.stack([2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)], axis=-1),
+    ], axis=-2)
+
+
+def make_joint_frames(frames):
+    """Hand-skeleton frames (JOINTS_DTYPE) following the controller frames
+
+    The wrist sits at the controller pose; the fingers are straight chains
+    in the wrist frame that curl in with the trigger value.
+    """
+    n = len(frames)
+    # Finger bases (x across the palm, -z forward) and per-joint segment length
+    bases = np.array([[0.03, 0.0, -0.02], [0.02, 0.0, -0.08], [0.0, 0.0, -0.085],
+                      [-0.02, 0.0, -0.08], [-0.035, 0.0, -0.07]])
+    segment = np.array([0.03, 0.025, 0.025, 0.022, 0.018])
+    curl = frames['axes'][:, :, 0, None]                           # (n, 2, 1)
+
+    local = np.zeros((n, 2, xr_protocol.N_JOINTS, 3))
+    joint = 1
+    for finger, n_joints in enumerate((4, 5, 5, 5, 5)):
+        steps = np.arange(n_joints)
+        angle = curl[..., None] * 0.5 * steps                       # (n, 2, 1, joints)
+        local[:, :, joint:joint + n_joints, 0] = bases[finger, 0]
+        local[:, :, joint:joint + n_joints, 1] = -segment[finger] * np.sin(angle[:, :, 0]) * steps
+        local[:, :, joint:joint + n_joints, 2] = bases[finger, 2] - segment[finger] * np.cos(angle[:, :, 0]) * steps
+        joint += n_joints
+
+    rot = _quat_to_matrix(frames['pose'][..., 3:].astype(float))  # (n, 2, 3, 3)
+    matrices = np.zeros((n, 2, xr_protocol.N_JOINTS, 4, 4))
+    matrices[..., :3, :3] = rot[:, :, None]
+    matrices[..., :3, 3] = frames['pose'][:, :, None, :3] + np.einsum('nhij,nhkj->nhki', rot, local)
+    matrices[..., 3, 3] = 1.0
+
+    joints = np.zeros(n, dtype=xr_protocol.JOINTS_DTYPE)
+    joints['magic'] = xr_protocol.MAGIC
+    joints['version'] = xr_protocol.VERSION
+    joints['kind'] = xr_protocol.KIND_HAND_JOINTS
+    joints['flags'] = sum(xr_protocol.FLAG_PRESENT) | sum(xr_protocol.FLAG_POSE_VALID)
+    joints['seq'] = frames['seq']
+    # Column-major, as XRFrame.fillPoses writes them
+    joints['matrices'] = matrices.transpose(0, 1, 2, 4, 3).reshape(n, 2, xr_protocol.N_JOINTS, 16)
+    return joints
+
+
+def now_ms():
+    """Client clock, playing the role of the page's performance.now()"""
+    return time.monotonic() * 1e3
+
+
+class SyntheticQuest:
+    """Streams generated frames to a bridge at a fixed rate (0 = saturate)"""
+
+    def __init__(self, url, rate=90.0, encoding='binary', duration=10.0, warmup=1.5, seed=0,
+                 webtransport=False, loss=0.0, idle='none', hand_joints=False):
+        self.url = url
+        self.rate = rate
+        self.encoding = encoding
+        self.duration = duration
+        self.warmup = warmup
+        self.seed = seed
+        self.webtransport = webtransport
+        self.loss = loss
+
+        # Pre-generate one period of motion and loop over it
+        idle_hands = {'none': (), 'left': (0,), 'right': (1,), 'both': (0, 1)}[idle]
+        self.frames = make_frames(min(duration, 30.0), rate or 120.0, seed, idle_hands)
+        self.delta = xr_protocol.DeltaEncoder() if encoding == 'delta' else None
+        self.joints = make_joint_frames(self.frames) if hand_joints else None
+
+        self.sent = 0
+        self.bytes_sent = 0
+        self.keyframe_requests = 0
+        self.late = 0
+        self.pongs = 0
+        self.haptic_pulses = 0
+        self.session = {}
+
+    async def run(self):
+        import websockets
+
+        loss_stats = {}
+        async with websockets.connect(self.url) as ws:
+            self._offer = asyncio.get_running_loop().create_future()
+            responder = asyncio.create_task(self._handle_messages(ws))
+            try:
+                # Let clock sync converge before streaming, like a user putting the headset on
+                await asyncio.sleep(self.warmup)
+                if self.webtransport:
+                    # Frames go over datagrams; pings keep arriving on the WebSocket
+                    offer = await asyncio.wait_for(self._offer, 5.0)
+                    async with xr_webtransport.open_webtransport(
+                            urlparse(self.url).hostname, offer['port'], offer['path'],
+                            loss=self.loss, seed=self.seed) as session:
+                        elapsed = await self._stream(session.send, ws.send)
+                        loss_stats = session.loss_stats()
+                else:
+                    elapsed = await self._stream(ws.send, ws.send)
+            finally:
+                responder.cancel()
+        return {
+            'url': self.url,
+            'transport': 'webtransport' if self.webtransport else 'websocket',
+            'encoding': self.encoding,
+            'target_rate': self.rate,
+            'sent': self.sent,
+            'bytes_sent': self.bytes_sent,
+            'keyframe_requests': self.keyframe_requests,
+            'haptic_pulses': self.haptic_pulses,
+            'late': self.late,
+            'elapsed_s': round(elapsed, 3),
+            'achieved_rate': round(self.sent / elapsed, 1) if elapsed > 0 else 0.0,
+            'session': self.session.get('id'),
+            'namespace': self.session.get('namespace'),
+            **loss_stats,
+        }
+
+    async def _stream(self, send, send_joints):
+        """Send frames with `send`; hand joints (too big for a datagram) with `send_joints`"""
+        period = 1.0 / self.rate if self.rate > 0 else 0.0
+        start = time.monotonic()
+        end = start + self.duration
+        n = len(self.frames)
+        seq = 0
+
+        while True:
+            now = time.monotonic()
+            if now >= end:
+                break
+            if period:
+                due = start + seq * period
+                if due > now:
+                    await asyncio.sleep(due - now)
+                elif now - due > period:
+                    self.late += 1
+            elif seq % 32 == 0:
+                await asyncio.sleep(0)  # saturating: still let pongs through
+
+            frame = self.frames[seq % n]
+            seq += 1
+            frame['seq'] = seq & 0xFFFFFFFF
+            frame['timestamp'] = now_ms()
+            if self.delta is not None:
+                message = self.delta.encode(frame)
+            elif self.encoding == 'binary':
+                message = xr_protocol.encode_frame(frame)
+            else:
+                message = json.dumps(xr_protocol.frame_to_dict(frame))
+            await send(message)
+            self.sent += 1
+            self.bytes_sent += len(message)
+            if self.joints is not None:
+                joints = self.joints[(seq - 1) % n]
+                joints['seq'] = frame['seq']
+                joints['timestamp'] = frame['timestamp']
+                message = joints.tobytes()
+                await send_joints(message)
+                self.bytes_sent += len(message)
+
+        return time.monotonic() - start
+
+    async def _handle_messages(self, ws):
+        """Answer clock-sync pings, keyframe requests and haptic pulses, pick up the session info
+        and WebTransport offer"""
+        async for message in ws:
+            t1 = now_ms()
+            if not isinstance(message, str):
+                continue
+            msg = json.loads(message)
+            if msg.get('type') == 'ping':
+                await ws.send(json.dumps({
+                    'type': 'pong', 'id': msg.get('id'), 't0': msg['t0'], 't1': t1, 't2': now_ms()
+                }))
+                self.pongs += 1
+            elif msg.get('type') == 'haptic':
+                # No actuator here: ack as soon as the pulses would have fired
+                self.haptic_pulses += len(msg['pulses'])
+                await ws.send(json.dumps({
+                    'type': 'haptic_ack', 'seq': msg['seq'], 't0': msg['t0'], 't1': t1, 't2': now_ms()
+                }))
+            elif msg.get('type') == 'keyframe':
+                self.keyframe_requests += 1
+                if self.delta is not None:
+                    self.delta.request_keyframe()
+            elif msg.get('type') == 'session':
+                self.session = msg
+            elif msg.get('type') == 'webtransport' and not self._offer.done():
+                self._offer.set_result(msg)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Headless synthetic Quest client')
+    parser.add_argument('--url', default='ws://localhost:9090',
+                        help='Bridge WebSocket URL (add /?ns=/name to pick the topic namespace)')
+    parser.add_argument('--rate', type=float, default=90.0,
+                        help='Frame rate in Hz (72/90/120 like the Quest; 0 = saturate)')
+    parser.add_argument('--encoding', choices=['binary', 'delta', 'json'], default='binary')
+    parser.add_argument('--idle', choices=['none', 'left', 'right', 'both'], default='none',
+                        help='Hands held still with no input (shows what delta mode saves)')
+    parser.add_argument('--duration', type=float, default=10.0, help='Streaming time in seconds')
+    parser.add_argument('--warmup', type=float, default=1.5,
+                        help='Seconds to answer clock-sync pings before streaming')
+    parser.add_argument('--seed', type=int, default=0, help='Trajectory random seed')
+    parser.add_argument('--webtransport', action='store_true',
+                        help='Send frames as WebTransport datagrams (bridge run with --webtransport)')
+    parser.add_argument('--loss', type=float, default=0.0,
+                        help='Fraction of UDP packets to drop each way (WebTransport only)')
+    parser.add_argument('--hand-joints', action='store_true',
+                        help='Also stream the 25-joint hand skeleton of both hands (WebSocket)')
+    parser.add_argument('--json', action='store_true', help='Print the result as one JSON line')
+    args = parser.parse_args()
+
+    client = SyntheticQuest(args.url, args.rate, args.encoding, args.duration, args.warmup, args.seed,
+                            args.webtransport, args.loss, args.idle, args.hand_joints)
+    result = asyncio.run(client.run())
+    if args.json:
+        print(json.dumps(result))
+    else:
+        print(f"Sent {result['sent']} {args.encoding} frames over {result['transport']} "
+              f"in {result['elapsed_s']:.2f} s ({result['achieved_rate']:.1f} Hz, {result['late']} late) "
+              f"as session {result['session']} on {result['namespace']}, "
+              f"{result['bytes_sent'] / max(result['elapsed_s'], 1e-9) / 1e3:.1f} kB/s")
+        if args.encoding == 'delta':
+            print(f"Keyframe requests from the bridge: {result['keyframe_requests']}")
+        if args.webtransport:
+            print(f"Injected loss: {result['dropped_out']}/{result['packets_sent']} packets out, "
+                  f"{result['dropped_in']} in")
@@ -0,0 +1,199 @@
+"""
+Bridge telemetry helpers
+
+Cheap rolling latency statistics for the hot path. Recording a sample is a
+single array store; percentiles are only computed when a report is asked for.
+Also holds the headset clock synchronisation and the local metrics endpoint.
+"""
+
+import asyncio
+import json
+import threading
+import time
+
+import numpy as np
+
+
+# Histogram bucket edges exposed on the metrics endpoint (milliseconds)
+HISTOGRAM_EDGES_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class LatencyStats:
+    """Rolling window of latency samples (seconds) with percentile summaries"""
+
+    def __init__(self, name, window=4096):
+        self.name = name
+        self._samples = np.zeros(window)
+        self._index = 0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples[self._index] = seconds
+            self._index = (self._index + 1) % len(self._samples)
+            self.count += 1
+
+    def reset(self):
+        with self._lock:
+            self._index = 0
+            self.count = 0
+
+    def summary(self):
+        """Return count and p50/p95/p99/max over the window, in milliseconds"""
+        with self._lock:
+            n = min(self.count, len(self._samples))
+            window = self._samples[:n].copy()
+            count = self.count
+        if n == 0:
+            return {'count': 0}
+        p50, p95, p99 = np.percentile(window, [50, 95, 99]) * 1e3
+        return {
+            'count': count,
+            'p50_ms': round(float(p50), 3),
+            'p95_ms': round(float(p95), 3),
+            'p99_ms': round(float(p99), 3),
+            'max_ms': round(float(window.max() * 1e3), 3),
+        }
+
+    def format(self):
+        s = self.summary()
+        if not s['count']:
+            return f"{self.name}: no samples"
+        return (f"{self.name}: n={s['count']} p50={s['p50_ms']:.2f}ms "
+                f"p95={s['p95_ms']:.2f}ms p99={s['p99_ms']:.2f}ms max={s['max_ms']:.2f}ms")
+
+    def histogram(self, edges_ms=HISTOGRAM_EDGES_MS):
+        """Bucket counts over the window; bucket i covers [edges[i-1], edges[i])"""
+        with self._lock:
+            n = min(self.count, len(self._samples))
+            window = self._samples[:n] * 1e3
+        counts = np.bincount(np.searchsorted(edges_ms, window, side='right'),
+                             minlength=len(edges_ms) + 1)
+        return {'edges_ms': list(edges_ms), 'counts': counts.tolist()}
+
+
+class ClockSync:
+    """NTP-style clock offset estimate between the headset and this host
+
+    The bridge sends a ping stamped with its send time t0; the page answers
+    with its receive (t1) and send (t2) times, and the bridge stamps the
+    pong arrival t3. All times are milliseconds; the bridge uses wall-clock
+    time and the page uses performance.now(), the same timeline as the XR
+    frame time. The estimate keeps the sample with the smallest RTT among
+    the most recent ones, since that one has the least queuing error.
+    """
+
+    def __init__(self, window=16):
+        self.window = window
+        self._samples = []
+        self.offset_ms = None  # headset clock minus host clock
+        self.rtt_ms = None
+        self._next_id = 0
+
+    def reset(self):
+        self._samples = []
+        self.offset_ms = None
+        self.rtt_ms = None
+
+    @property
+    def synced(self):
+        return self.offset_ms is not None
+
+    def make_ping(self):
+        self._next_id += 1
+        return {'type': 'ping', 'id': self._next_id, 't0': time.time() * 1e3}
+
+    def handle_pong(self, msg, t3=None):
+        """Update the estimate from a pong; returns False if it is malformed"""
+        if t3 is None:
+            t3 = time.time() * 1e3
+        try:
+            t0, t1, t2 = float(msg['t0']), float(msg['t1']), float(msg['t2'])
+        except (KeyError, TypeError, ValueError):
+            return False
+
+        rtt = (t3 - t0) - (t2 - t1)
+        offset = ((t1 - t0) + (t2 - t3)) / 2.0
+        self._samples.append((rtt, offset))
+        del self._samples[:-self.window]
+
+        self.rtt_ms, self.offset_ms = min(self._samples)
+        return True
+
+    def to_host_time(self, headset_ms):
+        """Convert a headset timestamp (ms) to host wall-clock seconds"""
+        if self.offset_ms is None:
+            return None
+        return (headset_ms - self.offset_ms) / 1e3
+
+
+class BridgeTelemetry:
+    """Per-stage latency statistics plus clock sync state for the bridge"""
+
+    STAGES = ('capture->receive', 'decode', 'receive->publish', 'capture->publish',
+              'joints capture->publish', 'haptic round trip', 'haptic command->pulse')
+
+    def __init__(self):
+        self.stages = {name: LatencyStats(name) for name in self.STAGES}
+        self.clock = ClockSync()
+        self._sources = {}
+
+    def record(self, stage, seconds):
+        self.stages[stage].record(seconds)
+
+    def reset(self):
+        """Clear latency samples (the clock estimate is kept)"""
+        for stats in self.stages.values():
+            stats.reset()
+
+    def add_source(self, name, stats_fn):
+        """Include the counters returned by stats_fn() in every snapshot"""
+        self._sources[name] = stats_fn
+
+    def snapshot(self, **extra):
+        """JSON-serialisable view of all statistics"""
+        out = {
+            'clock': {
+                'synced': self.clock.synced,
+                'offset_ms': self.clock.offset_ms,
+                'rtt_ms': self.clock.rtt_ms,
+            },
+            'stages': {
+                name: dict(stats.summary(), histogram=stats.histogram())
+                for name, stats in self.stages.items()
+            },
+            'sources': {name: fn() for name, fn in self._sources.items()},
+        }
+        out.update(extra)
+        return out
+
+    def format(self):
+        lines = [stats.format() for stats in self.stages.values() if stats.count]
+        if self.clock.synced:
+            lines.append(f"clock: offset={self.clock.offset_ms:.2f}ms rtt={self.clock.rtt_ms:.2f}ms")
+        return " | ".join(lines) if lines else "no samples"
+
+
+async def serve_metrics(snapshot_fn, host='127.0.0.1', port=9091):
+    """Serve snapshot_fn() as JSON over plain HTTP (any path)"""
+
+    async def handle(reader, writer):
+        try:
+            await reader.readuntil(b'\r\n\r\n')
+            body = json.dumps(snapshot_fn(), indent=2).encode()
+            writer.write(
+                b'HTTP/1.0 200 OK\r\n'
+                b'Content-Type: application/json\r\n'
+                + f'Content-Length: {len(body)}\r\n\r\n'.encode()
+                + body
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    async with server:
+        await server.serve_forever()
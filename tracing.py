@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+Hot-path tracing
+
+Opt-in timing of the teleop hot path (frame receive and decode, publish,
+pose callbacks, IK, physics step, viewer sync) for finding stalls in a
+running process. Code marks its hot spots with
+
+    @traced('bridge.ingest')            # functions / methods (sync or async)
+    with TRACER.span('sim.mj_step'):    # blocks
+
+Both cost one attribute check while tracing is off. Once enabled every
+span is recorded into a rolling LatencyStats per name (format() / stats())
+and into a ring buffer of the last DEFAULT_CAPACITY spans, which
+dump_chrome() writes as a Chrome trace (open in https://ui.perfetto.dev or
+chrome://tracing; one track per thread).
+
+install_signals() lets a running process be inspected without a restart:
+
+    kill -USR1 <pid>   start tracing; the next USR1 dumps the timeline and
+                       the span statistics (tracing stays on if it was
+                       enabled at startup, e.g. with --trace)
+    kill -USR2 <pid>   sample every thread's stack for PROFILE_SECONDS and
+                       write collapsed stacks (speedscope, flamegraph.pl)
+
+Dumps go to DUMP_DIR as trace-<pid>-<time>.json / profile-<pid>-<time>.folded.
+
+Usage:
+    python tracing.py                  # overhead of disabled / enabled spans
+    python tracing.py trace.json       # per-span summary of a dumped trace
+"""
+
+import argparse
+import asyncio
+import collections
+import functools
+import json
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+
+from telemetry import LatencyStats
+
+
+DEFAULT_CAPACITY = 100000  # spans kept for the timeline (~6 MB of JSON)
+PROFILE_SECONDS = 5.0      # length of a signal-triggered sampling profile
+PROFILE_INTERVAL = 0.002   # s between stack samples
+DUMP_DIR = tempfile.gettempdir()
+
+
+class _NullSpan:
+    """Span handed out while tracing is off"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'start')
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.add(self.name, self.start, time.perf_counter())
+        return False
+
+
+class Tracer:
+    """Span statistics and timeline of the last `capacity` spans
+
+    add() may be called from any thread. Times are perf_counter() seconds.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, window=4096):
+        self.enabled = False
+        self.capacity = capacity
+        self.window = window
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._threads = {}  # thread ident -> (track id, name)
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._events = collections.deque(maxlen=self.capacity)
+            self._stats = {}
+            self.epoch = time.perf_counter()
+            self.recorded = 0
+
+    def enable(self):
+        if not self.enabled:
+            self.reset()
+            self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def span(self, name):
+        """Context manager timing a block (a shared no-op while disabled)"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def add(self, name, start, end):
+        """Record one span"""
+        ident = threading.get_ident()
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = LatencyStats(name, self.window)
+            if ident not in self._threads:
+                self._threads[ident] = (len(self._threads) + 1, threading.current_thread().name)
+            self._events.append((name, ident, start, end))
+            self.recorded += 1
+        stats.record(end - start)
+
+    def stats(self):
+        """Per-span count and percentiles (ms), busiest span first"""
+        with self._lock:
+            spans = list(self._stats.values())
+        summaries = {s.name: s.summary() for s in spans}
+        return dict(sorted(summaries.items(), key=lambda kv: -kv[1]['count']))
+
+    def format(self):
+        with self._lock:
+            spans = sorted(self._stats.values(), key=lambda s: -s.count)
+        return " | ".join(s.format() for s in spans) if spans else "trace: no spans"
+
+    def chrome_trace(self):
+        """The buffered spans as a Chrome trace event dict"""
+        with self._lock:
+            events = list(self._events)
+            threads = dict(self._threads)
+            epoch = self.epoch
+        pid = os.getpid()
+        out = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0,
+                'args': {'name': os.path.basename(sys.argv[0]) or 'python'}}]
+        for tid, thread_name in threads.values():
+            out.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                        'args': {'name': thread_name}})
+        for name, ident, start, end in events:
+            out.append({'name': name, 'cat': name.split('.', 1)[0], 'ph': 'X', 'pid': pid,
+                        'tid': threads[ident][0], 'ts': round((start - epoch) * 1e6, 1),
+                        'dur': round((end - start) * 1e6, 1)})
+        return {'traceEvents': out, 'displayTimeUnit': 'ms'}
+
+    def dump_chrome(self, path):
+        """Write the timeline to path; returns the number of spans written"""
+        trace = self.chrome_trace()
+        with open(path, 'w') as f:
+            json.dump(trace, f)
+        return sum(1 for e in trace['traceEvents'] if e['ph'] == 'X')
+
+
+# Process-wide tracer used by the instrumented modules
+TRACER = Tracer()
+
+
+def traced(name, tracer=None):
+    """Decorator timing every call of a function or coroutine function"""
+    tracer = TRACER if tracer is None else tracer
+
+    def wrap(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                if not tracer.enabled:
+                    return await fn(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    tracer.add(name, start, time.perf_counter())
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                tracer.add(name, start, time.perf_counter())
+        return wrapper
+
+    return wrap
+
+
+# ============================================================================
+# SAMPLING PROFILER
+# ============================================================================
+def sample_stacks(seconds=PROFILE_SECONDS, interval=PROFILE_INTERVAL):
+    """Sample every other thread's Python stack -> Counter of collapsed stacks
+
+    Each key is "thread;outer (file:line);...;inner" as read by speedscope
+    and flamegraph.pl. Catches time the spans do not cover (GC, locks,
+    code nobody instrumented).
+    """
+    me = threading.get_ident()
+    counts = collections.Counter()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}"))
+            counts[';'.join(reversed(stack))] += 1
+        time.sleep(interval)
+    return counts
+
+
+def write_folded(counts, path):
+    with open(path, 'w') as f:
+        for stack, n in counts.most_common():
+            f.write(f"{stack} {n}\n")
+
+
+def dump_path(kind, ext, directory=None):
+    name = f"{kind}-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}.{ext}"
+    return os.path.join(DUMP_DIR if directory is None else directory, name)
+
+
+# ============================================================================
+# SIGNAL HOOKS
+# ============================================================================
+def install_signals(tracer=None, log=print, directory=None, profile_seconds=PROFILE_SECONDS):
+    """SIGUSR1 toggles tracing (start / dump), SIGUSR2 takes a sampling profile
+
+    Dumps run on a helper thread so the signalled loop is not held up.
+    Returns False where it cannot install (no SIGUSR1, or not the main thread).
+    """
+    tracer = TRACER if tracer is None else tracer
+    if not hasattr(signal, 'SIGUSR1') or threading.current_thread() is not threading.main_thread():
+        return False
+    keep_enabled = tracer.enabled
+    dumping, profiling = threading.Lock(), threading.Lock()
+
+    def dump_trace():
+        try:
+            path = dump_path('trace', 'json', directory)
+            n = tracer.dump_chrome(path)
+            log(f"Trace: {n} spans written to {path}")
+            log(f"Trace: {tracer.format()}")
+            if not keep_enabled:
+                tracer.disable()
+        finally:
+            dumping.release()
+
+    def profile():
+        try:
+            log(f"Profile: sampling all threads for {profile_seconds:g} s")
+            counts = sample_stacks(profile_seconds)
+            path = dump_path('profile', 'folded', directory)
+            write_folded(counts, path)
+            log(f"Profile: {sum(counts.values())} samples, {len(counts)} stacks written to {path}")
+        finally:
+            profiling.release()
+
+    def on_usr1(signum, frame):
+        if not tracer.enabled:
+            tracer.enable()
+            log("Trace: started (send SIGUSR1 again to dump)")
+        elif dumping.acquire(blocking=False):
+            threading.Thread(target=dump_trace, name='trace_dump', daemon=True).start()
+
+    def on_usr2(signum, frame):
+        if profiling.acquire(blocking=False):
+            threading.Thread(target=profile, name='profiler', daemon=True).start()
+        else:
+            log("Profile: already running")
+
+    signal.signal(signal.SIGUSR1, on_usr1)
+    signal.signal(signal.SIGUSR2, on_usr2)
+    return True
+
+
+# ============================================================================
+# OVERHEAD BENCHMARK / TRACE SUMMARY
+# ============================================================================
+def benchmark(n=200000):
+    """ns per call: plain function vs decorator and span, tracing off and on"""
+    tracer = Tracer(capacity=10000)
+
+    def work():
+        return None
+
+    decorated = traced('bench.call', tracer)(work)
+
+    def with_span():
+        with tracer.span('bench.span'):
+            return None
+
+    def timed(fn):
+        start = time.perf_counter()
+        for _ in range(n):
+            fn()
+        return (time.perf_counter() - start) / n * 1e9
+
+    rows = [('plain call', timed(work))]
+    rows += [('decorator, off', timed(decorated)), ('span, off', timed(with_span))]
+    tracer.enable()
+    rows += [('decorator, on', timed(decorated)), ('span, on', timed(with_span))]
+    return rows
+
+
+def summarize_trace(path):
+    """Per-span count / total / percentiles of a dumped Chrome trace"""
+    with open(path) as f:
+        events = [e for e in json.load(f)['traceEvents'] if e.get('ph') == 'X']
+    spans = collections.defaultdict(list)
+    for e in events:
+        spans[e['name']].append(e['dur'] / 1e6)
+    lines = [f"{path}: {len(events)} spans"]
+    for name, durations in sorted(spans.items(), key=lambda kv: -sum(kv[1])):
+        stats = LatencyStats(name, len(durations))
+        for d in durations:
+            stats.record(d)
+        lines.append(f"  total {sum(durations) * 1e3:9.1f} ms  {stats.format()}")
+    return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Tracing overhead benchmark / trace summary')
+    parser.add_argument('paths', nargs='*', help='Chrome traces dumped on SIGUSR1 to summarize')
+    parser.add_argument('--calls', type=int, default=200000, help='Calls per benchmark row')
+    args = parser.parse_args()
+
+    if args.paths:
+        for path in args.paths:
+            print(summarize_trace(path))
+    else:
+        print(f"{'':<16} {'ns/call':>8}")
+        for name, ns in benchmark(args.calls):
+            print(f"{name:<16} {ns:>8.0f}")
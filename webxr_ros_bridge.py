@@ -3,19 +3,77 @@
 WebXR to ROS Bridge
 
 Receives controller data from Quest WebXR page via WebSocket
-and publishes to ROS 2 topics.
+and publishes to ROS 2 topics. Frames may be compact binary, delta
+binary (keyframes + changed fields, see xr_protocol.py) or legacy
+JSON; the format is auto-detected per message.
 
 Usage:
     python webxr_ros_bridge.py [--port 9090] [--host 0.0.0.0]
+    python webxr_ros_bridge.py --measure-latency [--spin-mode poll]
+    python webxr_ros_bridge.py --record session.qlog
+    python webxr_ros_bridge.py --shm        # also share state with local sims
+    python webxr_ros_bridge.py --webtransport  # also accept frames as QUIC datagrams
+    python webxr_ros_bridge.py --topics both --qos best_effort --qos-depth 1
+    python webxr_ros_bridge.py --haptic-budget-ms 30
+    python webxr_ros_bridge.py --trace       # time the hot path (see tracing.py)
+
+Each connection is a session with its own topic namespace: the first
+client publishes on /quest/..., further ones on /quest/<session>/...
+unless the page asks for one (ws://host:9090/?ns=/robot2).
+
+--topics picks the per-hand topics (legacy), one combined Joy per frame
+holding both hands on <namespace>/frame (see xr_protocol.py), or both.
+
+Haptic pulse commands published on <namespace>/haptics are forwarded to
+that session's page (see haptics.py).
+
+Hot-path tracing is off unless --trace is given; SIGUSR1 starts it in a
+running bridge and dumps a Chrome trace on the second signal, SIGUSR2
+writes a sampling profile (see tracing.py).
 """
 
 import asyncio
-import json
 import argparse
-import rclpy
-from rclpy.node import Node
-from geometry_msgs.msg import PoseStamped
-from sensor_msgs.msg import Joy
+import json
+import re
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+try:
+    import rclpy
+    from rclpy.executors import SingleThreadedExecutor
+    from rclpy.node import Node
+    from builtin_interfaces.msg import Time
+    from diagnostic_msgs.msg import DiagnosticArray, DiagnosticStatus, KeyValue
+    from geometry_msgs.msg import Pose, PoseArray, PoseStamped
+    from sensor_msgs.msg import Joy, JoyFeedback, JoyFeedbackArray
+    ROS_AVAILABLE = True
+except ImportError:
+    # No ROS 2 install (CI, benchmarks): publish into counting stubs instead
+    from ros_stub import (rclpy, SingleThreadedExecutor, Node, Time, DiagnosticArray, DiagnosticStatus,
+                          KeyValue, Pose, PoseArray, PoseStamped, Joy, JoyFeedback, JoyFeedbackArray)
+    ROS_AVAILABLE = False
+
+import haptics
+import shm_transport
+import xr_protocol
+from frame_mailbox import LatestFrameMailbox
+from ros_qos import add_qos_arguments, make_qos
+from session_log import SessionRecorder
+from telemetry import BridgeTelemetry, ClockSync, serve_metrics
+from tracing import TRACER, install_signals, traced
+
+# Topics of the first client; later clients get DEFAULT_NAMESPACE/<session id>
+# unless they ask for a namespace (ws://host:port/?ns=/robot1)
+DEFAULT_NAMESPACE = '/quest'
+NAMESPACE_PATTERN = re.compile(r'^(/[A-Za-z_][A-Za-z0-9_]*)+$')
+
+# Received messages a client may have waiting for decode before its reads pause
+DEFAULT_QUEUE_SIZE = 64
+
+# Delta mode: minimum spacing of keyframe requests while waiting for one (s)
+KEYFRAME_RETRY = 0.1
 
 try:
     import websockets
@@ -24,105 +82,643 @@ except ImportError:
     exit(1)
 
 
+TOPIC_MODES = ('legacy', 'combined', 'both')
+
+
 class WebXRROSBridge(Node):
-    def __init__(self):
+    def __init__(self, topics='legacy', qos=None):
         super().__init__('webxr_ros_bridge')
         
-        # Publishers (same topics as OpenXR streamer for compatibility)
-        self.pub_left_pose = self.create_publisher(PoseStamped, '/quest/left_hand/pose', 10)
-        self.pub_right_pose = self.create_publisher(PoseStamped, '/quest/right_hand/pose', 10)
-        self.pub_left_input = self.create_publisher(Joy, '/quest/left_hand/inputs', 10)
-        self.pub_right_input = self.create_publisher(Joy, '/quest/right_hand/inputs', 10)
+        # Per-hand pose/inputs topics and/or one combined message per frame
+        self.legacy_topics = topics in ('legacy', 'both')
+        self.combined_topic = topics in ('combined', 'both')
+        self.qos = qos if qos is not None else make_qos()
+        
+        # Publishers per topic namespace, created as client sessions need them.
+        # The default namespace keeps the OpenXR streamer topics for compatibility.
+        self.hand_pubs = {}
+        
+        # Indexed like xr_protocol.HANDS (pose/inputs lists are empty without legacy topics)
+        self.pose_pubs, self.input_pubs, self.joint_pubs, self.frame_pub = \
+            self.hand_publishers(DEFAULT_NAMESPACE)
+        
+        # Latency telemetry and headset clock sync, published once per second
+        self.telemetry = BridgeTelemetry()
+        self.pub_diagnostics = self.create_publisher(DiagnosticArray, '/diagnostics', 10)
+        self.create_timer(1.0, self.publish_diagnostics)
         
+        # Optional shared-memory copy of the latest state for local consumers
+        self.shm_writer = None
+        
+        if not ROS_AVAILABLE:
+            self.get_logger().warn("rclpy not found: using stub publishers, nothing is sent to ROS")
         self.get_logger().info("WebXR ROS Bridge initialized")
-        self.get_logger().info("Publishing to: /quest/left_hand/pose, /quest/right_hand/pose")
-        self.get_logger().info("Publishing to: /quest/left_hand/inputs, /quest/right_hand/inputs")
+        hand_topics = '{pose,inputs,joints}' if self.legacy_topics else 'joints'
+        topics_info = [f"{DEFAULT_NAMESPACE}/{{left,right}}_hand/{hand_topics}"]
+        if self.combined_topic:
+            topics_info.append(f"{DEFAULT_NAMESPACE}/{xr_protocol.COMBINED_TOPIC}")
+        self.get_logger().info(f"Publishing to: {', '.join(topics_info)} "
+                               f"(further clients: {DEFAULT_NAMESPACE}/<session>/... or their own namespace)")
+        self.get_logger().info(f"Haptic pulse commands: {DEFAULT_NAMESPACE}/{haptics.HAPTIC_TOPIC}")
+    
+    def hand_publishers(self, namespace):
+        """(pose, input, hand-joint publishers, combined publisher) for a topic namespace"""
+        if namespace not in self.hand_pubs:
+            legacy_hands = xr_protocol.HANDS if self.legacy_topics else ()
+            self.hand_pubs[namespace] = (
+                [self.create_publisher(PoseStamped, f'{namespace}/{hand}_hand/pose', self.qos)
+                 for hand in legacy_hands],
+                [self.create_publisher(Joy, f'{namespace}/{hand}_hand/inputs', self.qos)
+                 for hand in legacy_hands],
+                [self.create_publisher(PoseArray, f'{namespace}/{hand}_hand/joints', self.qos)
+                 for hand in xr_protocol.HANDS],
+                (self.create_publisher(Joy, f'{namespace}/{xr_protocol.COMBINED_TOPIC}', self.qos)
+                 if self.combined_topic else None),
+            )
+        return self.hand_pubs[namespace]
+    
+    def release_publishers(self, namespace):
+        """Drop the publishers of a closed session (the default namespace stays)"""
+        if namespace == DEFAULT_NAMESPACE or namespace not in self.hand_pubs:
+            return
+        pose_pubs, input_pubs, joint_pubs, frame_pub = self.hand_pubs.pop(namespace)
+        for pub in pose_pubs + input_pubs + joint_pubs + [frame_pub]:
+            if pub is not None:
+                self.destroy_publisher(pub)
     
-    def process_controller_data(self, data):
-        """Process incoming WebXR controller data and publish to ROS"""
-        timestamp = self.get_clock().now().to_msg()
+    def subscribe_haptics(self, namespace, callback):
+        """Pulse commands for the page of one namespace (see haptics.py)"""
+        return self.create_subscription(JoyFeedbackArray, f'{namespace}/{haptics.HAPTIC_TOPIC}',
+                                        callback, self.qos)
+    
+    @traced('bridge.process_controller_data')
+    def process_controller_data(self, frame, session=None):
+        """Process incoming WebXR controller data and publish to ROS
+
+        Accepts a decoded xr_protocol frame or a legacy JSON dict.
+        """
+        if isinstance(frame, dict):
+            frame = xr_protocol.frame_from_dict(frame)
         
-        controllers = data.get('controllers', {})
+        if self.legacy_topics:
+            for i in range(len(xr_protocol.HANDS)):
+                if xr_protocol.hand_present(frame, i):
+                    self.publish_hand(i, frame, session=session)
+        if self.combined_topic:
+            self.publish_frame(frame, session=session)
+    
+    def capture_stamp(self, headset_ms, clock=None):
+        """Return (stamp msg, host capture time or None) for a frame
+
+        Uses the clock-corrected headset capture time once clock sync has
+        converged, and the receive-side node clock until then.
+        """
+        clock = clock or self.telemetry.clock
+        capture_time = clock.to_host_time(headset_ms) if headset_ms else None
+        if capture_time is None:
+            return self.get_clock().now().to_msg(), None
+        sec = int(capture_time)
+        return Time(sec=sec, nanosec=int((capture_time - sec) * 1e9)), capture_time
+    
+    def publish_hand(self, index, frame, timestamp=None, session=None):
+        """Publish pose and inputs of one hand from a decoded frame
+
+        With a ClientSession, publishes in its namespace using its clock;
+        otherwise on the default topics.
+        """
+        flags, seq, headset_ms, poses, axes, buttons = xr_protocol.unpack_frame(frame)
+        namespace = session.namespace if session is not None else DEFAULT_NAMESPACE
+        pose_pubs, input_pubs, _, _ = self.hand_publishers(namespace)
+        capture_time = None
+        if timestamp is None:
+            timestamp, capture_time = self.capture_stamp(headset_ms, session.clock if session else None)
         
-        for hand in ['left', 'right']:
-            ctrl = controllers.get(hand)
-            if not ctrl:
-                continue
-            
-            # Publish Pose
-            if ctrl.get('position') and ctrl.get('orientation'):
-                pose_msg = PoseStamped()
-                pose_msg.header.stamp = timestamp
-                pose_msg.header.frame_id = "quest_world"
-                
-                pose_msg.pose.position.x = float(ctrl['position']['x'])
-                pose_msg.pose.position.y = float(ctrl['position']['y'])
-                pose_msg.pose.position.z = float(ctrl['position']['z'])
-                
-                pose_msg.pose.orientation.x = float(ctrl['orientation']['x'])
-                pose_msg.pose.orientation.y = float(ctrl['orientation']['y'])
-                pose_msg.pose.orientation.z = float(ctrl['orientation']['z'])
-                pose_msg.pose.orientation.w = float(ctrl['orientation']['w'])
-                
-                if hand == 'left':
-                    self.pub_left_pose.publish(pose_msg)
-                else:
-                    self.pub_right_pose.publish(pose_msg)
+        # Publish Pose
+        if flags & xr_protocol.FLAG_POSE_VALID[index]:
+            px, py, pz, qx, qy, qz, qw = poses[index]
             
-            # Publish Inputs (Joy message format matching ros_interface.py)
-            joy_msg = Joy()
-            joy_msg.header.stamp = timestamp
+            pose_msg = PoseStamped()
+            pose_msg.header.stamp = timestamp
+            pose_msg.header.frame_id = "quest_world"
             
-            # Axes: [Trigger, Squeeze, StickX, StickY]
-            joy_msg.axes = [
-                float(ctrl.get('trigger', 0.0)),
-                float(ctrl.get('squeeze', 0.0)),
-                float(ctrl.get('thumbstick_x', 0.0)),
-                float(ctrl.get('thumbstick_y', 0.0))
-            ]
+            pose_msg.pose.position.x = px
+            pose_msg.pose.position.y = py
+            pose_msg.pose.position.z = pz
             
-            # Buttons: [A/X, B/Y, Menu, StickClick]
-            joy_msg.buttons = [
-                int(ctrl.get('button_a_x', False)),
-                int(ctrl.get('button_b_y', False)),
-                0,  # Menu button (not easily accessible in WebXR)
-                int(ctrl.get('thumbstick_click', False))
-            ]
+            pose_msg.pose.orientation.x = qx
+            pose_msg.pose.orientation.y = qy
+            pose_msg.pose.orientation.z = qz
+            pose_msg.pose.orientation.w = qw
             
-            if hand == 'left':
-                self.pub_left_input.publish(joy_msg)
-            else:
-                self.pub_right_input.publish(joy_msg)
+            pose_pubs[index].publish(pose_msg)
+        
+        # Publish Inputs (Joy message format matching ros_interface.py)
+        joy_msg = Joy()
+        joy_msg.header.stamp = timestamp
+        
+        # Axes: [Trigger, Squeeze, StickX, StickY]
+        joy_msg.axes = list(axes[index])
+        
+        # Buttons: [A/X, B/Y, Menu, StickClick]
+        # (Menu is not easily accessible in WebXR and stays 0)
+        joy_msg.buttons = xr_protocol.unpack_buttons(buttons[index])
+        
+        input_pubs[index].publish(joy_msg)
+        
+        self.share_hand(index, namespace, flags, seq, poses, axes, buttons, capture_time)
+        
+        if capture_time is not None:
+            self.telemetry.record('capture->publish', time.time() - capture_time)
+    
+    def share_hand(self, index, namespace, flags, seq, poses, axes, buttons, capture_time):
+        """Shared memory holds one operator: the client on the default namespace"""
+        if self.shm_writer is not None and namespace == DEFAULT_NAMESPACE:
+            pose = poses[index] if flags & xr_protocol.FLAG_POSE_VALID[index] else None
+            self.shm_writer.write_hand(index, pose, axes[index], buttons[index], capture_time, seq)
+    
+    def publish_frame(self, frame, session=None):
+        """Publish both hands of a controller frame as one combined Joy
+        
+        One stamp for both hands and their inputs (see xr_protocol.COMBINED_TOPIC).
+        Without the legacy topics this is also where shared memory is written.
+        """
+        namespace = session.namespace if session is not None else DEFAULT_NAMESPACE
+        timestamp, capture_time = self.capture_stamp(float(frame['timestamp']),
+                                                     session.clock if session else None)
+        msg = Joy()
+        msg.header.stamp = timestamp
+        msg.header.frame_id = "quest_world"
+        msg.axes, msg.buttons = xr_protocol.combined_fields(frame)
+        self.hand_publishers(namespace)[3].publish(msg)
+        
+        if not self.legacy_topics:
+            flags, seq, _, poses, axes, buttons = xr_protocol.unpack_frame(frame)
+            for i in range(len(xr_protocol.HANDS)):
+                if flags & xr_protocol.FLAG_PRESENT[i]:
+                    self.share_hand(i, namespace, flags, seq, poses, axes, buttons, capture_time)
+            if capture_time is not None:
+                self.telemetry.record('capture->publish', time.time() - capture_time)
+    
+    def publish_joints(self, index, frame, session=None):
+        """Publish the 25 hand-skeleton joints of one hand as a PoseArray
+        
+        Poses come out of the frame's matrices in one vectorized pass
+        (xr_protocol.joint_poses); only the message fill is per joint.
+        Hands whose joints are not all tracked are skipped.
+        """
+        if not frame['flags'] & xr_protocol.FLAG_POSE_VALID[index]:
+            return
+        namespace = session.namespace if session is not None else DEFAULT_NAMESPACE
+        timestamp, capture_time = self.capture_stamp(float(frame['timestamp']),
+                                                     session.clock if session else None)
+        
+        msg = PoseArray()
+        msg.header.stamp = timestamp
+        msg.header.frame_id = "quest_world"
+        poses = []
+        for px, py, pz, qx, qy, qz, qw in xr_protocol.joint_poses(frame, index).tolist():
+            pose = Pose()
+            pose.position.x, pose.position.y, pose.position.z = px, py, pz
+            pose.orientation.x, pose.orientation.y, pose.orientation.z, pose.orientation.w = qx, qy, qz, qw
+            poses.append(pose)
+        msg.poses = poses
+        self.hand_publishers(namespace)[2][index].publish(msg)
+        
+        if capture_time is not None:
+            self.telemetry.record('joints capture->publish', time.time() - capture_time)
+    
+    def publish_diagnostics(self):
+        """Publish latency percentiles and clock sync state on /diagnostics"""
+        snapshot = self.telemetry.snapshot()
+        
+        status = DiagnosticStatus()
+        status.name = "webxr_ros_bridge: latency"
+        status.hardware_id = "quest"
+        status.level = DiagnosticStatus.OK if snapshot['clock']['synced'] else DiagnosticStatus.WARN
+        status.message = "clock synced" if snapshot['clock']['synced'] else "waiting for clock sync"
+        
+        values = [KeyValue(key=f"clock/{k}", value=str(v)) for k, v in snapshot['clock'].items()]
+        for stage, summary in snapshot['stages'].items():
+            for key in ('count', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'):
+                if key in summary:
+                    values.append(KeyValue(key=f"{stage}/{key}", value=str(summary[key])))
+        for source, counters in snapshot['sources'].items():
+            values += [KeyValue(key=f"{source}/{k}", value=str(v)) for k, v in counters.items()]
+        status.values = values
+        
+        msg = DiagnosticArray()
+        msg.header.stamp = self.get_clock().now().to_msg()
+        msg.status = [status]
+        self.pub_diagnostics.publish(msg)
+
+
+class ClientSession:
+    """One connected page: its own namespace, clock sync, queue and publisher
+    
+    Received messages wait in a bounded queue for the session's processing
+    task (decode, mailbox); the session's publisher drains its own mailbox.
+    A slow or flooding client therefore only fills its own queue and delays
+    its own topics.
+    """
+    
+    def __init__(self, session_id, namespace, queue_size=DEFAULT_QUEUE_SIZE,
+                 haptic_budget=haptics.HAPTIC_BUDGET):
+        self.id = session_id
+        self.namespace = namespace
+        self.clock = ClockSync()
+        self.decoder = xr_protocol.DeltaDecoder()
+        self.mailbox = LatestFrameMailbox()
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.frame_ready = asyncio.Event()
+        self.stop_event = threading.Event()
+        self.tasks = []
+        self.publisher = None
+        self.send = None  # control channel back to the page (WebSocket send)
+        self.haptics = haptics.HapticChannel(haptic_budget)
+        self.haptic_sub = None
+        self.haptic_task = None
+        self.opened = time.time()
+        self.keyframe_requested = 0.0
+        
+        self.messages = 0
+        self.backpressure = 0   # receives that waited for queue space
+        self.queue_dropped = 0  # datagrams dropped on a full queue
+        self.queue_coalesced = 0  # queued controller frames skipped for a newer one
+        self.queue_peak = 0
+        self.published = 0
+        self.keyframe_requests = 0
+    
+    def stats(self):
+        return {
+            'namespace': self.namespace,
+            'uptime_s': round(time.time() - self.opened, 1),
+            'messages': self.messages,
+            'queue': self.queue.qsize(),
+            'queue_peak': self.queue_peak,
+            'backpressure': self.backpressure,
+            'queue_dropped': self.queue_dropped,
+            'queue_coalesced': self.queue_coalesced,
+            'published': self.published,
+            'keyframe_requests': self.keyframe_requests,
+            'clock_synced': self.clock.synced,
+            'rtt_ms': self.clock.rtt_ms,
+            **self.mailbox.stats(),
+            **self.decoder.stats(),
+            **self.haptics.stats(),
+        }
 
 
 class WebSocketServer:
-    def __init__(self, ros_node, host='0.0.0.0', port=9090):
+    def __init__(self, ros_node, host='0.0.0.0', port=9090, recorder=None,
+                 spin_mode='thread', queue_size=DEFAULT_QUEUE_SIZE, haptic_budget=haptics.HAPTIC_BUDGET):
         self.ros_node = ros_node
         self.host = host
         self.port = port
         self.clients = set()
+        self.spin_mode = spin_mode
+        self.queue_size = queue_size
+        self.haptic_budget = haptic_budget
+        self.loop = None  # set by start(); haptic commands arrive on the ROS thread
+        
+        # Client sessions by id; each has its own namespace, clock and mailbox
+        self.sessions = {}
+        self._session_count = 0
+        self._closed_frames = {'received': 0, 'coalesced': 0, 'dropped': 0, 'delivered': 0,
+                               'keyframes': 0, 'deltas': 0, 'unchanged': 0, 'gaps': 0}
+        self._closed_haptics = dict.fromkeys(haptics.HapticChannel().stats(), 0)
+        
+        # Optional session recorder (ring buffer + background writer)
+        self.recorder = recorder
+        
+        # Set by WebTransportServer; sent to each page so it can move frames onto datagrams
+        self.webtransport_offer = None
+        
+        self.telemetry = ros_node.telemetry
+        self.telemetry.add_source('frames', self.frame_stats)
+        self.telemetry.add_source('haptics', self.haptic_stats)
+        self.telemetry.add_source('sessions', self.session_stats)
+        self.telemetry.add_source('trace', TRACER.stats)
+        if recorder is not None:
+            self.telemetry.add_source('recorder', recorder.stats)
+    
+    def frame_stats(self):
+        """Mailbox and delta counters summed over all sessions, past and present"""
+        totals = dict(self._closed_frames)
+        for session in list(self.sessions.values()):
+            for key, value in {**session.mailbox.stats(), **session.decoder.stats()}.items():
+                totals[key] += value
+        return totals
+    
+    def haptic_stats(self):
+        """Haptic return channel counters summed over all sessions, past and present"""
+        totals = dict(self._closed_haptics)
+        for session in list(self.sessions.values()):
+            for key, value in session.haptics.stats().items():
+                totals[key] += value
+        return totals
+    
+    def session_stats(self):
+        return {session_id: session.stats() for session_id, session in list(self.sessions.items())}
+    
+    def requested_namespace(self, websocket, path):
+        """Namespace asked for in the URL (ws://host:port/?ns=/robot1), or None"""
+        if path is None:
+            request = getattr(websocket, 'request', None)
+            path = getattr(request, 'path', '') or ''
+        values = parse_qs(urlparse(path).query).get('ns')
+        return values[0] if values else None
+    
+    def open_session(self, namespace=None):
+        """Create a session; without a requested namespace the first client gets
+        the default topics and later ones a per-session namespace"""
+        self._session_count += 1
+        session_id = f"s{self._session_count}"
+        if namespace is None:
+            in_use = any(s.namespace == DEFAULT_NAMESPACE for s in self.sessions.values())
+            namespace = f"{DEFAULT_NAMESPACE}/{session_id}" if in_use else DEFAULT_NAMESPACE
+        session = ClientSession(session_id, namespace, self.queue_size, self.haptic_budget)
+        self.sessions[session_id] = session
+        session.haptic_sub = self.ros_node.subscribe_haptics(
+            namespace, lambda msg: self.on_haptics(session, msg))
+        
+        # The default-namespace client owns the bridge-wide clock (diagnostics)
+        if namespace == DEFAULT_NAMESPACE:
+            self.telemetry.clock = session.clock
+        
+        session.tasks.append(asyncio.create_task(self.process_loop(session)))
+        if self.spin_mode == 'poll':
+            session.tasks.append(asyncio.create_task(self.publish_loop(session)))
+        else:
+            session.publisher = threading.Thread(target=self.publish_worker, args=(session,),
+                                                 name=f'ros_publisher_{session_id}', daemon=True)
+            session.publisher.start()
+        return session
+    
+    async def close_session(self, session):
+        self.sessions.pop(session.id, None)
+        for task in session.tasks + [session.haptic_task]:
+            if task is not None:
+                task.cancel()
+        if session.haptic_sub is not None:
+            self.ros_node.destroy_subscription(session.haptic_sub)
+        session.stop_event.set()
+        session.mailbox.close()
+        if session.publisher is not None:
+            await asyncio.to_thread(session.publisher.join, 1.0)
+        for key, value in {**session.mailbox.stats(), **session.decoder.stats()}.items():
+            self._closed_frames[key] += value
+        for key, value in session.haptics.stats().items():
+            self._closed_haptics[key] += value
+        self.ros_node.release_publishers(session.namespace)
     
     async def handler(self, websocket, path=None):
         """Handle incoming WebSocket connections"""
-        self.clients.add(websocket)
         client_addr = websocket.remote_address
-        self.ros_node.get_logger().info(f"Client connected: {client_addr}")
+        namespace = self.requested_namespace(websocket, path)
+        if namespace is not None:
+            if not NAMESPACE_PATTERN.match(namespace):
+                await websocket.close(1008, f"invalid namespace {namespace!r}")
+                return
+            if any(s.namespace == namespace for s in self.sessions.values()):
+                self.ros_node.get_logger().warn(f"Rejected {client_addr}: namespace {namespace} in use")
+                await websocket.close(1008, f"namespace {namespace} in use")
+                return
+        
+        self.clients.add(websocket)
+        session = self.open_session(namespace)
+        self.ros_node.get_logger().info(
+            f"Client connected: {client_addr} session {session.id} -> {session.namespace} "
+            f"({len(self.sessions)} active)")
+        session.send = websocket.send
+        sync_task = asyncio.create_task(self.clock_sync_loop(websocket.send, session.clock))
         
         try:
+            await websocket.send(json.dumps({'type': 'session', 'id': session.id,
+                                             'namespace': session.namespace}))
+            if self.webtransport_offer is not None:
+                offer = dict(self.webtransport_offer)
+                offer['path'] = f"{offer['path']}?session={session.id}"
+                await websocket.send(json.dumps(offer))
             async for message in websocket:
-                try:
-                    data = json.loads(message)
-                    self.ros_node.process_controller_data(data)
-                except json.JSONDecodeError as e:
-                    self.ros_node.get_logger().warn(f"Invalid JSON: {e}")
+                with TRACER.span('ws.receive'):
+                    await self.enqueue(session, message, time.time(), time.perf_counter())
         except websockets.exceptions.ConnectionClosed:
             pass
         finally:
+            sync_task.cancel()
             self.clients.discard(websocket)
-            self.ros_node.get_logger().info(f"Client disconnected: {client_addr}")
+            await self.close_session(session)
+            self.ros_node.get_logger().info(f"Client disconnected: {client_addr} session {session.id}")
+            self.ros_node.get_logger().info(f"Session stats: {session.stats()}")
+    
+    async def enqueue(self, session, message, recv_wall, recv_time):
+        """Queue a received message; waits (pausing this client's reads) when full"""
+        session.messages += 1
+        if session.queue.full():
+            session.backpressure += 1
+        await session.queue.put((message, recv_wall, recv_time))
+        session.queue_peak = max(session.queue_peak, session.queue.qsize())
+    
+    def enqueue_nowait(self, session, message, recv_wall, recv_time):
+        """Queue a datagram; dropped when the queue is full (datagrams are lossy anyway)"""
+        if session.stop_event.is_set():
+            return
+        session.messages += 1
+        try:
+            session.queue.put_nowait((message, recv_wall, recv_time))
+        except asyncio.QueueFull:
+            session.queue_dropped += 1
+            return
+        session.queue_peak = max(session.queue_peak, session.queue.qsize())
+    
+    async def process_loop(self, session):
+        """Per-session task: decode queued messages into the session mailbox
+
+        When messages piled up, only the newest controller frame of the
+        backlog is decoded: older ones would be published late, replaying
+        stale poses. Control messages and hand-joint frames are all kept; a
+        skipped delta shows up as a sequence gap and triggers a keyframe request.
+        """
+        queue = session.queue
+        while True:
+            items = [await queue.get()]
+            while not queue.empty():
+                items.append(queue.get_nowait())
+            newest = None
+            if len(items) > 1:
+                frames = [i for i, item in enumerate(items) if xr_protocol.is_controller_frame(item[0])]
+                newest = frames[-1] if frames else None
+            for i, (message, recv_wall, recv_time) in enumerate(items):
+                if newest is not None and i < newest and xr_protocol.is_controller_frame(message):
+                    session.queue_coalesced += 1
+                    continue
+                self.ingest(session, message, recv_wall, recv_time)
+    
+    @traced('bridge.ingest')
+    def ingest(self, session, message, recv_wall, recv_time):
+        """Decode one received message and hand frames to the publisher
+        
+        Shared by every transport (WebSocket, WebTransport datagrams).
+        """
+        # Binary frames (full or delta) and legacy JSON text are auto-detected
+        hands = None
+        try:
+            if xr_protocol.is_binary(message):
+                decoded, hands = session.decoder.decode(message)
+            else:
+                decoded = xr_protocol.decode_json(message)
+        except xr_protocol.ProtocolError as e:
+            self.ros_node.get_logger().warn(f"Invalid frame from session {session.id}: {e}")
+            return
+        
+        if session.decoder.need_keyframe:
+            self.request_keyframe(session)
+        if decoded is None:
+            return  # delta with nothing new (idle controllers)
+        if xr_protocol.is_control(decoded):
+            self.handle_control(session, decoded, recv_wall)
+            return
+        
+        self.telemetry.record('decode', time.perf_counter() - recv_time)
+        # The recording holds one stream: controller frames of the default-namespace client
+        if (self.recorder is not None and session.namespace == DEFAULT_NAMESPACE
+                and decoded['kind'] == xr_protocol.KIND_CONTROLLERS):
+            self.recorder.record(decoded, recv_wall)
+        capture_time = session.clock.to_host_time(float(decoded['timestamp']))
+        if capture_time is not None:
+            self.telemetry.record('capture->receive', recv_wall - capture_time)
+        
+        if session.mailbox.put(decoded, recv_time, hands):
+            session.frame_ready.set()
+    
+    def request_keyframe(self, session):
+        """Ask the page for a full frame (delta stream gap or no base yet)"""
+        now = time.monotonic()
+        if session.send is None or now - session.keyframe_requested < KEYFRAME_RETRY:
+            return
+        session.keyframe_requested = now
+        session.keyframe_requests += 1
+        asyncio.create_task(self.send_control(session.send, {'type': 'keyframe'}))
+    
+    async def send_control(self, send, msg):
+        try:
+            await send(json.dumps(msg))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+    
+    def handle_control(self, session, msg, recv_wall):
+        """Handle a JSON control message from the page"""
+        if msg.get('type') == 'pong':
+            if not session.clock.handle_pong(msg, recv_wall * 1e3):
+                self.ros_node.get_logger().warn(f"Malformed pong: {msg}")
+        elif msg.get('type') == 'haptic_ack':
+            result = session.haptics.handle_ack(msg, recv_wall * 1e3, session.clock)
+            if result is not None:
+                rtt, latency = result
+                self.telemetry.record('haptic round trip', rtt)
+                if latency is not None:
+                    self.telemetry.record('haptic command->pulse', latency)
+    
+    @traced('bridge.on_haptics')
+    def on_haptics(self, session, msg):
+        """Pulse commands for a session (ROS executor thread): merge, then wake the sender"""
+        now = time.time()
+        wake = False
+        for feedback in msg.array:
+            if feedback.type == JoyFeedback.TYPE_RUMBLE and 0 <= feedback.id < len(xr_protocol.HANDS):
+                wake |= session.haptics.add(feedback.id, feedback.intensity, now)
+        if wake and self.loop is not None:
+            self.loop.call_soon_threadsafe(self.start_haptic_sender, session)
+    
+    def start_haptic_sender(self, session):
+        if session.send is None or session.stop_event.is_set():
+            return
+        if session.haptic_task is None or session.haptic_task.done():
+            session.haptic_task = asyncio.create_task(self.haptic_sender(session))
+    
+    async def haptic_sender(self, session):
+        """Send pending pulses to the page, at most once per coalescing interval
+        
+        The first command after a quiet period goes out at once; commands
+        arriving while waiting are merged into the next message.
+        """
+        channel = session.haptics
+        while True:
+            delay = channel.next_send_time() - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            msg = channel.take()
+            if msg is None:
+                return
+            await self.send_control(session.send, msg)
+    
+    async def clock_sync_loop(self, send, clock, burst=5, interval=2.0):
+        """Ping the page for clock sync: a quick burst, then periodically"""
+        count = 0
+        try:
+            while True:
+                await send(json.dumps(clock.make_ping()))
+                count += 1
+                await asyncio.sleep(0.2 if count < burst else interval)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+    
+    @traced('bridge.publish')
+    def publish_pending(self, session, pending):
+        """Publish frames taken from a session mailbox
+        
+        The combined message goes out once per batch, from the newest
+        controller frame (every frame carries the state of both hands).
+        """
+        node = self.ros_node
+        latest, latest_time = None, None
+        for index, frame, recv_time in pending:
+            if frame['kind'] == xr_protocol.KIND_HAND_JOINTS:
+                node.publish_joints(index, frame, session=session)
+            else:
+                if node.legacy_topics:
+                    node.publish_hand(index, frame, session=session)
+                if latest is None or recv_time > latest_time:
+                    latest, latest_time = frame, recv_time
+            self.telemetry.record('receive->publish', time.perf_counter() - recv_time)
+        if latest is not None and node.combined_topic:
+            node.publish_frame(latest, session=session)
+        session.published += len(pending)
+    
+    async def publish_loop(self, session):
+        """Poll mode: publish from the event loop whenever it is free"""
+        while True:
+            await session.frame_ready.wait()
+            session.frame_ready.clear()
+            self.publish_pending(session, session.mailbox.take())
+    
+    def publish_worker(self, session):
+        """Thread mode: block on the session mailbox and publish off the event loop"""
+        while not session.stop_event.is_set():
+            pending = session.mailbox.take(timeout=0.1)
+            if pending:
+                self.publish_pending(session, pending)
+    
+    async def report_loop(self, interval=5.0):
+        """Periodically log the per-stage latency distribution"""
+        while True:
+            await asyncio.sleep(interval)
+            self.ros_node.get_logger().info(self.telemetry.format())
+            if TRACER.enabled:
+                self.ros_node.get_logger().info(TRACER.format())
+            for session in list(self.sessions.values()):
+                s = session.stats()
+                self.ros_node.get_logger().info(
+                    f"  session {session.id} {s['namespace']}: {s['messages']} msgs, "
+                    f"{s['published']} published, queue peak {s['queue_peak']}, "
+                    f"backpressure {s['backpressure']}, coalesced {s['coalesced']}, dropped {s['dropped']}, "
+                    f"unchanged {s['unchanged']}, gaps {s['gaps']}, "
+                    f"haptic {s['haptic_sent']} sent / {s['haptic_coalesced']} coalesced / "
+                    f"{s['haptic_late']} late")
     
     async def start(self):
         """Start the WebSocket server"""
+        self.loop = asyncio.get_running_loop()
         self.ros_node.get_logger().info(f"Starting WebSocket server on ws://{self.host}:{self.port}")
         
         # Get local IP for display
@@ -141,26 +737,89 @@ class WebSocketServer:
 
 
 async def ros_spin(node):
-    """Async ROS spin"""
+    """Async ROS spin (legacy poll mode)"""
     while rclpy.ok():
         rclpy.spin_once(node, timeout_sec=0.01)
         await asyncio.sleep(0.01)
 
 
-async def main(host, port):
+def start_ros_threads(node, ws_server):
+    """Run the ROS executor on its own thread
+
+    The asyncio loop then only receives frames; each client session
+    publishes from its own thread, fed through its thread-safe mailbox.
+    """
+    executor = SingleThreadedExecutor()
+    executor.add_node(node)
+    thread = threading.Thread(target=executor.spin, name='ros_executor', daemon=True)
+    thread.start()
+    
+    def stop():
+        for session in list(ws_server.sessions.values()):
+            session.stop_event.set()
+            session.mailbox.close()
+        executor.shutdown()
+        thread.join(timeout=1.0)
+    
+    return stop
+
+
+async def main(host, port, spin_mode='thread', measure_latency=False, metrics_port=9091,
+               record_path=None, shm_name=None, webtransport_port=None, queue_size=DEFAULT_QUEUE_SIZE,
+               topics='legacy', qos=None, haptic_budget=haptics.HAPTIC_BUDGET, trace=False):
     """Main async entry point"""
     rclpy.init()
-    ros_node = WebXRROSBridge()
-    ws_server = WebSocketServer(ros_node, host, port)
+    ros_node = WebXRROSBridge(topics, qos)
+    if trace:
+        TRACER.enable()
+        ros_node.get_logger().info("Tracing the hot path (SIGUSR1 dumps a Chrome trace)")
+    install_signals(log=ros_node.get_logger().info)
+    if shm_name:
+        ros_node.shm_writer = shm_transport.SharedStateWriter(shm_name)
+        ros_node.get_logger().info(f"Sharing controller state in shared memory: {shm_name}")
+    recorder = None
+    if record_path:
+        recorder = SessionRecorder(record_path, metadata={'source': 'webxr_ros_bridge'})
+        ros_node.get_logger().info(f"Recording session to {record_path}")
+    ws_server = WebSocketServer(ros_node, host, port, recorder=recorder, spin_mode=spin_mode,
+                                queue_size=queue_size, haptic_budget=haptic_budget)
+    
+    tasks = [ws_server.start()]
+    if webtransport_port:
+        import xr_webtransport
+        if xr_webtransport.AIOQUIC_AVAILABLE:
+            wt_server = xr_webtransport.WebTransportServer(ws_server, host, webtransport_port)
+            tasks.append(wt_server.start())
+        else:
+            ros_node.get_logger().warn("aioquic not installed: WebTransport disabled (pip install aioquic)")
+    if metrics_port:
+        ros_node.get_logger().info(f"Metrics endpoint: http://127.0.0.1:{metrics_port}/metrics")
+        tasks.append(serve_metrics(ros_node.telemetry.snapshot, '127.0.0.1', metrics_port))
+    stop_ros_threads = None
+    if spin_mode == 'poll':
+        tasks.append(ros_spin(ros_node))
+    else:
+        stop_ros_threads = start_ros_threads(ros_node, ws_server)
+    if measure_latency:
+        ros_node.get_logger().info(f"Reporting latency every 5 s ({spin_mode} mode)")
+        tasks.append(ws_server.report_loop())
     
     try:
-        await asyncio.gather(
-            ws_server.start(),
-            ros_spin(ros_node)
-        )
+        await asyncio.gather(*tasks)
     except KeyboardInterrupt:
         pass
     finally:
+        if stop_ros_threads is not None:
+            stop_ros_threads()
+        if ros_node.shm_writer is not None:
+            ros_node.shm_writer.close()
+        if recorder is not None:
+            recorder.close()
+            print(f"Session saved to {record_path}: {recorder.stats()}")
+        if measure_latency:
+            print(f"Final latency ({spin_mode} mode): {ros_node.telemetry.format()}")
+        if TRACER.enabled:
+            print(f"Final trace: {TRACER.format()}")
         ros_node.destroy_node()
         rclpy.shutdown()
 
@@ -169,6 +828,32 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='WebXR to ROS Bridge')
     parser.add_argument('--host', default='0.0.0.0', help='Host to bind to')
     parser.add_argument('--port', type=int, default=9090, help='WebSocket port')
+    parser.add_argument('--spin-mode', choices=['thread', 'poll'], default='thread',
+                        help="'thread': ROS executor and publisher on their own threads; "
+                             "'poll': legacy spin_once/sleep in the event loop")
+    parser.add_argument('--measure-latency', action='store_true',
+                        help='Periodically log the per-stage latency distribution')
+    parser.add_argument('--metrics-port', type=int, default=9091,
+                        help='Local HTTP port serving latency metrics as JSON (0 disables)')
+    parser.add_argument('--record', metavar='PATH',
+                        help='Record received frames to a session log (see session_log.py)')
+    parser.add_argument('--shm', nargs='?', const=shm_transport.DEFAULT_NAME, metavar='NAME',
+                        help='Also share the latest controller state in shared memory '
+                             f'(default name: {shm_transport.DEFAULT_NAME})')
+    parser.add_argument('--webtransport', nargs='?', type=int, const=xr_protocol.WEBTRANSPORT_PORT,
+                        metavar='PORT',
+                        help='Also accept frames as WebTransport datagrams on this UDP port '
+                             f'(default: {xr_protocol.WEBTRANSPORT_PORT}; needs aioquic)')
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE,
+                        help='Messages a client may have waiting for decode before its reads pause')
+    parser.add_argument('--topics', choices=TOPIC_MODES, default='legacy',
+                        help="'legacy': per-hand pose/inputs topics; 'combined': one Joy per frame "
+                             f"with both hands on <namespace>/{xr_protocol.COMBINED_TOPIC}; 'both'")
+    parser.add_argument('--haptic-budget-ms', type=float, default=haptics.HAPTIC_BUDGET * 1e3,
+                        help='Haptic command->pulse budget; commands that would be later are dropped')
+    parser.add_argument('--trace', action='store_true',
+                        help='Time the hot path from startup (otherwise SIGUSR1 starts it, see tracing.py)')
+    add_qos_arguments(parser)
     args = parser.parse_args()
     
     print("""
@@ -182,4 +867,10 @@ if __name__ == "__main__":
 ╚═══════════════════════════════════════════════════════════╝
     """)
     
-    asyncio.run(main(args.host, args.port))
+    try:
+        asyncio.run(main(args.host, args.port, args.spin_mode, args.measure_latency,
+                         args.metrics_port, args.record, args.shm, args.webtransport, args.queue_size,
+                         args.topics, make_qos(args.qos, args.qos_depth), args.haptic_budget_ms / 1e3,
+                         args.trace))
+    except KeyboardInterrupt:
+        pass
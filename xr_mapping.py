@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+XR -> Robot Frame Mapping
+
+One place for the basis change between the OpenXR frame the headset
+reports in and the robot/sim frame:
+
+    OpenXR:  +X right, +Y up, -Z forward
+    Robot:   +X forward, +Y left, +Z up
+
+    robot = T @ xr,  T = [[0, 0, -1], [-1, 0, 0], [0, 1, 0]]
+
+T is a proper rotation, so an orientation maps as q_T * q_xr * q_T^-1,
+which for a quaternion is just T applied to its vector part. Everything
+(including an optional fixed tool rotation on the right, e.g. Isaac's 180
+degree flip about X) is precomputed once; mapping a pose is a few float
+operations, with no scipy Rotation objects or matrix round trips.
+
+Quaternions are (x, y, z, w) unless a function says otherwise.
+
+Usage:
+    python xr_mapping.py        # microbenchmark vs the scipy path
+"""
+
+import argparse
+import math
+import time
+
+import numpy as np
+
+
+XR_TO_ROBOT = np.array([[0, 0, -1], [-1, 0, 0], [0, 1, 0]], dtype=float)
+
+# 180 degrees about X (the Franka hand points down when the controller is level)
+FLIP_X_180 = np.array([1.0, 0.0, 0.0, 0.0])
+
+
+# ============================================================================
+# QUATERNION HELPERS (x, y, z, w)
+# ============================================================================
+# Single poses (the per-step path) take a plain-float branch: numpy
+# elementwise ops on 4-vectors cost more in call overhead than the math.
+def quat_multiply(a, b):
+    """Hamilton product a * b (broadcasts over leading axes)"""
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    if a.ndim == 1 and b.ndim == 1:
+        ax, ay, az, aw = a.tolist()
+        bx, by, bz, bw = b.tolist()
+        return np.array([
+            aw * bx + ax * bw + ay * bz - az * by,
+            aw * by - ax * bz + ay * bw + az * bx,
+            aw * bz + ax * by - ay * bx + az * bw,
+            aw * bw - ax * bx - ay * by - az * bz,
+        ])
+    # Batches: every product term in one matrix product (a few array ops,
+    # however many quaternions)
+    outer = a[..., :, None] * b[..., None, :]
+    return outer.reshape(outer.shape[:-2] + (16,)) @ _HAMILTON
+
+
+def _hamilton():
+    """(16, 4) table with vec(outer(a, b)) @ table = a * b"""
+    table = np.zeros((4, 4, 4))
+    x, y, z, w = range(4)
+    for k, terms in enumerate([
+        [(w, x, 1), (x, w, 1), (y, z, 1), (z, y, -1)],
+        [(w, y, 1), (x, z, -1), (y, w, 1), (z, x, 1)],
+        [(w, z, 1), (x, y, 1), (y, x, -1), (z, w, 1)],
+        [(w, w, 1), (x, x, -1), (y, y, -1), (z, z, -1)],
+    ]):
+        for i, j, sign in terms:
+            table[i, j, k] = sign
+    return table.reshape(16, 4)
+
+
+_HAMILTON = _hamilton()
+
+
+def vector_norm(v):
+    """Length along the last axis, kept as a size-1 axis (cheaper than np.linalg.norm on small arrays)"""
+    return np.sqrt(np.add.reduce(v * v, axis=-1, keepdims=True))
+
+
+def quat_conjugate(q):
+    q = np.asarray(q, dtype=float)
+    return np.concatenate([-q[..., :3], q[..., 3:]], axis=-1)
+
+
+def quat_to_rotvec(q):
+    """Rotation vector of the shortest rotation represented by q"""
+    q = np.asarray(q, dtype=float)
+    if q.ndim == 1:
+        x, y, z, w = q.tolist()
+        if w < 0:
+            x, y, z, w = -x, -y, -z, -w
+        s = math.sqrt(x * x + y * y + z * z)
+        scale = 2.0 * math.atan2(s, w) / s if s > 1e-9 else 2.0
+        return np.array([x * scale, y * scale, z * scale])
+    # Shortest rotation: the sign of w moves onto the scale. angle / s stays
+    # finite as s -> 0 and a zero vector part maps to zero, so no branches.
+    v = q[..., :3]
+    w = q[..., 3:]
+    s = vector_norm(v)
+    angle = 2.0 * np.arctan2(s, np.abs(w))
+    return v * np.copysign(angle / np.maximum(s, 1e-300), w)
+
+
+def rotvec_to_quat(r):
+    r = np.asarray(r, dtype=float)
+    if r.ndim == 1:
+        x, y, z = r.tolist()
+        angle = math.sqrt(x * x + y * y + z * z)
+        scale = math.sin(0.5 * angle) / angle if angle > 1e-9 else 0.5
+        return np.array([x * scale, y * scale, z * scale, math.cos(0.5 * angle)])
+    angle = vector_norm(r)
+    half = 0.5 * angle
+    # sin(half) / angle -> 0.5 as angle -> 0; a zero vector stays zero
+    return np.concatenate([r * (np.sin(half) / np.maximum(angle, 1e-300)), np.cos(half)], axis=-1)
+
+
+def quat_slerp(q0, q1, alpha):
+    """Shortest-path interpolation from q0 (alpha 0) to q1 (alpha 1)"""
+    rotvec = quat_to_rotvec(quat_multiply(q1, quat_conjugate(q0)))
+    alpha = np.asarray(alpha, dtype=float)
+    if alpha.ndim:
+        alpha = alpha[..., None]
+    return quat_multiply(rotvec_to_quat(rotvec * alpha), q0)
+
+
+def quat_from_matrix(m):
+    """(x, y, z, w) of a single rotation matrix (Shepperd's method)"""
+    m = np.asarray(m, dtype=float)
+    trace = m[0, 0] + m[1, 1] + m[2, 2]
+    if trace > 0:
+        s = 2.0 * math.sqrt(1.0 + trace)
+        q = [(m[2, 1] - m[1, 2]) / s, (m[0, 2] - m[2, 0]) / s, (m[1, 0] - m[0, 1]) / s, 0.25 * s]
+    elif m[0, 0] > m[1, 1] and m[0, 0] > m[2, 2]:
+        s = 2.0 * math.sqrt(1.0 + m[0, 0] - m[1, 1] - m[2, 2])
+        q = [0.25 * s, (m[0, 1] + m[1, 0]) / s, (m[0, 2] + m[2, 0]) / s, (m[2, 1] - m[1, 2]) / s]
+    elif m[1, 1] > m[2, 2]:
+        s = 2.0 * math.sqrt(1.0 + m[1, 1] - m[0, 0] - m[2, 2])
+        q = [(m[0, 1] + m[1, 0]) / s, 0.25 * s, (m[1, 2] + m[2, 1]) / s, (m[0, 2] - m[2, 0]) / s]
+    else:
+        s = 2.0 * math.sqrt(1.0 + m[2, 2] - m[0, 0] - m[1, 1])
+        q = [(m[0, 2] + m[2, 0]) / s, (m[1, 2] + m[2, 1]) / s, 0.25 * s, (m[1, 0] - m[0, 1]) / s]
+    q = np.array(q)
+    return q if q[3] >= 0 else -q
+
+
+# K = _QUAT_BASIS @ vec(R) + I is the 4x4 symmetric matrix (x, y, z, w order)
+# whose diagonal holds 4 q_i^2 and whose rows are proportional to q
+def _quat_basis():
+    terms = {
+        (0, 0): {(0, 0): 1, (1, 1): -1, (2, 2): -1},
+        (1, 1): {(0, 0): -1, (1, 1): 1, (2, 2): -1},
+        (2, 2): {(0, 0): -1, (1, 1): -1, (2, 2): 1},
+        (3, 3): {(0, 0): 1, (1, 1): 1, (2, 2): 1},
+        (0, 1): {(0, 1): 1, (1, 0): 1},
+        (0, 2): {(0, 2): 1, (2, 0): 1},
+        (0, 3): {(2, 1): 1, (1, 2): -1},
+        (1, 2): {(1, 2): 1, (2, 1): 1},
+        (1, 3): {(0, 2): 1, (2, 0): -1},
+        (2, 3): {(1, 0): 1, (0, 1): -1},
+    }
+    basis = np.zeros((9, 16))
+    for (i, j), coeffs in terms.items():
+        for (r, c), v in coeffs.items():
+            basis[3 * r + c, 4 * i + j] = basis[3 * r + c, 4 * j + i] = v
+    return basis
+
+
+_QUAT_BASIS = _quat_basis()
+_QUAT_BIAS = np.eye(4).ravel()
+
+
+def quats_from_matrices(m):
+    """(N, 4) (x, y, z, w) of a batch of (N, 3, 3) rotation matrices
+
+    Vectorized Shepperd's method in a handful of array ops: one matrix
+    product builds every branch, and the row with the largest pivot is
+    picked per matrix.
+    """
+    m = np.asarray(m, dtype=float).reshape(-1, 9)
+    k = (m @ _QUAT_BASIS + _QUAT_BIAS).reshape(-1, 4, 4)
+    rows = np.arange(len(k))
+    pivots = k.diagonal(axis1=1, axis2=2)
+    best = np.argmax(pivots, axis=1)
+    q = k[rows, best] / (2.0 * np.sqrt(np.maximum(pivots[rows, best], 1e-12)))[:, None]
+    return q * np.where(q[:, 3:] < 0, -1.0, 1.0)
+
+
+def to_wxyz(q):
+    """(x, y, z, w) -> (w, x, y, z), as MuJoCo and Isaac expect"""
+    q = np.asarray(q)
+    return np.concatenate([q[..., 3:], q[..., :3]], axis=-1)
+
+
+# ============================================================================
+# MAPPING
+# ============================================================================
+class XRToRobot:
+    """Precomputed XR -> robot pose mapping
+
+    position:    scale * (basis @ xr_pos) + offset
+    orientation: q_basis * xr_quat * q_basis^-1 * tool_rotation, done as
+                 basis @ vector part (same result, no quaternion products)
+    """
+
+    def __init__(self, basis=XR_TO_ROBOT, tool_rotation=None, scale=1.0, offset=(0.0, 0.0, 0.0)):
+        self.basis = np.asarray(basis, dtype=float)
+        if not np.allclose(self.basis @ self.basis.T, np.eye(3)) or np.linalg.det(self.basis) < 0:
+            raise ValueError("basis must be a proper rotation matrix")
+        self.tool_rotation = None if tool_rotation is None else np.asarray(tool_rotation, dtype=float)
+        self.scale = float(scale)
+        self.offset = np.asarray(offset, dtype=float)
+
+        # Plain-float copies for the scalar path
+        self._b = self.basis.tolist()
+        self._o = self.offset.tolist()
+        self._t = None if self.tool_rotation is None else self.tool_rotation.tolist()
+
+    def position(self, xr_pos):
+        """Map one XR position (3,) to the robot frame"""
+        x, y, z = xr_pos.tolist() if isinstance(xr_pos, np.ndarray) else xr_pos
+        (b00, b01, b02), (b10, b11, b12), (b20, b21, b22) = self._b
+        s, o = self.scale, self._o
+        return np.array([
+            s * (b00 * x + b01 * y + b02 * z) + o[0],
+            s * (b10 * x + b11 * y + b12 * z) + o[1],
+            s * (b20 * x + b21 * y + b22 * z) + o[2],
+        ])
+
+    def orientation(self, xr_quat):
+        """Map one XR orientation (x, y, z, w) to the robot frame"""
+        x, y, z, w = xr_quat.tolist() if isinstance(xr_quat, np.ndarray) else xr_quat
+        (b00, b01, b02), (b10, b11, b12), (b20, b21, b22) = self._b
+        # Conjugating by the basis rotation rotates the vector part
+        ax = b00 * x + b01 * y + b02 * z
+        ay = b10 * x + b11 * y + b12 * z
+        az = b20 * x + b21 * y + b22 * z
+        if self._t is None:
+            return np.array([ax, ay, az, w])
+        bx, by, bz, bw = self._t
+        return np.array([
+            w * bx + ax * bw + ay * bz - az * by,
+            w * by - ax * bz + ay * bw + az * bx,
+            w * bz + ax * by - ay * bx + az * bw,
+            w * bw - ax * bx - ay * by - az * bz,
+        ])
+
+    def map_pose(self, xr_pos, xr_quat):
+        """Scalar fast path for live callbacks -> (pos (3,), quat (4,))"""
+        return self.position(xr_pos), self.orientation(xr_quat)
+
+    def map_poses(self, poses):
+        """Batched path: (..., 7) XR poses [px py pz qx qy qz qw] -> robot poses"""
+        poses = np.asarray(poses, dtype=float)
+        out = np.empty(poses.shape)
+        out[..., :3] = self.scale * (poses[..., :3] @ self.basis.T) + self.offset
+        out[..., 3:6] = poses[..., 3:6] @ self.basis.T
+        out[..., 6] = poses[..., 6]
+        if self.tool_rotation is not None:
+            out[..., 3:] = quat_multiply(out[..., 3:], self.tool_rotation)
+        return out
+
+
+# ============================================================================
+# MICROBENCHMARK
+# ============================================================================
+def _scipy_map(xr_pos, xr_quat, flip):
+    """The per-message path the consumers used before this module"""
+    from scipy.spatial.transform import Rotation as R
+
+    T = XR_TO_ROBOT
+    pos = T @ np.asarray(xr_pos)
+    mat_robot = T @ R.from_quat(xr_quat).as_matrix() @ T.T
+    if flip:
+        mat_robot = mat_robot @ R.from_euler('x', 180, degrees=True).as_matrix()
+    return pos, R.from_matrix(mat_robot).as_quat()
+
+
+def run_benchmark(n=20000, batch=10000):
+    rng = np.random.default_rng(0)
+    poses = np.concatenate([rng.normal(size=(batch, 3)), rng.normal(size=(batch, 4))], axis=1)
+    poses[:, 3:] /= np.linalg.norm(poses[:, 3:], axis=1, keepdims=True)
+
+    for flip in (False, True):
+        mapping = XRToRobot(tool_rotation=FLIP_X_180 if flip else None)
+        name = 'isaac (with flip)' if flip else 'mujoco'
+
+        # Same result as the scipy path (up to quaternion sign)
+        for p in poses[:100]:
+            ref_pos, ref_quat = _scipy_map(p[:3], p[3:], flip)
+            pos, quat = mapping.map_pose(p[:3], p[3:])
+            assert np.allclose(pos, ref_pos) and abs(np.dot(quat, ref_quat)) > 1 - 1e-9
+        batched = mapping.map_poses(poses[:100])
+        assert np.allclose(batched[:, :3], [mapping.position(p[:3]) for p in poses[:100]])
+        assert np.allclose(np.abs(np.sum(batched[:, 3:] * [mapping.orientation(p[3:]) for p in poses[:100]], axis=1)), 1)
+
+        k = min(n, 2000)
+        t0 = time.perf_counter()
+        for p in poses[:k]:
+            _scipy_map(p[:3], p[3:], flip)
+        t_scipy = (time.perf_counter() - t0) / k
+
+        # Live callbacks hand over small numpy arrays
+        rows = [(p[:3].copy(), p[3:].copy()) for p in poses[:min(n, batch)]]
+        t0 = time.perf_counter()
+        for pos, quat in rows:
+            mapping.map_pose(pos, quat)
+        t_scalar = (time.perf_counter() - t0) / len(rows)
+
+        t0 = time.perf_counter()
+        mapping.map_poses(poses)
+        t_batch = (time.perf_counter() - t0) / batch
+
+        print(f"{name}:")
+        print(f"  scipy Rotation path  {t_scipy * 1e6:8.2f} us/pose")
+        print(f"  map_pose (scalar)    {t_scalar * 1e6:8.2f} us/pose  ({t_scipy / t_scalar:.0f}x)")
+        print(f"  map_poses (N={batch}) {t_batch * 1e6:8.3f} us/pose  ({t_scipy / t_batch:.0f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='XR -> robot mapping microbenchmark')
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+    run_benchmark(args.iterations)
@@ -0,0 +1,632 @@
+#!/usr/bin/env python3
+"""
+WebXR Controller Frame Protocol
+
+Wire format shared by webxr_streamer.html and webxr_ros_bridge.py.
+
+Frames arrive either as JSON text messages (legacy) or as fixed-layout
+binary messages. Both are decoded into the same NumPy record (FRAME_DTYPE)
+so the rest of the bridge never has to care which one the page sent.
+
+Binary layout (little-endian, 112 bytes):
+
+    offset  type        field
+    0       uint8       magic      (0x51, 'Q')
+    1       uint8       version    (1)
+    2       uint8       kind       (0 = controller frame)
+    3       uint8       flags      (bit 0/1: left/right present,
+                                    bit 2/3: left/right pose valid)
+    4       uint32      seq        (monotonic frame counter)
+    8       float64     timestamp  (XR frame time, ms)
+    16      float32[2][7] pose     (px, py, pz, qx, qy, qz, qw per hand)
+    72      float32[2][4] axes     (trigger, squeeze, stick x, stick y)
+    104     uint16[2]   buttons    (bit 0: A/X, 1: B/Y, 2: Menu, 3: Stick click)
+    108     uint16[2]   reserved
+
+Delta frames (kind 1) carry only what changed since the last frame the
+page sent; full frames double as keyframes (periodic, and on request):
+
+    offset  type        field
+    0-15                header as above, kind = 1
+    16      uint8       changed    (bits 0-2: left pose/axes/buttons,
+                                    bits 3-5: right pose/axes/buttons)
+    17      uint8[3]    reserved
+    20      float32[]   changed poses (7) and axes (4), left hand first
+    ...     uint16[]    changed buttons, left hand first
+
+A hand that appears sends all of its fields. Deltas carry absolute
+values, so a lost delta only leaves the fields it changed stale until
+the next keyframe; the bridge asks for one as soon as it sees a gap.
+
+Hand-joint frames (kind 2) carry the 25-joint WebXR hand skeleton of
+both hands, exactly as XRFrame.fillPoses writes it (3216 bytes):
+
+    offset  type        field
+    0-15                header as above, kind = 2 (flags: hand present /
+                        all joints tracked, same bits as controllers)
+    16      float32[2][25][16] joint poses, column-major 4x4 matrices
+                        in HAND_JOINTS order, left hand first
+
+They are too large for one datagram, so they always travel over the
+WebSocket.
+
+JSON text messages that carry a "type" field (e.g. the clock-sync "pong")
+are control messages; decode_message returns them as plain dicts.
+
+Usage:
+    python xr_protocol.py            # decode microbenchmark (JSON vs binary)
+"""
+
+import json
+import struct
+
+import numpy as np
+
+from xr_mapping import quats_from_matrices
+
+
+MAGIC = 0x51
+VERSION = 1
+
+KIND_CONTROLLERS = 0
+KIND_DELTA = 1
+KIND_HAND_JOINTS = 2
+
+HANDS = ('left', 'right')
+
+FLAG_PRESENT = (0x01, 0x02)
+FLAG_POSE_VALID = (0x04, 0x08)
+
+# Button bits, in the same order as Joy.buttons
+BUTTON_A_X = 0x01
+BUTTON_B_Y = 0x02
+BUTTON_MENU = 0x04
+BUTTON_STICK_CLICK = 0x08
+BUTTON_BITS = (BUTTON_A_X, BUTTON_B_Y, BUTTON_MENU, BUTTON_STICK_CLICK)
+BUTTON_NAMES = ('A/X', 'B/Y', 'Menu', 'Thumbstick click')  # Joy buttons[] order
+
+FRAME_DTYPE = np.dtype([
+    ('magic', 'u1'),
+    ('version', 'u1'),
+    ('kind', 'u1'),
+    ('flags', 'u1'),
+    ('seq', '<u4'),
+    ('timestamp', '<f8'),
+    ('pose', '<f4', (2, 7)),
+    ('axes', '<f4', (2, 4)),
+    ('buttons', '<u2', (2,)),
+    ('reserved', '<u2', (2,)),
+])
+FRAME_SIZE = FRAME_DTYPE.itemsize
+
+# Same layout as FRAME_DTYPE, for bulk conversion to Python values
+_FRAME_STRUCT = struct.Struct('<BBBBId14f8f2H2H')
+assert _FRAME_STRUCT.size == FRAME_SIZE
+
+# Delta frames: header, then the changed fields (see module docstring)
+_DELTA_HEADER = struct.Struct('<BBBBIdB3x')
+DELTA_HEADER_SIZE = _DELTA_HEADER.size
+assert DELTA_HEADER_SIZE == 20
+
+CHANGED_POSE = 0x1
+CHANGED_AXES = 0x2
+CHANGED_BUTTONS = 0x4
+CHANGED_BITS = 3  # per hand
+
+# Delta mode defaults, shared with webxr_streamer.html
+KEYFRAME_INTERVAL = 90   # frames between keyframes (~1 s at 90 Hz)
+POSE_DEADBAND = 0.0002   # m / quaternion component; smaller pose changes are not sent
+
+# UDP port of the WebTransport datagram listener (xr_webtransport.py). Kept
+# here so the bridge can name it without importing aioquic.
+WEBTRANSPORT_PORT = 4433
+
+# WebXR XRHand joint order (what iterating an XRHand yields)
+HAND_JOINTS = (
+    'wrist',
+    'thumb-metacarpal', 'thumb-phalanx-proximal', 'thumb-phalanx-distal', 'thumb-tip',
+) + tuple(f'{finger}-{joint}'
+          for finger in ('index-finger', 'middle-finger', 'ring-finger', 'pinky-finger')
+          for joint in ('metacarpal', 'phalanx-proximal', 'phalanx-intermediate',
+                        'phalanx-distal', 'tip'))
+N_JOINTS = len(HAND_JOINTS)
+assert N_JOINTS == 25
+
+JOINTS_DTYPE = np.dtype([
+    ('magic', 'u1'),
+    ('version', 'u1'),
+    ('kind', 'u1'),
+    ('flags', 'u1'),
+    ('seq', '<u4'),
+    ('timestamp', '<f8'),
+    ('matrices', '<f4', (2, N_JOINTS, 16)),
+])
+JOINTS_SIZE = JOINTS_DTYPE.itemsize
+
+# Identity quaternion used when a hand has no valid pose
+_IDENTITY_POSE = (0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 1.0)
+
+
+class ProtocolError(ValueError):
+    """Raised when a message cannot be decoded into a controller frame"""
+
+
+def new_frame():
+    """Return an empty, writable controller frame record"""
+    frame = np.zeros(1, dtype=FRAME_DTYPE)[0]
+    frame['magic'] = MAGIC
+    frame['version'] = VERSION
+    frame['kind'] = KIND_CONTROLLERS
+    frame['pose'][:] = _IDENTITY_POSE
+    return frame
+
+
+def decode_binary(message):
+    """Decode a binary frame with a single zero-copy frombuffer pass
+
+    Controller frames decode to FRAME_DTYPE, hand-joint frames to JOINTS_DTYPE.
+    """
+    # Header checks on the raw bytes are far cheaper than NumPy field access
+    header = bytes(message[:3])
+    if len(header) < 3:
+        raise ProtocolError(f"Expected {FRAME_SIZE} bytes, got {len(message)}")
+    if header[0] != MAGIC:
+        raise ProtocolError(f"Bad magic byte: 0x{header[0]:02x}")
+    if header[1] != VERSION:
+        raise ProtocolError(f"Unsupported protocol version: {header[1]}")
+    if header[2] == KIND_HAND_JOINTS:
+        return decode_joints(message)
+    if header[2] != KIND_CONTROLLERS:
+        raise ProtocolError(f"Unsupported frame kind: {header[2]}")
+    if len(message) != FRAME_SIZE:
+        raise ProtocolError(f"Expected {FRAME_SIZE} bytes, got {len(message)}")
+    return np.frombuffer(message, dtype=FRAME_DTYPE, count=1)[0]
+
+
+def decode_joints(message):
+    """Decode a hand-joint frame: one frombuffer view over all 50 matrices"""
+    if len(message) != JOINTS_SIZE:
+        raise ProtocolError(f"Expected {JOINTS_SIZE} bytes for hand joints, got {len(message)}")
+    return np.frombuffer(message, dtype=JOINTS_DTYPE, count=1)[0]
+
+
+def new_joints_frame():
+    """Empty, writable hand-joint frame (identity matrices)"""
+    frame = np.zeros(1, dtype=JOINTS_DTYPE)[0]
+    frame['magic'] = MAGIC
+    frame['version'] = VERSION
+    frame['kind'] = KIND_HAND_JOINTS
+    frame['matrices'][:] = np.eye(4, dtype=np.float32).ravel()
+    return frame
+
+
+def joint_poses(frame, index):
+    """(N_JOINTS, 7) px, py, pz, qx, qy, qz, qw of one hand, all joints at once"""
+    # Column-major: row c of the (4, 4) view is column c of the matrix
+    m = frame['matrices'][index].reshape(N_JOINTS, 4, 4)
+    poses = np.empty((N_JOINTS, 7))
+    poses[:, :3] = m[:, 3, :3]
+    poses[:, 3:] = quats_from_matrices(m[:, :3, :3].transpose(0, 2, 1))
+    return poses
+
+
+def frame_from_dict(data):
+    """Build a controller frame from the legacy JSON dict layout"""
+    frame = new_frame()
+    frame['seq'] = int(data.get('seq', 0))
+    frame['timestamp'] = float(data.get('timestamp') or 0.0)
+
+    controllers = data.get('controllers', {})
+    flags = 0
+    for i, hand in enumerate(HANDS):
+        ctrl = controllers.get(hand)
+        if not ctrl:
+            continue
+        flags |= FLAG_PRESENT[i]
+
+        position = ctrl.get('position')
+        orientation = ctrl.get('orientation')
+        if position and orientation:
+            flags |= FLAG_POSE_VALID[i]
+            frame['pose'][i] = (
+                position['x'], position['y'], position['z'],
+                orientation['x'], orientation['y'], orientation['z'], orientation['w'],
+            )
+
+        frame['axes'][i] = (
+            ctrl.get('trigger', 0.0),
+            ctrl.get('squeeze', 0.0),
+            ctrl.get('thumbstick_x', 0.0),
+            ctrl.get('thumbstick_y', 0.0),
+        )
+
+        buttons = 0
+        if ctrl.get('button_a_x'):
+            buttons |= BUTTON_A_X
+        if ctrl.get('button_b_y'):
+            buttons |= BUTTON_B_Y
+        if ctrl.get('thumbstick_click'):
+            buttons |= BUTTON_STICK_CLICK
+        frame['buttons'][i] = buttons
+
+    frame['flags'] = flags
+    return frame
+
+
+def frame_to_dict(frame):
+    """Inverse of frame_from_dict: the legacy JSON dict layout of a frame"""
+    flags, seq, timestamp, poses, axes, buttons = unpack_frame(frame)
+    controllers = {}
+    for i, hand in enumerate(HANDS):
+        if not flags & FLAG_PRESENT[i]:
+            continue
+        pose = poses[i] if flags & FLAG_POSE_VALID[i] else None
+        controllers[hand] = {
+            'position': dict(zip('xyz', pose[:3])) if pose else None,
+            'orientation': dict(zip('xyzw', pose[3:])) if pose else None,
+            'trigger': axes[i][0],
+            'squeeze': axes[i][1],
+            'thumbstick_click': bool(buttons[i] & BUTTON_STICK_CLICK),
+            'button_a_x': bool(buttons[i] & BUTTON_A_X),
+            'button_b_y': bool(buttons[i] & BUTTON_B_Y),
+            'thumbstick_x': axes[i][2],
+            'thumbstick_y': axes[i][3],
+        }
+    return {'timestamp': timestamp, 'seq': seq, 'controllers': controllers}
+
+
+def decode_json(message):
+    """Decode a legacy JSON text frame, or return a control message dict"""
+    try:
+        data = json.loads(message)
+    except json.JSONDecodeError as e:
+        raise ProtocolError(f"Invalid JSON: {e}") from e
+    if not isinstance(data, dict):
+        raise ProtocolError("JSON frame must be an object")
+    if 'type' in data:
+        return data
+    return frame_from_dict(data)
+
+
+def is_control(decoded):
+    """True if decode_message returned a control message rather than a frame"""
+    return isinstance(decoded, dict)
+
+
+def decode_message(message):
+    """Decode a WebSocket message, auto-detecting binary vs JSON
+
+    Returns a controller frame record, or a dict for control messages.
+    """
+    if is_binary(message):
+        return decode_binary(message)
+    return decode_json(message)
+
+
+def encode_frame(frame):
+    """Serialize a controller frame to its binary wire form"""
+    return frame.tobytes()
+
+
+def is_binary(message):
+    return isinstance(message, (bytes, bytearray, memoryview))
+
+
+def is_controller_frame(message):
+    """True for a raw controller frame (full, delta or legacy JSON), judged without decoding
+
+    These are superseded by the next one; control messages (JSON with a
+    "type" field) and hand-joint frames are not.
+    """
+    if is_binary(message):
+        return len(message) >= 3 and message[2] in (KIND_CONTROLLERS, KIND_DELTA)
+    return '"type"' not in message
+
+
+def hand_present(frame, index):
+    return bool(frame['flags'] & FLAG_PRESENT[index])
+
+
+def pose_valid(frame, index):
+    return bool(frame['flags'] & FLAG_POSE_VALID[index])
+
+
+def unpack_frame(frame):
+    """Convert a frame to plain Python values in one struct pass
+
+    Returns (flags, seq, timestamp, poses, axes, buttons), where poses,
+    axes and buttons are per-hand tuples indexed like HANDS.
+    """
+    v = _FRAME_STRUCT.unpack_from(frame)
+    return v[3], v[4], v[5], (v[6:13], v[13:20]), (v[20:24], v[24:28]), v[28:30]
+
+
+def unpack_buttons(bits):
+    """Expand a button bitfield into the Joy.buttons list"""
+    return [1 if bits & bit else 0 for bit in BUTTON_BITS]
+
+
+# ============================================================================
+# COMBINED DUAL-HAND MESSAGE
+# ============================================================================
+# Both hands of one frame in a single sensor_msgs/Joy on <namespace>/frame,
+# under one stamp (no tearing between hands, or between pose and inputs):
+#   axes    per hand: px, py, pz, qx, qy, qz, qw, trigger, squeeze, stick x, stick y
+#   buttons per hand: A/X, B/Y, Menu, stick click, present, pose valid
+# left hand first.
+COMBINED_TOPIC = 'frame'
+COMBINED_AXES = 11
+COMBINED_BUTTONS = 6
+
+
+def combined_fields(frame):
+    """(axes, buttons) lists of the combined message for a controller frame"""
+    flags, _, _, poses, axes, buttons = unpack_frame(frame)
+    out_axes, out_buttons = [], []
+    for i in range(len(HANDS)):
+        out_axes += poses[i] + axes[i]
+        out_buttons += unpack_buttons(buttons[i]) + [
+            1 if flags & FLAG_PRESENT[i] else 0, 1 if flags & FLAG_POSE_VALID[i] else 0]
+    return out_axes, out_buttons
+
+
+def combined_hand(axes, buttons, index):
+    """One hand out of a combined message: (present, pose or None, axes, buttons)
+
+    pose is (px, py, pz, qx, qy, qz, qw), axes (trigger, squeeze, stick x,
+    stick y) and buttons the Joy.buttons list of the per-hand topics.
+    """
+    a = axes[index * COMBINED_AXES:(index + 1) * COMBINED_AXES]
+    b = buttons[index * COMBINED_BUTTONS:(index + 1) * COMBINED_BUTTONS]
+    if len(a) < COMBINED_AXES or len(b) < COMBINED_BUTTONS:
+        raise ProtocolError(f"Combined message too short: {len(axes)} axes, {len(buttons)} buttons")
+    return bool(b[4]), (tuple(a[:7]) if b[5] else None), tuple(a[7:]), list(b[:4])
+
+
+# ============================================================================
+# DELTA STREAM
+# ============================================================================
+class DeltaEncoder:
+    """Sender side of delta mode (what webxr_streamer.html does)
+
+    encode() returns a full frame when a keyframe is due or was requested,
+    otherwise a delta of the fields that changed since the last send.
+    """
+
+    def __init__(self, keyframe_interval=KEYFRAME_INTERVAL, pose_deadband=POSE_DEADBAND):
+        self.keyframe_interval = keyframe_interval
+        self.pose_deadband = pose_deadband
+        self.sent = new_frame()
+        self.sent['flags'] = 0
+        self.since_keyframe = 0
+        self.keyframe_requested = True
+
+    def request_keyframe(self):
+        self.keyframe_requested = True
+
+    def encode(self, frame):
+        self.since_keyframe += 1
+        if self.keyframe_requested or self.since_keyframe >= self.keyframe_interval:
+            self.keyframe_requested = False
+            self.since_keyframe = 0
+            self.sent = frame.copy()
+            self.sent['kind'] = KIND_CONTROLLERS
+            return encode_frame(self.sent)
+
+        flags, sent_flags = int(frame['flags']), int(self.sent['flags'])
+        changed = 0
+        floats, buttons = [], []
+        for i in range(len(HANDS)):
+            if not flags & FLAG_PRESENT[i]:
+                continue
+            appeared = not sent_flags & FLAG_PRESENT[i]
+            bit = CHANGED_BITS * i
+            if flags & FLAG_POSE_VALID[i] and (
+                    appeared or not sent_flags & FLAG_POSE_VALID[i]
+                    or np.abs(frame['pose'][i] - self.sent['pose'][i]).max() > self.pose_deadband):
+                changed |= CHANGED_POSE << bit
+                self.sent['pose'][i] = frame['pose'][i]
+                floats.extend(frame['pose'][i].tolist())
+            if appeared or (frame['axes'][i] != self.sent['axes'][i]).any():
+                changed |= CHANGED_AXES << bit
+                self.sent['axes'][i] = frame['axes'][i]
+                floats.extend(frame['axes'][i].tolist())
+            if appeared or frame['buttons'][i] != self.sent['buttons'][i]:
+                changed |= CHANGED_BUTTONS << bit
+                self.sent['buttons'][i] = frame['buttons'][i]
+                buttons.append(int(frame['buttons'][i]))
+        self.sent['flags'] = flags
+
+        header = _DELTA_HEADER.pack(MAGIC, VERSION, KIND_DELTA, flags, int(frame['seq']),
+                                    float(frame['timestamp']), changed)
+        return header + struct.pack(f'<{len(floats)}f{len(buttons)}H', *floats, *buttons)
+
+
+class DeltaDecoder:
+    """Receiver side: rebuilds full frames from keyframes and deltas
+
+    decode() handles every binary message of one stream and returns
+    (frame, hands): the full frame (None when nothing needs publishing)
+    and the indices of the hands that changed. need_keyframe is set
+    while the state may be stale (no keyframe yet, or a sequence gap)
+    and cleared by the next keyframe.
+    """
+
+    def __init__(self):
+        self.frame = None
+        self.last_seq = None
+        self.need_keyframe = False
+
+        self.keyframes = 0
+        self.deltas = 0
+        self.unchanged = 0  # per hand update: present hand with nothing new
+        self.gaps = 0
+
+    def decode(self, message):
+        kind = message[2] if len(message) >= 3 else None
+        if kind == KIND_DELTA:
+            return self._apply_delta(message)
+        frame = decode_binary(message)
+        if kind == KIND_HAND_JOINTS:
+            return frame, tuple(i for i in range(len(HANDS)) if frame['flags'] & FLAG_PRESENT[i])
+        self.frame = frame
+        self.last_seq = int(frame['seq'])
+        self.need_keyframe = False
+        self.keyframes += 1
+        return frame, tuple(i for i in range(len(HANDS)) if frame['flags'] & FLAG_PRESENT[i])
+
+    def _apply_delta(self, message):
+        if len(message) < DELTA_HEADER_SIZE:
+            raise ProtocolError(f"Delta frame too short: {len(message)} bytes")
+        magic, version, _, flags, seq, timestamp, changed = _DELTA_HEADER.unpack_from(message)
+        if magic != MAGIC:
+            raise ProtocolError(f"Bad magic byte: 0x{magic:02x}")
+        if version != VERSION:
+            raise ProtocolError(f"Unsupported protocol version: {version}")
+        n_floats = sum(7 * bool(changed & (CHANGED_POSE << CHANGED_BITS * i)) +
+                       4 * bool(changed & (CHANGED_AXES << CHANGED_BITS * i)) for i in range(len(HANDS)))
+        n_buttons = sum(bool(changed & (CHANGED_BUTTONS << CHANGED_BITS * i)) for i in range(len(HANDS)))
+        size = DELTA_HEADER_SIZE + 4 * n_floats + 2 * n_buttons
+        if len(message) != size:
+            raise ProtocolError(f"Delta frame with changed=0x{changed:02x} should be {size} bytes, "
+                                f"got {len(message)}")
+        self.deltas += 1
+        if self.frame is None:
+            self.need_keyframe = True
+            return None, ()
+
+        expected = (self.last_seq + 1) & 0xFFFFFFFF
+        if seq != expected:
+            if 0 < (expected - seq) & 0xFFFFFFFF < 1 << 31:
+                return None, ()  # duplicate or reordered: already superseded
+            self.gaps += 1
+            self.need_keyframe = True
+        self.last_seq = seq
+
+        old_flags = int(self.frame['flags'])
+        hands = []
+        for i in range(len(HANDS)):
+            if flags & FLAG_PRESENT[i]:
+                if (changed >> CHANGED_BITS * i) & 0x7 or (flags ^ old_flags) & (
+                        FLAG_PRESENT[i] | FLAG_POSE_VALID[i]):
+                    hands.append(i)
+                else:
+                    self.unchanged += 1
+        if not hands and flags == old_flags:
+            return None, ()
+
+        frame = self.frame.copy()
+        frame['kind'] = KIND_CONTROLLERS
+        frame['flags'] = flags
+        frame['seq'] = seq
+        frame['timestamp'] = timestamp
+        values = struct.unpack_from(f'<{n_floats}f{n_buttons}H', message, DELTA_HEADER_SIZE)
+        k, b = 0, n_floats
+        for i in range(len(HANDS)):
+            bits = changed >> CHANGED_BITS * i
+            if bits & CHANGED_POSE:
+                frame['pose'][i] = values[k:k + 7]
+                k += 7
+            if bits & CHANGED_AXES:
+                frame['axes'][i] = values[k:k + 4]
+                k += 4
+        for i in range(len(HANDS)):
+            if (changed >> CHANGED_BITS * i) & CHANGED_BUTTONS:
+                frame['buttons'][i] = values[b]
+                b += 1
+        self.frame = frame
+        return frame, tuple(hands)
+
+    def stats(self):
+        return {
+            'keyframes': self.keyframes,
+            'deltas': self.deltas,
+            'unchanged': self.unchanged,
+            'gaps': self.gaps,
+        }
+
+
+# ============================================================================
+# MICROBENCHMARK
+# ============================================================================
+def _sample_dict(seq=1):
+    ctrl = {
+        'position': {'x': 0.12, 'y': 1.05, 'z': -0.33},
+        'orientation': {'x': 0.01, 'y': 0.7, 'z': -0.02, 'w': 0.71},
+        'trigger': 0.25, 'squeeze': 0.9,
+        'thumbstick_click': False, 'button_a_x': True, 'button_b_y': False,
+        'thumbstick_x': 0.1, 'thumbstick_y': -0.4,
+    }
+    return {'timestamp': 12345.678, 'seq': seq, 'controllers': {'left': ctrl, 'right': dict(ctrl)}}
+
+
+def _walk_json(message):
+    """Legacy bridge decode: json.loads followed by nested dict lookups"""
+    data = json.loads(message)
+    out = []
+    for hand in HANDS:
+        ctrl = data['controllers'].get(hand)
+        if not ctrl:
+            continue
+        out.append((
+            float(ctrl['position']['x']), float(ctrl['position']['y']), float(ctrl['position']['z']),
+            float(ctrl['orientation']['x']), float(ctrl['orientation']['y']),
+            float(ctrl['orientation']['z']), float(ctrl['orientation']['w']),
+            float(ctrl.get('trigger', 0.0)), float(ctrl.get('squeeze', 0.0)),
+            float(ctrl.get('thumbstick_x', 0.0)), float(ctrl.get('thumbstick_y', 0.0)),
+            int(ctrl.get('button_a_x', False)), int(ctrl.get('button_b_y', False)),
+            int(ctrl.get('thumbstick_click', False)),
+        ))
+    return out
+
+
+def _walk_binary(message):
+    """New bridge decode: one frombuffer pass and one struct unpack"""
+    flags, _, _, poses, axes, buttons = unpack_frame(decode_binary(message))
+    return [(poses[i], axes[i], buttons[i]) for i in range(2) if flags & FLAG_PRESENT[i]]
+
+
+def _sample_joints_dict(frame):
+    """Per-joint dict layout a JSON hand stream would use"""
+    return {'timestamp': 12345.678, 'hands': {
+        hand: {name: {'position': dict(zip('xyz', p[:3])), 'orientation': dict(zip('xyzw', p[3:]))}
+               for name, p in zip(HAND_JOINTS, joint_poses(frame, i).tolist())}
+        for i, hand in enumerate(HANDS)}}
+
+
+def _walk_joints_json(message):
+    data = json.loads(message)
+    return [[(j['position']['x'], j['position']['y'], j['position']['z'],
+              j['orientation']['x'], j['orientation']['y'], j['orientation']['z'], j['orientation']['w'])
+             for j in data['hands'][hand].values()] for hand in HANDS]
+
+
+def _walk_joints_binary(message):
+    frame = decode_joints(message)
+    return [joint_poses(frame, i).tolist() for i in range(len(HANDS))]
+
+
+def run_benchmark(iterations=100000):
+    import timeit
+
+    json_msg = json.dumps(_sample_dict())
+    bin_msg = encode_frame(frame_from_dict(_sample_dict()))
+
+    print(f"Payload size: JSON {len(json_msg)} bytes | binary {len(bin_msg)} bytes")
+    for name, fn, msg in (("json", _walk_json, json_msg), ("binary", _walk_binary, bin_msg)):
+        best = min(timeit.repeat(lambda: fn(msg), number=iterations, repeat=5))
+        print(f"  {name:<7} decode: {best / iterations * 1e6:6.2f} us/frame")
+
+    joints = new_joints_frame()
+    joints['flags'] = sum(FLAG_PRESENT) | sum(FLAG_POSE_VALID)
+    joints_bin = joints.tobytes()
+    joints_json = json.dumps(_sample_joints_dict(joints))
+    iterations //= 20
+    print(f"Hand joints (2 x {N_JOINTS}): JSON {len(joints_json)} bytes | binary {len(joints_bin)} bytes")
+    for name, fn, msg in (("json", _walk_joints_json, joints_json), ("binary", _walk_joints_binary, joints_bin)):
+        best = min(timeit.repeat(lambda: fn(msg), number=iterations, repeat=5))
+        print(f"  {name:<7} decode: {best / iterations * 1e6:6.2f} us/frame")
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+WebTransport Datagram Ingest
+
+Optional second ingest path next to the WebSocket server. Controller frames
+arrive as unreliable, unordered HTTP/3 datagrams, so a lost packet never
+holds back the poses behind it (no TCP head-of-line blocking); the frame
+mailbox already drops anything older than what it has.
+
+The WebSocket stays the control channel. On connect the bridge offers
+WebTransport to the page ({'type': 'webtransport', ...}); the page opens a
+session and moves its frames onto datagrams, falling back to the WebSocket
+if the session cannot be opened or closes. Clock-sync pings stay on the
+WebSocket. The offered path carries the page's bridge session id
+(/xr?session=s2), so its datagrams land in that client's session.
+
+Browsers only accept a self-signed certificate for WebTransport through
+`serverCertificateHashes`, which requires ECDSA P-256 and a validity of at
+most 14 days. A fresh certificate is generated at every start and its
+SHA-256 hash is sent with the offer.
+
+Requires aioquic (pip install aioquic); without it the bridge runs
+WebSocket-only.
+
+Usage:
+    python webxr_ros_bridge.py --webtransport            # UDP 4433
+    python synthetic_quest.py --webtransport --loss 0.05 # loopback client, 5% packet loss
+"""
+
+import asyncio
+import contextlib
+import datetime
+import functools
+import random
+import ssl
+import time
+from urllib.parse import parse_qs, urlparse
+
+from xr_protocol import WEBTRANSPORT_PORT
+
+try:
+    from aioquic.asyncio import QuicConnectionProtocol, connect, serve
+    from aioquic.h3.connection import H3_ALPN, H3Connection
+    from aioquic.h3.events import DatagramReceived, DataReceived, HeadersReceived
+    from aioquic.quic.configuration import QuicConfiguration
+    from aioquic.quic.events import ConnectionTerminated, ProtocolNegotiated
+    AIOQUIC_AVAILABLE = True
+except ImportError:
+    QuicConnectionProtocol = object
+    AIOQUIC_AVAILABLE = False
+
+
+DEFAULT_PORT = WEBTRANSPORT_PORT
+DEFAULT_PATH = '/xr'
+MAX_DATAGRAM_SIZE = 65536
+
+
+def make_certificate(hostnames=('localhost',), days=13):
+    """Self-signed ECDSA P-256 certificate usable with serverCertificateHashes
+
+    Returns (certificate, private_key, sha256 hex of the DER encoding).
+    """
+    import ipaddress
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'webxr-ros-bridge')])
+    alt_names = []
+    for host in hostnames:
+        try:
+            alt_names.append(x509.IPAddress(ipaddress.ip_address(host)))
+        except ValueError:
+            alt_names.append(x509.DNSName(host))
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5))
+        .not_valid_after(now + datetime.timedelta(days=days))
+        .add_extension(x509.SubjectAlternativeName(alt_names), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    cert_hash = cert.fingerprint(hashes.SHA256()).hex()
+    return cert, key, cert_hash
+
+
+# ============================================================================
+# SERVER
+# ============================================================================
+class _BridgeSessionProtocol(QuicConnectionProtocol):
+    """One QUIC connection; accepts a WebTransport session and ingests its datagrams"""
+
+    def __init__(self, *args, server=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._server = server
+        self._http = None
+        self._session_id = None
+        self._client = None
+
+    def quic_event_received(self, event):
+        if isinstance(event, ProtocolNegotiated) and event.alpn_protocol in H3_ALPN:
+            self._http = H3Connection(self._quic, enable_webtransport=True)
+        elif isinstance(event, ConnectionTerminated):
+            self._close_session()
+        if self._http is not None:
+            for h3_event in self._http.handle_event(event):
+                self._h3_event_received(h3_event)
+
+    def _h3_event_received(self, event):
+        if isinstance(event, DatagramReceived):
+            if event.stream_id == self._session_id:
+                data = event.data
+                # Frames are binary; JSON text (legacy encoding) starts with '{'
+                message = data.decode() if data[:1] == b'{' else data
+                self._server.ws_server.enqueue_nowait(self._client, message, time.time(), time.perf_counter())
+        elif isinstance(event, HeadersReceived):
+            headers = dict(event.headers)
+            client = None
+            if (headers.get(b':method') == b'CONNECT'
+                    and headers.get(b':protocol') == b'webtransport'
+                    and self._session_id is None):
+                client = self._server.client_session(headers.get(b':path', b'').decode())
+            if client is not None:
+                self._session_id = event.stream_id
+                self._client = client
+                self._http.send_headers(event.stream_id, [
+                    (b':status', b'200'),
+                    (b'sec-webtransport-http3-draft', b'draft02'),
+                ])
+                self._server.session_opened(self)
+            else:
+                self._http.send_headers(event.stream_id, [(b':status', b'404')], end_stream=True)
+            self.transmit()
+        elif isinstance(event, DataReceived):
+            if event.stream_id == self._session_id and event.stream_ended:
+                self._close_session()
+
+    def _close_session(self):
+        if self._session_id is not None:
+            self._session_id = None
+            self._server.session_closed(self)
+
+
+class WebTransportServer:
+    """Accepts WebTransport sessions and feeds their datagrams to a WebSocketServer"""
+
+    def __init__(self, ws_server, host='0.0.0.0', port=DEFAULT_PORT, path=DEFAULT_PATH,
+                 hostnames=('localhost',)):
+        if not AIOQUIC_AVAILABLE:
+            raise RuntimeError("WebTransport needs aioquic: pip install aioquic")
+        self.ws_server = ws_server
+        self.host = host
+        self.port = port
+        self.path = path
+        self.sessions = set()
+        self._logger = ws_server.ros_node.get_logger()
+
+        self.certificate, self.private_key, self.cert_hash = make_certificate(hostnames)
+        ws_server.webtransport_offer = {
+            'type': 'webtransport',
+            'port': port,
+            'path': path,
+            'cert_hash': self.cert_hash,
+        }
+
+    def client_session(self, path):
+        """Bridge client session a CONNECT path (/xr?session=s1) belongs to, or None
+
+        Without a session parameter the datagrams go to the only connected
+        client, if there is exactly one.
+        """
+        url = urlparse(path)
+        if url.path != self.path:
+            return None
+        sessions = self.ws_server.sessions
+        session_id = parse_qs(url.query).get('session', [None])[0]
+        if session_id is None:
+            return next(iter(sessions.values())) if len(sessions) == 1 else None
+        return sessions.get(session_id)
+
+    def session_opened(self, protocol):
+        self.sessions.add(protocol)
+        self._logger.info(f"WebTransport session opened ({len(self.sessions)} active)")
+
+    def session_closed(self, protocol):
+        self.sessions.discard(protocol)
+        self._logger.info(f"WebTransport session closed ({len(self.sessions)} active)")
+
+    async def start(self):
+        """Start the QUIC listener"""
+        configuration = QuicConfiguration(
+            alpn_protocols=H3_ALPN,
+            is_client=False,
+            max_datagram_frame_size=MAX_DATAGRAM_SIZE,
+        )
+        configuration.certificate = self.certificate
+        configuration.private_key = self.private_key
+
+        self._logger.info(f"Starting WebTransport server on https://{self.host}:{self.port}{self.path} (UDP)")
+        self._logger.info(f"WebTransport certificate SHA-256: {self.cert_hash}")
+        server = await serve(
+            self.host, self.port, configuration=configuration,
+            create_protocol=functools.partial(_BridgeSessionProtocol, server=self),
+        )
+        try:
+            await asyncio.Future()  # Run forever
+        finally:
+            server.close()
+
+
+# ============================================================================
+# LOOPBACK CLIENT (testing)
+# ============================================================================
+class _LossyTransport:
+    """Datagram transport wrapper that drops outgoing UDP packets at random"""
+
+    def __init__(self, transport, loss, rng):
+        self._transport = transport
+        self._loss = loss
+        self._rng = rng
+        self.sent = 0
+        self.dropped = 0
+
+    def sendto(self, data, addr=None):
+        self.sent += 1
+        if self._loss and self._rng.random() < self._loss:
+            self.dropped += 1
+            return
+        self._transport.sendto(data, addr)
+
+    def __getattr__(self, name):
+        return getattr(self._transport, name)
+
+
+class WebTransportClient(QuicConnectionProtocol):
+    """Minimal WebTransport client with UDP packet loss injected in both directions
+
+    Stands in for the browser in loopback tests. The loss applies to QUIC
+    packets, so the handshake and session setup see it too.
+    """
+
+    def __init__(self, *args, loss=0.0, seed=0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.loss = loss
+        self._rng = random.Random(seed)
+        self._http = None
+        self._session_id = None
+        self._session_ready = None
+        self.dropped_in = 0
+
+    def connection_made(self, transport):
+        super().connection_made(_LossyTransport(transport, self.loss, self._rng))
+
+    def datagram_received(self, data, addr):
+        if self.loss and self._rng.random() < self.loss:
+            self.dropped_in += 1
+            return
+        super().datagram_received(data, addr)
+
+    def quic_event_received(self, event):
+        if isinstance(event, ProtocolNegotiated):
+            self._http = H3Connection(self._quic, enable_webtransport=True)
+        if self._http is not None:
+            for h3_event in self._http.handle_event(event):
+                if isinstance(h3_event, HeadersReceived) and h3_event.stream_id == self._session_id:
+                    status = dict(h3_event.headers).get(b':status')
+                    if not self._session_ready.done():
+                        self._session_ready.set_result(status == b'200')
+
+    async def open_session(self, authority, path):
+        """Send the extended CONNECT and wait for the server to accept it"""
+        self._session_id = self._quic.get_next_available_stream_id()
+        self._session_ready = asyncio.get_running_loop().create_future()
+        self._http.send_headers(self._session_id, [
+            (b':method', b'CONNECT'),
+            (b':scheme', b'https'),
+            (b':authority', authority.encode()),
+            (b':path', path.encode()),
+            (b':protocol', b'webtransport'),
+            (b'sec-webtransport-http3-draft02', b'1'),
+        ])
+        self.transmit()
+        if not await self._session_ready:
+            raise ConnectionError(f"WebTransport session to {authority}{path} was rejected")
+
+    async def send(self, data):
+        """Send one datagram on the session (str is sent as UTF-8)"""
+        if isinstance(data, str):
+            data = data.encode()
+        self._http.send_datagram(self._session_id, data)
+        self.transmit()
+
+    def loss_stats(self):
+        out = self._transport
+        return {'packets_sent': out.sent, 'dropped_out': out.dropped, 'dropped_in': self.dropped_in}
+
+
+@contextlib.asynccontextmanager
+async def open_webtransport(host, port=DEFAULT_PORT, path=DEFAULT_PATH, loss=0.0, seed=0):
+    """Connect a WebTransportClient and open a session (certificate not verified)"""
+    if not AIOQUIC_AVAILABLE:
+        raise RuntimeError("WebTransport needs aioquic: pip install aioquic")
+    configuration = QuicConfiguration(
+        alpn_protocols=H3_ALPN,
+        is_client=True,
+        max_datagram_frame_size=MAX_DATAGRAM_SIZE,
+        verify_mode=ssl.CERT_NONE,
+    )
+    async with connect(host, port, configuration=configuration,
+                       create_protocol=functools.partial(WebTransportClient, loss=loss, seed=seed)) as client:
+        await client.open_session(f"{host}:{port}", path)
+        yield client